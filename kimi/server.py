@@ -1,6 +1,10 @@
 import os
+import time
+import asyncio
 import tempfile
+import threading
 import base64
+import numpy as np
 import uvicorn
 import soundfile as sf
 import torch
@@ -16,6 +20,21 @@ app = FastAPI(title="Kimi-Audio API Service")
 model = None
 model_loaded = False
 
+# 启动预热（一次静音音频推理）的结果，预热成功后才就绪
+warmup = {"ok": False, "message": "Warm-up not run"}
+
+# 最近一次真实推理的统计（仅供参考，不影响就绪状态：单个请求的错误输入不应使服务下线）
+inference_stats = {"last_inference_time": None, "last_latency_ms": None, "last_error": None}
+
+# 就绪检查配置（可通过环境变量覆盖）
+# DEEP_CHECK_INTERVAL: 深度检查（用静音音频真实推理）结果的缓存时间（秒）
+# DEEP_CHECK_TIMEOUT: 深度检查等待推理完成的超时时间（秒）
+DEEP_CHECK_INTERVAL = float(os.environ.get("KIMI_DEEP_CHECK_INTERVAL", "60"))
+DEEP_CHECK_TIMEOUT = float(os.environ.get("KIMI_DEEP_CHECK_TIMEOUT", "30"))
+
+# 模型不支持并发推理，/infer 与深度检查共用此锁
+inference_lock = threading.Lock()
+
 DEFAULT_SAMPLING_PARAMS = {
     "audio_temperature": 0.8,
     "audio_top_k": 10,
@@ -88,6 +107,89 @@ async def health_check():
         return PlainTextResponse("Model not loaded", status_code=503)
 
 
+@app.get("/livez")
+async def liveness_check():
+    """存活检查：进程能响应请求即可，不访问模型"""
+    return {"status": "alive"}
+
+
+def probe_inference():
+    """用 1 秒静音音频执行一次文本输出推理"""
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+        sf.write(tmp.name, np.zeros(16000, dtype=np.float32), 16000)
+        messages = [{"role": "user", "message_type": "audio", "content": tmp.name}]
+        with inference_lock:
+            model.generate(messages, **DEFAULT_SAMPLING_PARAMS, output_type="text")
+
+
+def warm_up():
+    """启动时执行一次真实推理作为预热，记录结果与耗时"""
+    global warmup
+    start = time.perf_counter()
+    try:
+        probe_inference()
+        warmup = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+        print(f"Model warm-up finished in {warmup['latency_ms']} ms")
+    except Exception as e:
+        warmup = {"ok": False, "message": f"Warm-up failed: {str(e)}"}
+        print(warmup["message"])
+warm_up()
+
+
+deep_check_lock = asyncio.Lock()
+deep_check_cache = {"checked_at": None, "result": None}
+
+
+async def run_deep_check() -> dict:
+    """执行一次真实推理；结果缓存 DEEP_CHECK_INTERVAL 秒，并发请求共享同一次检查"""
+    async with deep_check_lock:
+        checked_at = deep_check_cache["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < DEEP_CHECK_INTERVAL:
+            return deep_check_cache["result"]
+        
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(None, probe_inference),
+                                   DEEP_CHECK_TIMEOUT)
+            result = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "message": f"Inference timed out ({DEEP_CHECK_TIMEOUT} s)"}
+        except Exception as e:
+            result = {"ok": False, "message": f"Inference failed: {str(e)}"}
+        
+        deep_check_cache["checked_at"] = time.monotonic()
+        deep_check_cache["result"] = result
+        return result
+
+
+@app.get("/readyz")
+async def readiness_check(deep: bool = False):
+    """就绪检查：基于模型加载状态与启动预热；deep=true 时附加限频缓存的真实推理检查
+    
+    最近一次请求的推理结果只作为参考信息返回，不参与判断。
+    """
+    last_time = inference_stats["last_inference_time"]
+    last_inference = None
+    if last_time is not None:
+        last_inference = {
+            "timestamp": last_time,
+            "age_seconds": round(time.time() - last_time, 1),
+            "latency_ms": inference_stats["last_latency_ms"]
+        }
+    ready = model_loaded and model is not None and warmup["ok"]
+    status = {
+        "model_loaded": model_loaded,
+        "warmup": warmup,
+        "last_inference": last_inference,
+        "last_error": inference_stats["last_error"]
+    }
+    if ready and deep:
+        status["deep_check"] = await run_deep_check()
+        ready = status["deep_check"]["ok"]
+    status["status"] = "ready" if ready else "not_ready"
+    return JSONResponse(status, status_code=200 if ready else 503)
+
+
 @app.post("/infer")
 async def kimi_inference(request: InferenceRequest):
     """处理推理请求"""
@@ -122,13 +224,24 @@ async def kimi_inference(request: InferenceRequest):
         
         params = {**DEFAULT_SAMPLING_PARAMS, **(request.sampling_params or {})} 
         
-        # 执行推理
-        if request.output_type == "text":
-            _, text_output = model.generate(processed_messages, **params, output_type="text")
+        def generate():
+            with inference_lock:
+                output_type = "text" if request.output_type == "text" else "both"
+                return model.generate(processed_messages, **params, output_type=output_type)
+        
+        # 执行推理（在线程中等待推理锁，深度检查推理期间事件循环仍可响应 /livez 等请求）
+        start = time.perf_counter()
+        try:
+            wav_output, text_output = await asyncio.get_running_loop().run_in_executor(None, generate)
             audio_b64 = None
-        else:
-            wav_output, text_output = model.generate(processed_messages, **params, output_type="both")
-            
+        except Exception as e:
+            inference_stats["last_error"] = str(e)
+            raise
+        inference_stats["last_inference_time"] = time.time()
+        inference_stats["last_latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        inference_stats["last_error"] = None
+        
+        if request.output_type != "text":
             # 将生成的音频保存为Base64
             with tempfile.NamedTemporaryFile(suffix=".wav") as tmp_audio:
                 sf.write(tmp_audio.name, wav_output.detach().cpu().view(-1).numpy(), 24000)
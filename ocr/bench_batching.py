@@ -0,0 +1,95 @@
+import time
+import asyncio
+import argparse
+import cv2
+import numpy as np
+from paddleocr import PaddleOCR
+from ocr_batching import OCRBatchScheduler
+
+
+def build_engine(args):
+    return PaddleOCR(
+        text_detection_model_name="PP-OCRv5_server_det",
+        text_detection_model_dir=args.det_model_dir,
+        text_recognition_model_name="PP-OCRv5_server_rec",
+        text_recognition_model_dir=args.rec_model_dir,
+        use_doc_orientation_classify=False,
+        use_doc_unwarping=False,
+        use_textline_orientation=False,
+        device=args.device
+    )
+
+
+def det_group_stats(scheduler):
+    """调度器累计的检测组数与参与检测的图像数"""
+    return scheduler.stats["det_groups"], scheduler.stats["det_images"]
+
+
+async def run_level(infer, images, concurrency, total):
+    """concurrency 个客户端循环发送请求，直到共完成 total 个，返回 (吞吐 张/秒, 延迟毫秒列表)"""
+    counter = iter(range(total))
+    latencies = []
+
+    async def client():
+        for index in counter:
+            start = time.perf_counter()
+            await infer(images[index % len(images)])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start), latencies
+
+
+async def main(args):
+    engine = build_engine(args)
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in args.images]
+    for path, image in zip(args.images, images):
+        if image is None:
+            raise SystemExit(f"无法读取图像: {path}")
+
+    # 改动前的做法：每个请求在默认线程池中单独调用 ocr.ocr
+    async def per_request(image):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: engine.ocr(image))
+
+    scheduler = OCRBatchScheduler(engine, args.max_batch_images, args.max_wait_ms,
+                                  args.rec_batch_size, args.det_pad_multiple,
+                                  det_bucket_max_padding=args.det_bucket_max_padding)
+    scheduler.start()
+    modes = [("逐请求", per_request), ("跨请求批处理", scheduler.submit)]
+
+    # 预热两种路径
+    for _, infer in modes:
+        await asyncio.gather(*(infer(images[0]) for _ in range(2)))
+
+    # 检测组图数：跨请求批处理时平均每次检测前向推理合并的图像数（尺寸分桶的效果）
+    print(f"{'并发':>4}  {'方式':<12}{'吞吐(张/秒)':>12}{'p50':>10}{'p90':>10}{'p99':>10}{'检测组图数':>12}")
+    for concurrency in args.concurrency:
+        total = max(args.requests, concurrency * 2)
+        for name, infer in modes:
+            groups_before, images_before = det_group_stats(scheduler)
+            throughput, latencies = await run_level(infer, images, concurrency, total)
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            groups, det_images = (after - before for after, before in
+                                  zip(det_group_stats(scheduler), (groups_before, images_before)))
+            per_group = f"{det_images / groups:.2f}" if groups else "-"
+            print(f"{concurrency:>4}  {name:<12}{throughput:>12.2f}{p50:>8.0f}ms{p90:>8.0f}ms{p99:>8.0f}ms"
+                  f"{per_group:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比逐请求 OCR 与跨请求批处理在不同并发客户端数下的吞吐与延迟")
+    parser.add_argument("images", nargs="+", help="测试图像（按顺序循环使用）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=64, help="每个并发级别的请求数")
+    parser.add_argument("--device", default="gpu:0", help="推理设备")
+    parser.add_argument("--det-model-dir", default="/home/ocr_projects/official_models/PP-OCRv5_server_det")
+    parser.add_argument("--rec-model-dir", default="/home/ocr_projects/official_models/PP-OCRv5_server_rec")
+    parser.add_argument("--max-batch-images", type=int, default=8, help="每批最多合并的图像数")
+    parser.add_argument("--max-wait-ms", type=float, default=10, help="凑批最长等待时间（毫秒）")
+    parser.add_argument("--rec-batch-size", type=int, default=64, help="文本行识别批大小")
+    parser.add_argument("--det-pad-multiple", type=int, default=32, help="检测前补齐到的像素倍数")
+    parser.add_argument("--det-bucket-max-padding", type=float, default=1.5,
+                        help="不同尺寸图像合并检测时补齐后像素与原始像素之比的上限")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import logging
+import argparse
+import numpy as np
+from paddlex.inference.pipelines.ocr.result import OCRResult
+from ocr_results import serialize_lines, serialize_columnar
+
+logger = logging.getLogger("bench_results")
+
+
+def process_per_line(ocr_result):
+    """原有实现：递归遍历嵌套列表 [[框, (文本, 置信度)], ...]，逐行用 isinstance 判断并构造字典（作为对照）"""
+    processed = []
+    flattened = []
+
+    def flatten_list(lst):
+        for item in lst:
+            if isinstance(item, list) and len(item) > 0:
+                if isinstance(item[0], list) and isinstance(item[1], tuple) and len(item[1]) == 2:
+                    flattened.append(item)
+                else:
+                    flatten_list(item)
+
+    flatten_list(ocr_result)
+    for item in flattened:
+        dt_box = item[0]
+        rec_text, rec_score = item[1]
+        dt_box_list = [list(coord) if isinstance(coord, (list, tuple, np.ndarray)) else coord for coord in dt_box]
+        processed.append({"rec_texts": [rec_text], "rec_scores": [float(rec_score)], "dt_boxes": dt_box_list})
+    return processed
+
+
+def log_raw(result):
+    """原有实现：每个请求以 INFO 级别记录原始结果的类型与完整内容"""
+    logger.info(f"Raw OCR result type: {type(result)}")
+    logger.info(f"First result element type: {type(result[0])}")
+    logger.info(f"First result element content: {result[0]}")
+
+
+def make_page(count, width=2480, height=3508, seed=0):
+    """构造包含 count 个文本行的整页结果（A4 300dpi），返回 (OCRResult, 等价的嵌套列表)"""
+    rng = np.random.default_rng(seed)
+    x1 = rng.integers(0, width - 400, count)
+    y1 = rng.integers(0, height - 40, count)
+    x2 = x1 + rng.integers(40, 400, count)
+    y2 = y1 + rng.integers(20, 40, count)
+    polys = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                      np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1).astype(np.int16)
+    texts = ["".join(chr(0x4e00 + int(c)) for c in rng.integers(0, 2000, rng.integers(4, 30))) for _ in range(count)]
+    scores = rng.uniform(0.5, 1.0, count).tolist()
+    res = OCRResult({
+        "input_path": None, "page_index": None, "doc_preprocessor_res": {},
+        "dt_polys": list(polys), "rec_polys": list(polys), "rec_boxes": np.zeros((count, 4), np.int16),
+        "rec_texts": texts, "rec_scores": scores, "text_type": "general", "text_rec_score_thresh": 0.0,
+    })
+    nested = [[[poly.tolist(), (text, score)] for poly, text, score in zip(polys, texts, scores)]]
+    return res, nested
+
+
+def time_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比原有逐行结果处理（含原始结果日志）与直接转换的 list/columnar 格式在密集页面上的耗时与响应大小")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 3000, 5000], help="每页文本行数")
+    parser.add_argument("--iterations", type=int, default=20, help="每种情况的重复次数")
+    args = parser.parse_args()
+
+    # 日志写入空设备，只计格式化与写入开销
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    print(f"{'行数':>6}  {'方式':<22}{'转换':>10}{'JSON 编码':>12}{'合计':>10}{'响应大小':>12}")
+    for count in args.counts:
+        res, nested = make_page(count)
+        variants = [
+            ("原有(日志+逐行)", lambda: (log_raw([res]), process_per_line(nested))[1]),
+            ("原有(仅逐行)", lambda: process_per_line(nested)),
+            ("直接转换 list", lambda: serialize_lines([res])),
+            ("直接转换 columnar", lambda: serialize_columnar([res])),
+        ]
+        for name, convert in variants:
+            payload = convert()
+            encoded = json.dumps(payload, ensure_ascii=False)
+            convert_ms = time_call(convert, args.iterations)
+            encode_ms = time_call(lambda: json.dumps(payload, ensure_ascii=False), args.iterations)
+            print(f"{count:>6}  {name:<22}{convert_ms:>8.2f}ms{encode_ms:>10.2f}ms"
+                  f"{convert_ms + encode_ms:>8.2f}ms{len(encoded.encode('utf-8')) / 1024:>10.1f}KB")
@@ -3,6 +3,7 @@ import requests
 import argparse
 import json
 import time
+import mimetypes
 import os
 
 def image_to_base64(image_path: str) -> str:
@@ -21,23 +22,46 @@ def test_health(server_url: str):
         print(f"Health check failed: {str(e)}")
         return False
 
-def test_ocr(server_url: str, image_path: str):
-    """测试OCR端点"""
+def test_ocr(server_url: str, image_path: str, binary: bool = False, regions: str = None,
+             latency_budget_ms: float = None, result_format: str = None):
+    """测试OCR端点，binary 为 True 时以原始图像请求体上传
+    
+    regions 为文本区域的 JSON 字符串（给出时服务端跳过检测），latency_budget_ms 为检测耗时预算，
+    result_format 为结果格式（list 或 columnar）。
+    """
     try:
         # 检查文件是否存在
         if not os.path.exists(image_path):
             print(f"Error: File not found: {image_path}")
             return
             
-        # 转换图像为base64
-        base64_data = image_to_base64(image_path)
+        params = {}
+        if regions:
+            params["regions"] = regions
+        if latency_budget_ms is not None:
+            params["latency_budget_ms"] = latency_budget_ms
+        if result_format:
+            params["format"] = result_format
         
         # 发送请求
         start_time = time.time()
-        response = requests.post(
-            f"{server_url}/ocr",
-            json={"image_base64": base64_data}
-        )
+        if binary:
+            with open(image_path, "rb") as image_file:
+                image_bytes = image_file.read()
+            content_type = mimetypes.guess_type(image_path)[0] or "application/octet-stream"
+            response = requests.post(
+                f"{server_url}/ocr",
+                data=image_bytes,
+                params=params,
+                headers={"Content-Type": content_type}
+            )
+        else:
+            # 转换图像为base64
+            base64_data = image_to_base64(image_path)
+            response = requests.post(
+                f"{server_url}/ocr",
+                json={"image_base64": base64_data, **params}
+            )
         processing_time = time.time() - start_time
         
         # 处理响应
@@ -45,9 +69,17 @@ def test_ocr(server_url: str, image_path: str):
             result = response.json()
             print(f"OCR processed in {processing_time:.2f} seconds")
             print(f"Status: {result['status']}")
+            if "det_scale" in result:
+                print(f"Image downscaled to {result['det_scale']:.2f}x for detection")
             
             # 打印识别结果
-            if "result" in result and isinstance(result["result"], list):
+            if isinstance(result.get("result"), dict):
+                columns = result["result"]
+                for i, (text, score) in enumerate(zip(columns["texts"], columns["scores"])):
+                    print(f"Text {i+1}: {text} (confidence: {score:.4f})")
+                if not columns["texts"]:
+                    print("No text recognized in the image")
+            elif "result" in result and isinstance(result["result"], list):
                 for i, item in enumerate(result["result"]):
                     if "rec_texts" in item and item["rec_texts"]:
                         text = item["rec_texts"][0]
@@ -69,13 +101,69 @@ def test_ocr(server_url: str, image_path: str):
     except Exception as e:
         print(f"OCR request failed: {str(e)}")
 
+def test_document(server_url: str, document_path: str, dpi: float = None):
+    """测试多页文档 OCR 端点，按页打印流式返回的结果"""
+    if not os.path.exists(document_path):
+        print(f"Error: File not found: {document_path}")
+        return
+    
+    content_type = mimetypes.guess_type(document_path)[0] or "application/octet-stream"
+    params = {"dpi": dpi} if dpi else {}
+    start_time = time.time()
+    try:
+        with open(document_path, "rb") as document_file:
+            response = requests.post(
+                f"{server_url}/ocr_document",
+                data=document_file,
+                params=params,
+                headers={"Content-Type": content_type},
+                stream=True
+            )
+            if response.status_code != 200:
+                print(f"Error: {response.status_code}")
+                print(f"Response: {response.text}")
+                return
+            
+            pages = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if item.get("done"):
+                    print(f"\nDocument processed in {time.time() - start_time:.2f} seconds: "
+                          f"{item['pages']} pages, {item['failed']} failed")
+                    break
+                pages.append(item)
+                if "error" in item:
+                    print(f"Page {item['page_index'] + 1}: error: {item['error']}")
+                else:
+                    print(f"Page {item['page_index'] + 1}: {len(item['result'])} text lines "
+                          f"({time.time() - start_time:.2f} s)")
+        
+        with open("ocr_document_result.json", "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False, indent=2)
+        print("Full result saved to ocr_document_result.json")
+    except Exception as e:
+        print(f"Document OCR request failed: {str(e)}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="PaddleOCR API Client")
     parser.add_argument("--server", default="http://localhost:8000", help="Server URL")
-    parser.add_argument("--image", required=True, help="Path to image file")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--image", help="Path to image file")
+    source.add_argument("--document", help="Path to a multi-page PDF or TIFF document")
+    parser.add_argument("--binary", action="store_true", help="Upload raw image bytes instead of base64 JSON")
+    parser.add_argument("--dpi", type=float, help="Rasterization DPI for PDF documents")
+    parser.add_argument("--regions", help='Text regions as JSON to skip detection, e.g. "[[10, 20, 300, 60]]"')
+    parser.add_argument("--format", choices=["list", "columnar"], help="OCR result format")
+    parser.add_argument("--latency-budget-ms", type=float, help="Detection latency budget; oversized images are downscaled")
     args = parser.parse_args()
     
     # 先检查服务健康状态
     if test_health(args.server):
-        print("\nService is healthy, sending OCR request...")
-        test_ocr(args.server, args.image)
\ No newline at end of file
+        if args.document:
+            print("\nService is healthy, sending document OCR request...")
+            test_document(args.server, args.document, args.dpi)
+        else:
+            print("\nService is healthy, sending OCR request...")
+            test_ocr(args.server, args.image, args.binary, args.regions, args.latency_budget_ms, args.format)
\ No newline at end of file
@@ -0,0 +1,255 @@
+import math
+import atexit
+import signal
+import logging
+import functools
+import itertools
+import threading
+import contextlib
+import multiprocessing
+import concurrent.futures
+import numpy as np
+import cv2
+import pypdfium2 as pdfium
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 支持的多页文档类型（按文件头识别）
+DOCUMENT_KINDS = ("pdf", "tiff")
+
+# 栅格化进程内缓存的已打开 PDF（同一文档的相邻页通常由同一进程连续渲染）；
+# 空闲 PDF_IDLE_CLOSE_SECONDS 秒后关闭，请求结束删除临时文件后进程不再持有该文件
+PDF_IDLE_CLOSE_SECONDS = 5
+_open_pdf = {"path": None, "document": None, "timer": None}
+# pdfium 不是线程安全的，渲染与空闲关闭互斥
+_open_pdf_lock = threading.Lock()
+
+
+def detect_kind(header: bytes):
+    """按文件头判断文档类型，无法识别时返回 None"""
+    if header.startswith(b"%PDF"):
+        return "pdf"
+    if header[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "tiff"
+    return None
+
+
+def _close_pdf(timer=None):
+    """关闭缓存的 PDF；由空闲计时器调用时，只在该计时器仍是最新的一个时关闭"""
+    with _open_pdf_lock:
+        if timer is not None and _open_pdf["timer"] is not timer:
+            return
+        if _open_pdf["document"] is not None:
+            _open_pdf["document"].close()
+        _open_pdf["path"], _open_pdf["document"], _open_pdf["timer"] = None, None, None
+
+
+@contextlib.contextmanager
+def _pdf_document(path: str):
+    """持有锁使用缓存的 PDF，用完后重新开始空闲计时"""
+    with _open_pdf_lock:
+        if _open_pdf["timer"] is not None:
+            _open_pdf["timer"].cancel()
+            _open_pdf["timer"] = None
+        if _open_pdf["path"] != path:
+            if _open_pdf["document"] is not None:
+                _open_pdf["document"].close()
+            _open_pdf["path"], _open_pdf["document"] = None, None
+            _open_pdf["document"] = pdfium.PdfDocument(path)
+            _open_pdf["path"] = path
+        try:
+            yield _open_pdf["document"]
+        finally:
+            timer = threading.Timer(PDF_IDLE_CLOSE_SECONDS, lambda: _close_pdf(timer))
+            timer.daemon = True
+            _open_pdf["timer"] = timer
+            timer.start()
+
+
+def page_count(path: str, kind: str) -> int:
+    """返回文档页数（在栅格化进程中执行）"""
+    if kind == "pdf":
+        with _pdf_document(path) as document:
+            return len(document)
+    with Image.open(path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def render_page(path: str, kind: str, index: int, dpi: float, max_pixels: int) -> np.ndarray:
+    """将文档的第 index 页栅格化为 BGR 图像（在栅格化进程中执行）
+
+    页面按 dpi 渲染，像素数超过 max_pixels 时按比例降低分辨率，单页内存占用有上限。
+    """
+    if kind == "pdf":
+        with _pdf_document(path) as document:
+            page = document[index]
+            try:
+                width, height = page.get_size()
+                scale = dpi / 72
+                if width * height * scale * scale > max_pixels:
+                    scale = math.sqrt(max_pixels / (width * height))
+                # pdfium 默认输出 BGR 字节序，与 OpenCV 一致
+                return page.render(scale=scale).to_numpy().copy()
+            finally:
+                page.close()
+
+    with Image.open(path) as image:
+        image.seek(index)
+        frame = np.asarray(image.convert("RGB"))
+    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    height, width = frame.shape[:2]
+    if width * height > max_pixels:
+        scale = math.sqrt(max_pixels / (width * height))
+        frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def _create_executor(workers: int, conn):
+    # 栅格化进程不持有与主进程之间的管道，监督进程退出时主进程才能收到 EOF
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+        initializer=conn.close)
+    # fork 方式在首次提交时一次性启动全部进程
+    executor.submit(int).result()
+    return executor
+
+
+def _reply(conn, send_lock, request_id, executor, broken, future):
+    """将栅格化结果发回主进程（在进程池的结果线程中执行）"""
+    try:
+        message = (request_id, True, future.result())
+    except concurrent.futures.process.BrokenProcessPool as e:
+        broken["executor"] = executor
+        message = (request_id, False, e)
+    except Exception as e:
+        message = (request_id, False, e)
+    with send_lock:
+        try:
+            conn.send(message)
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            # 结果或异常无法序列化
+            conn.send((request_id, False, RuntimeError(f"Unpicklable raster result: {str(e)}")))
+
+
+def _supervise(conn, parent_conn, workers: int):
+    """栅格化监督进程：持有 fork 进程池，进程池损坏时在本进程内重建（主进程已加载推理引擎，不能再 fork）"""
+    parent_conn.close()
+    # Ctrl-C 由主进程处理，主进程退出时管道关闭，本进程随之退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    send_lock = threading.Lock()
+    broken = {"executor": None}
+    executor = _create_executor(workers, conn)
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        request_id, func, args = message
+        # 同一次损坏只重建一次（并发调用的结果回调都会标记同一个进程池）
+        if broken["executor"] is executor:
+            logger.warning("Raster worker died, recreating raster pool")
+            executor.shutdown(wait=False)
+            executor = _create_executor(workers, conn)
+        try:
+            future = executor.submit(func, *args)
+        except concurrent.futures.process.BrokenProcessPool:
+            logger.warning("Raster worker died, recreating raster pool")
+            executor.shutdown(wait=False)
+            executor = _create_executor(workers, conn)
+            future = executor.submit(func, *args)
+        future.add_done_callback(functools.partial(_reply, conn, send_lock, request_id, executor, broken))
+    # 等待栅格化进程退出（本进程随后以 os._exit 结束，不会再执行进程池的退出清理）
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _resolve(future, ok: bool, value):
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+class RasterPool:
+    """栅格化进程池：pdfium 不是线程安全的，页面在独立进程中并行渲染
+
+    创建时 fork 一个监督进程，由它 fork 并持有全部栅格化进程；调用方应在加载推理引擎之前创建，
+    使这些进程不继承推理线程与设备上下文。栅格化进程意外退出导致进程池损坏时由监督进程重建，
+    主进程（已加载推理引擎）不再 fork。监督进程本身退出后所有调用失败。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        context = multiprocessing.get_context("fork")
+        self.conn, child_conn = context.Pipe()
+        # 监督进程需要创建子进程，不能设为 daemon；主进程退出时由 close 通知其退出
+        self.process = context.Process(target=_supervise, args=(child_conn, self.conn, self.workers),
+                                       name="raster-supervisor")
+        self.process.start()
+        child_conn.close()
+        if self.conn.recv() != "ready":
+            raise RuntimeError("Raster supervisor failed to start")
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        # 请求编号 -> (事件循环, Future)
+        self.pending = {}
+        self.running = True
+        self.reader = threading.Thread(target=self._read_loop, name="raster-reader", daemon=True)
+        self.reader.start()
+        atexit.register(self.close)
+
+    def _read_loop(self):
+        while True:
+            try:
+                request_id, ok, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                entry = self.pending.pop(request_id, None)
+            if entry is not None:
+                loop, future = entry
+                loop.call_soon_threadsafe(_resolve, future, ok, value)
+        with self.lock:
+            self.running = False
+            pending, self.pending = list(self.pending.values()), {}
+        if pending:
+            logger.error(f"Raster supervisor exited, failing {len(pending)} pending calls")
+        for loop, future in pending:
+            loop.call_soon_threadsafe(_resolve, future, False, RuntimeError("Raster supervisor exited"))
+
+    async def run(self, loop, func, *args):
+        """在栅格化进程中执行 func(*args)"""
+        future = loop.create_future()
+        with self.lock:
+            if not self.running:
+                raise RuntimeError("Raster supervisor is not running")
+            request_id = next(self.ids)
+            self.pending[request_id] = (loop, future)
+            try:
+                self.conn.send((request_id, func, args))
+            except Exception:
+                del self.pending[request_id]
+                raise
+        return await future
+
+    def close(self):
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            try:
+                self.conn.send(None)
+            except (EOFError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
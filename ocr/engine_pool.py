@@ -0,0 +1,183 @@
+import time
+import asyncio
+import logging
+from ocr_batching import OCRBatchScheduler, OCRRequest
+
+logger = logging.getLogger(__name__)
+
+# 健康监控的检查间隔（秒）
+MONITOR_INTERVAL = 1.0
+# 实例创建失败后重试的最长间隔（秒）
+MAX_RETRY_DELAY = 60.0
+
+
+class EngineUnavailable(RuntimeError):
+    """没有可用的引擎实例，或请求所在的实例推理卡死被替换"""
+
+
+class EngineInstance:
+    """池中的一个 OCR 引擎实例：引擎、批调度器与健康状态"""
+
+    def __init__(self, index, device, cpu_threads):
+        self.index = index
+        self.device = device
+        self.cpu_threads = cpu_threads
+        self.engine = None
+        self.scheduler = None
+        # starting（创建中）/ ready（可派发）/ replacing（替换中）/ failed（创建失败，等待重试）
+        self.state = "starting"
+        self.warmup_ms = None
+        self.restarts = 0
+        self.failed_attempts = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == "ready" and self.scheduler.alive
+
+    def stats(self) -> dict:
+        scheduler = self.scheduler
+        return {
+            "index": self.index,
+            "device": self.device,
+            "cpu_threads": self.cpu_threads,
+            "state": self.state,
+            "healthy": self.healthy,
+            "load": scheduler.load if scheduler is not None and self.state == "ready" else None,
+            "busy_seconds": (round(time.monotonic() - scheduler.busy_since, 1)
+                             if scheduler is not None and scheduler.busy_since is not None else None),
+            "warmup_ms": self.warmup_ms,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "batches": dict(scheduler.stats) if scheduler is not None else None
+        }
+
+
+class EnginePool:
+    """多实例 OCR 引擎池：按负载最小派发，监控各实例健康并替换卡死或持续失败的实例
+
+    factory(device, cpu_threads) 创建并预热一个 PaddleOCR 引擎，返回 (引擎, 预热耗时毫秒)，失败时抛出异常。
+    每个实例有独立的批调度器与推理线程，实例之间并行推理。
+    实例单批推理超过 wedge_timeout 秒或连续 max_failures 批失败时被替换：卡死批次中的请求以
+    EngineUnavailable 失败，排队中的请求转交其他实例。卡死的推理线程无法中断，其占用的显存/内存
+    在线程结束前不会释放。
+    """
+
+    def __init__(self, factory, specs, scheduler_options, wedge_timeout, max_failures):
+        self.factory = factory
+        self.instances = [EngineInstance(index, device, cpu_threads)
+                          for index, (device, cpu_threads) in enumerate(specs)]
+        self.scheduler_options = scheduler_options
+        self.wedge_timeout = wedge_timeout
+        self.max_failures = max(1, max_failures)
+        self.monitor_task = None
+
+    def build(self):
+        """创建并预热所有实例（启动时调用，阻塞）；全部失败时抛出 RuntimeError"""
+        for instance in self.instances:
+            try:
+                self._build_instance(instance)
+            except Exception as e:
+                self._mark_failed(instance, f"Initialization failed: {str(e)}")
+        if not any(instance.engine is not None for instance in self.instances):
+            raise RuntimeError("PaddleOCR initialization failed")
+
+    def start(self):
+        """在事件循环中启动各实例的调度器与健康监控"""
+        for instance in self.instances:
+            if instance.scheduler is not None:
+                instance.scheduler.start()
+                instance.state = "ready"
+        self.monitor_task = asyncio.get_running_loop().create_task(self._monitor())
+
+    def _build_instance(self, instance):
+        logger.info(f"Creating OCR engine {instance.index} on {instance.device}"
+                    f"{f' ({instance.cpu_threads} threads)' if instance.cpu_threads else ''}")
+        engine, warmup_ms = self.factory(instance.device, instance.cpu_threads)
+        instance.engine = engine
+        instance.warmup_ms = warmup_ms
+        instance.scheduler = OCRBatchScheduler(engine, **self.scheduler_options)
+
+    def _mark_failed(self, instance, reason):
+        instance.state = "failed"
+        instance.engine = None
+        instance.scheduler = None
+        instance.last_error = reason
+        instance.retry_at = time.monotonic() + min(MAX_RETRY_DELAY, 2.0 ** instance.failed_attempts)
+        instance.failed_attempts += 1
+        logger.error(f"OCR engine {instance.index} ({instance.device}): {reason}")
+
+    @property
+    def healthy_count(self) -> int:
+        return sum(1 for instance in self.instances if instance.healthy)
+
+    def stats(self) -> list:
+        return [instance.stats() for instance in self.instances]
+
+    def _pick(self):
+        healthy = [instance for instance in self.instances if instance.healthy]
+        if not healthy:
+            raise EngineUnavailable("No healthy OCR engine instance")
+        return min(healthy, key=lambda instance: instance.scheduler.load)
+
+    async def submit(self, image, regions=None, latency_budget_ms=None):
+        """派发到负载最小的健康实例并等待 OCR 结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._pick().scheduler.enqueue(OCRRequest(image, regions, latency_budget_ms), future)
+        return await future
+
+    def _redispatch(self, items):
+        """将被替换实例中排队的请求转交其他健康实例"""
+        for request, future in items:
+            if future.done():
+                continue
+            try:
+                self._pick().scheduler.enqueue(request, future)
+            except EngineUnavailable as e:
+                future.set_exception(e)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL)
+            now = time.monotonic()
+            for instance in self.instances:
+                if instance.state == "ready":
+                    scheduler = instance.scheduler
+                    if scheduler.busy_since is not None and now - scheduler.busy_since > self.wedge_timeout:
+                        self._replace(instance, f"Batch running for more than {self.wedge_timeout} s")
+                    elif scheduler.consecutive_failures >= self.max_failures:
+                        self._replace(instance, f"{scheduler.consecutive_failures} consecutive failed batches")
+                    elif not scheduler.alive:
+                        self._replace(instance, "Scheduler stopped")
+                elif instance.state == "failed" and now >= instance.retry_at:
+                    self._replace(instance, instance.last_error)
+
+    def _replace(self, instance, reason):
+        """停用实例并在后台创建新引擎替换它"""
+        logger.warning(f"Replacing OCR engine {instance.index} ({instance.device}): {reason}")
+        old = instance.scheduler
+        instance.state = "replacing"
+        instance.last_error = reason
+        if old is not None:
+            running = old.running
+            old.close()
+            for future in running:
+                if not future.done():
+                    future.set_exception(EngineUnavailable(f"OCR engine {instance.index} was replaced: {reason}"))
+            self._redispatch(old.drain())
+        instance.engine = None
+        instance.scheduler = None
+        asyncio.get_running_loop().create_task(self._rebuild(instance))
+
+    async def _rebuild(self, instance):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._build_instance, instance)
+        except Exception as e:
+            self._mark_failed(instance, f"Replacement failed: {str(e)}")
+            return
+        instance.scheduler.start()
+        instance.state = "ready"
+        instance.restarts += 1
+        instance.failed_attempts = 0
+        logger.info(f"OCR engine {instance.index} ({instance.device}) replaced")
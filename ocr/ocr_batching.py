@@ -0,0 +1,414 @@
+import time
+import asyncio
+import logging
+import collections
+import concurrent.futures
+import numpy as np
+import cv2
+from paddlex.inference.pipelines.components import convert_points_to_boxes, rotate_image
+from paddlex.inference.pipelines.ocr.result import OCRResult
+
+logger = logging.getLogger(__name__)
+
+# 一张待识别的图像：regions 为调用方给出的文本区域（(N, 4, 2) 四边形，给出时跳过检测），
+# latency_budget_ms 为检测耗时预算（给出时按预算缩小过大的图像后再检测）
+OCRRequest = collections.namedtuple("OCRRequest", ["image", "regions", "latency_budget_ms"])
+OCRRequest.__new__.__defaults__ = (None, None)
+
+# 检测耗时估计（毫秒/百万像素）的指数滑动平均系数
+DET_COST_SMOOTHING = 0.2
+
+
+def pad_to_multiple(img: np.ndarray, multiple: int) -> np.ndarray:
+    """在右侧与下方补零，使图像宽高为 multiple 的整数倍（原图内的坐标不变）"""
+    if multiple <= 1:
+        return img
+    height, width = img.shape[:2]
+    pad_bottom, pad_right = -height % multiple, -width % multiple
+    if not pad_bottom and not pad_right:
+        return img
+    return cv2.copyMakeBorder(img, 0, pad_bottom, 0, pad_right, cv2.BORDER_CONSTANT, value=0)
+
+
+def pad_to_shape(img: np.ndarray, height: int, width: int) -> np.ndarray:
+    """在右侧与下方补零到 height x width 的画布（原图内的坐标不变）"""
+    pad_bottom, pad_right = height - img.shape[0], width - img.shape[1]
+    if not pad_bottom and not pad_right:
+        return img
+    return cv2.copyMakeBorder(img, 0, pad_bottom, 0, pad_right, cv2.BORDER_CONSTANT, value=0)
+
+
+def bucket_by_canvas(sizes: list, max_padding: float) -> list:
+    """将 (高, 宽) 列表分组：同组图像补齐到组内最大宽高后一次检测，每组补齐后的像素总数
+    不超过组内原始像素总数的 max_padding 倍；返回 [((画布高, 画布宽), [索引, ...]), ...]"""
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+    # 每组为 [画布高, 画布宽, 原始像素总数, 索引列表]，从大图开始，小图尽量并入已有画布
+    buckets = []
+    for index in order:
+        height, width = sizes[index]
+        for bucket in buckets:
+            canvas_height, canvas_width = max(bucket[0], height), max(bucket[1], width)
+            pixels = bucket[2] + height * width
+            if canvas_height * canvas_width * (len(bucket[3]) + 1) <= max_padding * pixels:
+                bucket[0], bucket[1], bucket[2] = canvas_height, canvas_width, pixels
+                bucket[3].append(index)
+                break
+        else:
+            buckets.append([height, width, height * width, [index]])
+    return [((canvas_height, canvas_width), sorted(indices)) for canvas_height, canvas_width, _, indices in buckets]
+
+
+class OCRBatchScheduler:
+    """跨请求 OCR 批调度器
+
+    在 max_wait_ms 内收集并发请求的图像（最多 max_batch_images 张）合并处理：
+    - 文本检测按尺寸分桶：同组图像在右侧与下方补零到组内最大宽高后一次前向推理（检测模型要求同批输入
+      尺寸一致），补齐的像素总数不超过原始像素的 det_bucket_max_padding 倍
+    - 所有图像裁出的文本行按宽高比排序后合并，以 rec_batch_size 为批大小识别
+    - 结果按图像拆分，返回与 engine.ocr(image) 相同结构的结果
+    - 请求给出文本区域时跳过文档预处理与检测，直接裁剪、矫正并与其他请求的文本行合并识别
+    - 请求给出检测耗时预算时，按实测的检测耗时估计将过大的图像缩小后检测，文本框映射回原图坐标，
+      识别仍在原图上裁剪（缩放不低于 downscale_min_side 短边）；这些图像的检测尺寸由预算决定，
+      不再受配置的 limit_side_len/max_side_limit 影响
+    推理在专用的单线程执行器中进行，同一引擎不会被并发调用；推理期间到达的请求在队列中凑下一批。
+    batching 为 False 时每次只处理一张图像，直接调用 engine.ocr（与改动前的单图推理一致）。
+    """
+
+    def __init__(self, engine, max_batch_images: int = 8, max_wait_ms: float = 10,
+                 rec_batch_size: int = 64, det_pad_multiple: int = 32, batching: bool = True,
+                 downscale_min_side: int = 640, det_bucket_max_padding: float = 1.5):
+        self.engine = engine
+        # PaddleOCR 对象的 paddlex_pipeline（单设备时）将属性访问转发到内部的 OCR 产线
+        self.pipeline = engine.paddlex_pipeline
+        self.batching = batching
+        self.max_batch_images = max(1, max_batch_images) if batching else 1
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.rec_batch_size = max(1, rec_batch_size)
+        # 多边形框（印章文本）无法简单裁回原图范围，只对四边形框补齐
+        self.det_pad_multiple = det_pad_multiple if self.pipeline.text_type == "general" else 0
+        # 同理，多边形框只合并尺寸完全相同的图像
+        self.det_bucket_max_padding = (max(1.0, det_bucket_max_padding) if self.pipeline.text_type == "general"
+                                       else 1.0)
+        self.downscale_min_side = max(1, downscale_min_side)
+        # 实测的检测耗时（毫秒/百万像素），首个给出预算的检测组完成前为 None，此时不按预算缩放
+        self.det_ms_per_mpx = None
+        self.queue = asyncio.Queue()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-batch")
+        self.task = None
+        # 正在推理的批次：开始时间（time.monotonic()）与其中请求的 Future，用于判断推理是否卡死
+        self.busy_since = None
+        self.running = []
+        # 连续失败的批次数（判断引擎是否损坏），成功一批后清零；
+        # 单个请求的失败无法与输入错误区分，不计入
+        self.consecutive_failures = 0
+        # 最近一批的统计，用于健康检查
+        self.stats = {"batches": 0, "images": 0, "text_lines": 0,
+                      "last_batch_images": 0, "last_batch_text_lines": 0, "last_latency_ms": None,
+                      "region_images": 0, "downscaled_images": 0,
+                      "det_groups": 0, "det_images": 0, "last_det_group_sizes": []}
+
+    def start(self):
+        """在事件循环中启动调度协程"""
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def alive(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    @property
+    def load(self) -> int:
+        """排队与正在推理的图像数"""
+        return self.queue.qsize() + len(self.running)
+
+    async def submit(self, image: np.ndarray, regions: np.ndarray = None, latency_budget_ms: float = None) -> list:
+        """提交一张图像并等待其 OCR 结果"""
+        future = asyncio.get_running_loop().create_future()
+        self.enqueue(OCRRequest(image, regions, latency_budget_ms), future)
+        return await future
+
+    def enqueue(self, request: OCRRequest, future: asyncio.Future):
+        """将请求与接收结果的 Future 放入队列（在事件循环中调用）"""
+        self.queue.put_nowait((request, future))
+
+    def drain(self) -> list:
+        """取出队列中尚未处理的全部请求"""
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return items
+
+    def close(self):
+        """停止调度协程；正在推理的批次所在线程无法中断，执行器不等待其结束"""
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def _collect(self) -> list:
+        """等待第一张图像，之后在最大等待时间内凑满一批"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_images:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 跳过等待期间已被取消的请求（客户端断开）
+            batch = [item for item in await self._collect() if not item[1].done()]
+            if not batch:
+                continue
+            self.busy_since = time.monotonic()
+            self.running = [future for _, future in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict, [request for request, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.error(f"OCR request failed: {str(e)}")
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    continue
+                logger.warning(f"OCR batch failed ({len(batch)} images), retrying one at a time: {str(e)}")
+                await self._run_isolated(loop, batch)
+                continue
+            finally:
+                self.busy_since = None
+                self.running = []
+            self.consecutive_failures = 0
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result([result])
+
+    async def _run_isolated(self, loop, batch: list):
+        """整批失败后逐个重试，只让仍然失败的请求失败；全部失败时才视为引擎故障计入连续失败批数"""
+        failed = succeeded = 0
+        for request, future in batch:
+            if future.done():
+                continue
+            # 剩余未完成的请求都算作正在推理，实例被替换时一并失败
+            self.busy_since = time.monotonic()
+            self.running = [pending for _, pending in batch if not pending.done()]
+            try:
+                result = (await loop.run_in_executor(self.executor, self.predict, [request]))[0]
+            except Exception as e:
+                failed += 1
+                logger.error(f"OCR request failed: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            succeeded += 1
+            if not future.done():
+                future.set_result([result])
+        if succeeded:
+            self.consecutive_failures = 0
+        elif failed > 1:
+            self.consecutive_failures += 1
+
+    def predict(self, requests: list) -> list:
+        """对一批请求执行批量检测与合并识别，返回每张图像的 OCRResult"""
+        if not self.batching and all(request.regions is None and not request.latency_budget_ms
+                                     for request in requests):
+            return [self.engine.ocr(request.image)[0] for request in requests]
+        start = time.perf_counter()
+        pipeline = self.pipeline
+        model_settings = pipeline.get_model_settings(None, None, None)
+        text_det_params = pipeline.get_text_det_params()
+
+        images = [request.image for request in requests]
+        doc_preprocessor_results = [{"output_img": image} for image in images]
+        dt_polys_list = [request.regions for request in requests]
+        det_scales = [1.0] * len(requests)
+        det_params_list = [text_det_params] * len(requests)
+        # 给出文本区域的图像跳过文档预处理（区域坐标基于原图）与检测
+        detect = [index for index, request in enumerate(requests) if request.regions is None]
+        if detect:
+            detect_images = [images[index] for index in detect]
+            if model_settings["use_doc_preprocessor"]:
+                for index, item in zip(detect, pipeline.doc_preprocessor_pipeline(detect_images)):
+                    doc_preprocessor_results[index] = item
+                    images[index] = item["output_img"]
+            detected, scales, det_params = self._detect([images[index] for index in detect],
+                                                        [requests[index].latency_budget_ms for index in detect],
+                                                        text_det_params)
+            for index, dt_polys, scale, params in zip(detect, detected, scales, det_params):
+                dt_polys_list[index] = dt_polys
+                det_scales[index] = scale
+                det_params_list[index] = params
+
+        results = [
+            {
+                "input_path": None,
+                "page_index": None,
+                "doc_preprocessor_res": doc_preprocessor_res,
+                "dt_polys": dt_polys,
+                "model_settings": model_settings,
+                "text_det_params": det_params,
+                "text_type": pipeline.text_type,
+                "text_rec_score_thresh": pipeline.text_rec_score_thresh,
+                "return_word_box": False,
+                "rec_texts": [],
+                "rec_scores": [],
+                "rec_polys": [],
+                "vis_fonts": [],
+            }
+            for doc_preprocessor_res, dt_polys, det_params in zip(doc_preprocessor_results, dt_polys_list,
+                                                                  det_params_list)
+        ]
+        for res, scale in zip(results, det_scales):
+            res["det_scale"] = scale
+        text_lines = self._recognize(images, dt_polys_list, results, model_settings["use_textline_orientation"])
+
+        for res in results:
+            res["rec_boxes"] = (convert_points_to_boxes(res["rec_polys"]) if pipeline.text_type == "general"
+                                else np.array([]))
+
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.stats["batches"] += 1
+        self.stats["images"] += len(images)
+        self.stats["text_lines"] += text_lines
+        self.stats["last_batch_images"] = len(images)
+        self.stats["last_batch_text_lines"] = text_lines
+        self.stats["last_latency_ms"] = latency_ms
+        self.stats["region_images"] += len(requests) - len(detect)
+        self.stats["downscaled_images"] += sum(1 for scale in det_scales if scale < 1.0)
+        logger.info(f"OCR batch: {len(images)} images ({len(requests) - len(detect)} with regions), "
+                    f"{text_lines} text lines, {latency_ms} ms")
+        return [OCRResult(res) for res in results]
+
+    def _budget_scale(self, image: np.ndarray, latency_budget_ms: float) -> float:
+        """按检测耗时预算计算图像的缩放比例（不放大，短边不低于 downscale_min_side）"""
+        if not latency_budget_ms or self.det_ms_per_mpx is None:
+            return 1.0
+        height, width = image.shape[:2]
+        megapixels = height * width / 1e6
+        if self.det_ms_per_mpx * megapixels <= latency_budget_ms:
+            return 1.0
+        scale = (latency_budget_ms / (self.det_ms_per_mpx * megapixels)) ** 0.5
+        return min(1.0, max(scale, self.downscale_min_side / min(height, width)))
+
+    def _budget_det_params(self, text_det_params: dict, canvas_height: int, canvas_width: int) -> tuple:
+        """给出耗时预算的图像按缩放后的尺寸原样检测：以画布长边覆盖配置的 limit_side_len、limit_type 与
+        max_side_limit（否则检测模型会按配置再次缩放，预算与耗时估计都不准）；尚无耗时估计时仍以
+        配置的 max_side_limit 为上限。返回 (检测参数, 实际检测的像素数)"""
+        side = max(canvas_height, canvas_width)
+        if self.det_ms_per_mpx is None and text_det_params.get("max_side_limit"):
+            side = min(side, text_det_params["max_side_limit"])
+        ratio = side / max(canvas_height, canvas_width)
+        params = {**text_det_params, "limit_type": "max", "limit_side_len": side, "max_side_limit": side}
+        return params, canvas_height * canvas_width * ratio * ratio
+
+    def _detect(self, images: list, latency_budgets: list, text_det_params: dict) -> tuple:
+        """按尺寸分桶批量检测，返回每张图像排好序的文本框（原图坐标）、检测时的缩放比例与检测参数
+
+        给出耗时预算的图像与其他图像分开分组：前者按缩放后的尺寸原样检测，并用实测耗时更新耗时估计；
+        后者沿用配置的检测参数（检测模型内部可能再缩放，实际检测的像素数未知，不用于耗时估计）。
+        """
+        scales = [self._budget_scale(image, budget) for image, budget in zip(images, latency_budgets)]
+        det_images = [
+            image if scale >= 1.0 else cv2.resize(
+                image, (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale))),
+                interpolation=cv2.INTER_AREA)
+            for image, scale in zip(images, scales)
+        ]
+        padded = [pad_to_multiple(image, self.det_pad_multiple) for image in det_images]
+        groups = []
+        for budgeted in (False, True):
+            members = [index for index, budget in enumerate(latency_budgets) if bool(budget) == budgeted]
+            for canvas_shape, positions in bucket_by_canvas([padded[index].shape[:2] for index in members],
+                                                            self.det_bucket_max_padding):
+                groups.append((budgeted, canvas_shape, [members[position] for position in positions]))
+
+        dt_polys_list = [None] * len(images)
+        det_params = [text_det_params] * len(images)
+        for budgeted, (canvas_height, canvas_width), indices in groups:
+            canvas = [pad_to_shape(padded[index], canvas_height, canvas_width) for index in indices]
+            params = text_det_params
+            if budgeted:
+                params, det_pixels = self._budget_det_params(text_det_params, canvas_height, canvas_width)
+            group_start = time.perf_counter()
+            det_results = list(self.pipeline.text_det_model(canvas, batch_size=len(indices), **params))
+            if budgeted:
+                self._update_det_cost(len(indices) * det_pixels, (time.perf_counter() - group_start) * 1000)
+            for index, image, det_result in zip(indices, canvas, det_results):
+                det_params[index] = params
+                dt_polys = det_result["dt_polys"]
+                if image is not det_images[index] and len(dt_polys):
+                    # 补齐区域内没有文本，只需将贴边的框裁回检测图像范围
+                    height, width = det_images[index].shape[:2]
+                    dt_polys = np.clip(np.asarray(dt_polys), 0, [width - 1, height - 1])
+                if scales[index] < 1.0 and len(dt_polys):
+                    # 映射回原图坐标，识别在原图上裁剪，不损失文字清晰度
+                    height, width = images[index].shape[:2]
+                    dt_polys = np.asarray(dt_polys)
+                    dt_polys = np.clip(dt_polys / scales[index], 0, [width - 1, height - 1]).astype(dt_polys.dtype)
+                dt_polys_list[index] = self.pipeline._sort_boxes(dt_polys)
+        self.stats["det_groups"] += len(groups)
+        self.stats["det_images"] += len(images)
+        self.stats["last_det_group_sizes"] = [len(indices) for _, _, indices in groups]
+        return dt_polys_list, scales, det_params
+
+    def _update_det_cost(self, pixels: int, elapsed_ms: float):
+        """用一组检测的实测耗时更新每百万像素耗时的滑动平均"""
+        ms_per_mpx = elapsed_ms / max(pixels / 1e6, 1e-6)
+        if self.det_ms_per_mpx is None:
+            self.det_ms_per_mpx = ms_per_mpx
+        else:
+            self.det_ms_per_mpx += DET_COST_SMOOTHING * (ms_per_mpx - self.det_ms_per_mpx)
+
+    def _recognize(self, images: list, dt_polys_list: list, results: list, use_textline_orientation: bool) -> int:
+        """裁出所有图像的文本行，合并为大批量识别后按图像写回 results，返回文本行数"""
+        pipeline = self.pipeline
+        sub_images = []
+        owners = []
+        for index, (image, dt_polys) in enumerate(zip(images, dt_polys_list)):
+            if len(dt_polys) == 0:
+                continue
+            kept_polys = []
+            for sub_image, poly in zip(pipeline._crop_by_polys(image, dt_polys), dt_polys):
+                if sub_image.size > 0 and sub_image.shape[0] > 0 and sub_image.shape[1] > 0:
+                    sub_images.append(sub_image)
+                    owners.append((index, poly))
+                    kept_polys.append(poly)
+            dt_polys_list[index] = kept_polys
+            results[index]["dt_polys"] = kept_polys
+        for res in results:
+            res["textline_orientation_angles"] = []
+        if not sub_images:
+            return 0
+
+        if use_textline_orientation:
+            angles = [
+                int(np.asarray(info["class_ids"], dtype=np.int64).ravel()[0])
+                for info in pipeline.textline_orientation_model(sub_images, batch_size=self.rec_batch_size)
+            ]
+            sub_images = [rotate_image(sub_image, angle * 180) for sub_image, angle in zip(sub_images, angles)]
+        else:
+            angles = [-1] * len(sub_images)
+        for (index, _), angle in zip(owners, angles):
+            results[index]["textline_orientation_angles"].append(angle)
+
+        # 按宽高比排序后识别，同批文本行的补齐宽度接近，减少无效计算
+        order = sorted(range(len(sub_images)), key=lambda i: sub_images[i].shape[1] / float(sub_images[i].shape[0]))
+        rec_results = [None] * len(sub_images)
+        for position, rec_res in enumerate(
+                pipeline.text_rec_model([sub_images[i] for i in order], batch_size=self.rec_batch_size)):
+            rec_results[order[position]] = rec_res
+
+        # 按原始顺序（各图像内从上到下，或调用方给出区域的顺序）写回，与单图推理的输出顺序一致
+        for (index, poly), rec_res in zip(owners, rec_results):
+            if rec_res["rec_score"] >= pipeline.text_rec_score_thresh:
+                res = results[index]
+                res["rec_texts"].append(rec_res["rec_text"])
+                res["rec_scores"].append(rec_res["rec_score"])
+                res["vis_fonts"].append(rec_res["vis_font"])
+                res["rec_polys"].append(poly)
+        return len(sub_images)
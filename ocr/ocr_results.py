@@ -0,0 +1,56 @@
+import numpy as np
+import cv2
+
+# OCR 结果的输出格式：list 为每个文本行一个字典，columnar 为按字段排列的并列数组
+OCR_RESULT_FORMATS = ("list", "columnar")
+
+# columnar 格式中每个文本框的顶点数（boxes 为展平的 [x1, y1, ..., x4, y4] * N）
+BOX_POINTS = 4
+
+
+def result_arrays(res):
+    """一次性取出单张图像结果（OCRResult）的文本、置信度与 (N, 4, 2) 文本框数组"""
+    texts = list(res["rec_texts"])
+    scores = np.asarray(res["rec_scores"], dtype=np.float64).reshape(-1)
+    polys = res["rec_polys"]
+    if len(polys) == 0:
+        return texts, scores, np.zeros((0, BOX_POINTS, 2), np.int32)
+    try:
+        boxes = np.asarray(polys, dtype=np.int32).reshape(len(polys), BOX_POINTS, 2)
+    except ValueError:
+        # 印章等多边形文本框顶点数不一，取最小外接矩形的四个顶点
+        boxes = np.array([cv2.boxPoints(cv2.minAreaRect(np.asarray(poly, dtype=np.float32))) for poly in polys])
+        boxes = np.round(boxes).astype(np.int32)
+    return texts, scores, boxes
+
+
+def serialize_lines(results):
+    """转换为每个文本行一个字典的列表（与原有 /ocr 响应结构一致）"""
+    lines = []
+    for res in results:
+        texts, scores, boxes = result_arrays(res)
+        lines.extend({
+            "rec_texts": [text],
+            "rec_scores": [score],
+            "dt_boxes": box
+        } for text, score, box in zip(texts, scores.tolist(), boxes.tolist()))
+    return lines
+
+
+def serialize_columnar(results):
+    """转换为按字段排列的并列数组：第 i 个文本行对应 texts/scores 的第 i 项，
+    boxes 为展平的文本框顶点坐标，第 i 个文本框为 boxes[i * 8:(i + 1) * 8]"""
+    texts, scores, boxes = [], [], []
+    for res in results:
+        res_texts, res_scores, res_boxes = result_arrays(res)
+        texts.extend(res_texts)
+        scores.extend(res_scores.tolist())
+        boxes.extend(res_boxes.ravel().tolist())
+    return {"texts": texts, "scores": scores, "boxes": boxes, "box_points": BOX_POINTS}
+
+
+def format_ocr_result(results, result_format="list"):
+    """按请求的输出格式序列化 OCR 结果（ocr.ocr 或批调度器返回的 OCRResult 列表）"""
+    if result_format == "columnar":
+        return serialize_columnar(results)
+    return serialize_lines(results)
@@ -1,21 +1,98 @@
+import os
+import json
+import time
+import uuid
 import base64
+import random
+import shutil
 import asyncio
+import argparse
+import tempfile
+import collections
 import numpy as np
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from paddleocr import PaddleOCR
 import uvicorn
 import logging
 import cv2
+from engine_pool import EnginePool, EngineUnavailable
+from documents import RasterPool, detect_kind, page_count, render_page
+from ocr_results import OCR_RESULT_FORMATS, BOX_POINTS, format_ocr_result
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 预热与深度检查使用的空白图像
+PROBE_IMAGE = np.zeros((100, 100, 3), dtype=np.uint8)
+
+# 就绪检查配置（可通过环境变量覆盖）
+# DEEP_CHECK_INTERVAL: 深度检查（真实推理）结果的缓存时间（秒）
+# DEEP_CHECK_TIMEOUT: 深度检查等待推理完成的超时时间（秒）
+DEEP_CHECK_INTERVAL = float(os.environ.get("OCR_DEEP_CHECK_INTERVAL", "30"))
+DEEP_CHECK_TIMEOUT = float(os.environ.get("OCR_DEEP_CHECK_TIMEOUT", "10"))
+
+# 调试配置（可通过环境变量覆盖）
+# RAW_RESULT_LOG_RATE: 记录原始 OCR 结果（类型与完整内容）的请求比例，0 为关闭，1 为每个请求都记录；
+#   文本行很多时原始结果的格式化与日志写入开销较大，仅在排查问题时抽样开启
+RAW_RESULT_LOG_RATE = float(os.environ.get("OCR_RAW_RESULT_LOG_RATE", "0"))
+
+# OCR 批调度配置（可通过环境变量覆盖）
+# BATCH_MAX_IMAGES: 跨请求合并处理的最多图像数，设为 0 时关闭批调度（每个实例逐张调用 ocr.ocr）
+# BATCH_MAX_WAIT_MS: 收到第一张图像后凑批的最长等待时间（毫秒）
+# REC_BATCH_SIZE: 合并所有图像文本行后的识别批大小
+# DET_PAD_MULTIPLE: 检测前将图像右下补齐到该像素数的整数倍，使尺寸相近的图像可同批检测
+# DET_BUCKET_MAX_PADDING: 不同尺寸的图像补齐到同一画布合并检测时，补齐后像素总数与原始像素总数之比的上限
+BATCH_MAX_IMAGES = int(os.environ.get("OCR_BATCH_MAX_IMAGES", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("OCR_BATCH_MAX_WAIT_MS", "10"))
+REC_BATCH_SIZE = int(os.environ.get("OCR_REC_BATCH_SIZE", "64"))
+DET_PAD_MULTIPLE = int(os.environ.get("OCR_DET_PAD_MULTIPLE", "32"))
+DET_BUCKET_MAX_PADDING = float(os.environ.get("OCR_DET_BUCKET_MAX_PADDING", "1.5"))
+
+# 检测前缩放配置（可通过环境变量覆盖）
+# DET_LATENCY_BUDGET_MS: 默认的检测耗时预算（毫秒），按实测耗时将过大的图像缩小后检测，0 为关闭；
+#   可通过请求参数 latency_budget_ms 覆盖
+# DOWNSCALE_MIN_SIDE: 按预算缩放时图像短边的下限（像素），避免小字无法检出
+# MAX_REGIONS: 单个请求最多给出的文本区域数
+DET_LATENCY_BUDGET_MS = float(os.environ.get("OCR_DET_LATENCY_BUDGET_MS", "0"))
+DOWNSCALE_MIN_SIDE = int(os.environ.get("OCR_DOWNSCALE_MIN_SIDE", "640"))
+MAX_REGIONS = int(os.environ.get("OCR_MAX_REGIONS", "1000"))
+
+# OCR 引擎池配置（可通过环境变量覆盖）
+# DEVICES: 引擎使用的设备，逗号分隔，如 "gpu:0,gpu:1" 或 "cpu"
+# ENGINES: 引擎实例数（默认每个设备一个），实例按顺序轮流分配到各设备，同一设备可放多个实例
+# CPU_THREADS: CPU 设备上每个实例的推理线程数（默认将 CPU 核数平均分给各 CPU 实例）
+# ENGINE_WEDGE_TIMEOUT: 实例单批推理超过该秒数视为卡死，替换该实例
+# ENGINE_MAX_FAILURES: 实例连续推理失败达到该批数时替换该实例
+DEVICES = [device.strip() for device in os.environ.get("OCR_DEVICES", "gpu:3").split(",") if device.strip()]
+ENGINES = int(os.environ.get("OCR_ENGINES", str(len(DEVICES))))
+CPU_THREADS = int(os.environ.get("OCR_CPU_THREADS", "0"))
+ENGINE_WEDGE_TIMEOUT = float(os.environ.get("OCR_ENGINE_WEDGE_TIMEOUT", "60"))
+ENGINE_MAX_FAILURES = int(os.environ.get("OCR_ENGINE_MAX_FAILURES", "3"))
+
+# 多页文档 OCR 配置（可通过环境变量覆盖）
+# DOCUMENT_RASTER_WORKERS: 栅格化页面的进程数
+# DOCUMENT_MAX_INFLIGHT_PAGES: 单个文档同时栅格化/识别中的最多页数（限制内存，与总页数无关）
+# DOCUMENT_DPI: PDF 默认栅格化分辨率，可通过请求参数 dpi 覆盖
+# DOCUMENT_MAX_PAGES: 单个文档最多页数
+# DOCUMENT_MAX_PAGE_PIXELS: 单页栅格化的最大像素数，超出时按比例降低分辨率
+DOCUMENT_RASTER_WORKERS = int(os.environ.get("OCR_DOCUMENT_RASTER_WORKERS", str(min(4, os.cpu_count() or 1))))
+DOCUMENT_MAX_INFLIGHT_PAGES = int(os.environ.get("OCR_DOCUMENT_MAX_INFLIGHT_PAGES", "8"))
+DOCUMENT_DPI = float(os.environ.get("OCR_DOCUMENT_DPI", "200"))
+DOCUMENT_MAX_PAGES = int(os.environ.get("OCR_DOCUMENT_MAX_PAGES", "1000"))
+DOCUMENT_MAX_PAGE_PIXELS = int(os.environ.get("OCR_DOCUMENT_MAX_PAGE_PIXELS", str(4000 * 4000)))
+
+# 最近一次真实推理的统计，用于就绪检查
+inference_stats = {"last_inference_time": None, "last_latency_ms": None, "last_error": None}
+
 # 初始化OCR模型
-def init_ocr():
-    logger.info("Initializing PaddleOCR model...")
+def init_ocr(device: str, cpu_threads: int = None):
+    """创建一个 PaddleOCR 引擎并执行一次测试推理（同时作为预热），返回 (引擎, 预热耗时毫秒)"""
+    logger.info(f"Initializing PaddleOCR model on {device}...")
+    options = {"cpu_threads": cpu_threads} if cpu_threads else {}
     ocr = PaddleOCR(
         text_detection_model_name="PP-OCRv5_server_det",
         text_detection_model_dir="/home/ocr_projects/official_models/PP-OCRv5_server_det",
@@ -24,15 +101,17 @@ def init_ocr():
         use_doc_orientation_classify=False,
         use_doc_unwarping=False,
         use_textline_orientation=False,
-        device='gpu:3'
+        device=device,
+        **options
     )
     logger.info("PaddleOCR model initialized successfully")
     
-    # 测试模型是否正常工作
+    # 测试模型是否正常工作（同时作为启动预热）
     try:
         logger.info("Running a quick test inference...")
-        test_img = np.zeros((100, 100, 3), dtype=np.uint8)
-        result = ocr.ocr(test_img)
+        start = time.perf_counter()
+        result = ocr.ocr(PROBE_IMAGE)
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
         logger.info(f"Test inference result type: {type(result)}")
         logger.info(f"Test inference result structure: {result}")
         logger.info("Test inference completed successfully")
@@ -40,10 +119,44 @@ def init_ocr():
         logger.error(f"Test inference failed: {str(e)}")
         raise RuntimeError("PaddleOCR initialization failed") from e
     
-    return ocr
+    return ocr, latency_ms
+
+def engine_specs():
+    """按设备列表轮流分配实例，返回每个实例的 (设备, CPU 线程数)"""
+    devices = [DEVICES[index % len(DEVICES)] for index in range(max(1, ENGINES))]
+    cpu_instances = sum(1 for device in devices if device.startswith("cpu"))
+    threads = CPU_THREADS or max(1, (os.cpu_count() or 1) // max(1, cpu_instances))
+    return [(device, threads if device.startswith("cpu") else None) for device in devices]
 
-# 全局OCR实例
-ocr = init_ocr()
+# 栅格化进程池在创建 OCR 引擎之前启动（fork 出的子进程不继承推理线程与设备上下文）
+raster_pool = RasterPool(DOCUMENT_RASTER_WORKERS)
+
+# OCR 引擎池（启动时创建并预热所有实例，调度器在服务启动后于事件循环中启动）
+engine_pool = EnginePool(
+    init_ocr,
+    engine_specs(),
+    {
+        "max_batch_images": BATCH_MAX_IMAGES,
+        "max_wait_ms": BATCH_MAX_WAIT_MS,
+        "rec_batch_size": REC_BATCH_SIZE,
+        "det_pad_multiple": DET_PAD_MULTIPLE,
+        "det_bucket_max_padding": DET_BUCKET_MAX_PADDING,
+        "batching": BATCH_MAX_IMAGES > 0,
+        "downscale_min_side": DOWNSCALE_MIN_SIDE
+    },
+    ENGINE_WEDGE_TIMEOUT,
+    ENGINE_MAX_FAILURES
+)
+engine_pool.build()
+
+async def run_ocr(cv_image: np.ndarray, regions: np.ndarray = None, latency_budget_ms: float = None):
+    """对一张图像执行 OCR：派发到负载最小的引擎实例，启用批调度时与并发请求合并处理
+    
+    给出 regions 时跳过检测，只识别这些区域；latency_budget_ms 未给出时使用 DET_LATENCY_BUDGET_MS。
+    """
+    if latency_budget_ms is None:
+        latency_budget_ms = DET_LATENCY_BUDGET_MS
+    return await engine_pool.submit(cv_image, regions, latency_budget_ms or None)
 
 app = FastAPI(title="PaddleOCR API", version="1.0")
 
@@ -56,6 +169,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_engine_pool():
+    engine_pool.start()
+    logger.info(f"OCR engines: {engine_pool.healthy_count}/{len(engine_pool.instances)} ready on {', '.join(DEVICES)}")
+    if BATCH_MAX_IMAGES > 0:
+        logger.info(f"OCR batching enabled: max {BATCH_MAX_IMAGES} images, wait {BATCH_MAX_WAIT_MS} ms, "
+                    f"recognition batch {REC_BATCH_SIZE}")
+    if DET_LATENCY_BUDGET_MS > 0:
+        logger.info(f"Detection latency budget: {DET_LATENCY_BUDGET_MS} ms, min side {DOWNSCALE_MIN_SIDE}")
+
+def bytes_to_image(img_data: bytes) -> np.ndarray:
+    """将编码后的图像字节（JPEG/PNG等）直接解码为OpenCV图像格式"""
+    nparr = np.frombuffer(img_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        logger.error("Error decoding image bytes")
+        raise HTTPException(status_code=400, detail="Invalid image data: Failed to decode image data")
+    return img
+
 def base64_to_image(base64_str: str) -> np.ndarray:
     """将base64字符串转换为OpenCV图像格式"""
     try:
@@ -73,8 +205,101 @@ def base64_to_image(base64_str: str) -> np.ndarray:
         logger.error(f"Error decoding base64 image: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
 
-def process_ocr_result(ocr_result):
-    """处理OCR结果，转换为可序列化的格式"""
+async def read_request_image(request: Request):
+    """从请求中读取图像与 OCR 参数，返回 (图像, 参数字典)
+    
+    支持三种请求格式：
+    - JSON: {"image_base64": ..., "regions": ..., "latency_budget_ms": ...}
+    - 原始图像请求体: Content-Type 为 image/jpeg、image/png 等，参数放在查询字符串
+    - multipart 表单: 图像放在 image 文件字段，参数放在同名表单字段或查询字符串
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    params = dict(request.query_params)
+    
+    if content_type.startswith("image/") or content_type == "application/octet-stream":
+        body = await request.body()
+        if not body:
+            raise HTTPException(status_code=400, detail="Empty image body")
+        return bytes_to_image(body), params
+    
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing image file field")
+        for key, value in form.items():
+            if key != "image" and isinstance(value, str):
+                params[key] = value
+        return bytes_to_image(await upload.read()), params
+    
+    try:
+        image_data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    base64_str = image_data.get("image_base64") if isinstance(image_data, dict) else None
+    if not base64_str:
+        raise HTTPException(status_code=400, detail="Missing image_base64 field")
+    params.update((key, value) for key, value in image_data.items() if key != "image_base64")
+    
+    # 转换base64为图像
+    return base64_to_image(base64_str), params
+
+def parse_regions(value, image_shape) -> np.ndarray:
+    """解析调用方给出的文本区域，返回 (N, 4, 2) float32 四边形数组（裁剪到图像范围内）
+    
+    每个区域可以是矩形框 [x1, y1, x2, y2]，或多边形 [[x, y], ...]（四个点按原样使用，
+    其他点数取最小外接矩形）；value 可以是列表或其 JSON 字符串。格式错误时抛出 ValueError。
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError("regions must be a JSON array")
+    if not isinstance(value, list):
+        raise ValueError("regions must be a list of boxes or polygons")
+    if len(value) > MAX_REGIONS:
+        raise ValueError(f"Too many regions: {len(value)}, limit is {MAX_REGIONS}")
+    
+    height, width = image_shape[:2]
+    quads = []
+    for index, region in enumerate(value):
+        try:
+            points = np.asarray(region, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError(f"Region {index}: coordinates must be numbers")
+        if not np.isfinite(points).all():
+            raise ValueError(f"Region {index}: coordinates must be finite")
+        if points.shape == (4,):
+            x1, y1, x2, y2 = points
+            points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+        elif points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError(f"Region {index}: expected [x1, y1, x2, y2] or a list of at least 3 [x, y] points")
+        elif len(points) != 4:
+            points = cv2.boxPoints(cv2.minAreaRect(points)).astype(np.float32)
+        points = np.clip(points, 0, [width - 1, height - 1])
+        if cv2.contourArea(points) < 1:
+            raise ValueError(f"Region {index} is empty or outside the image")
+        quads.append(points)
+    return np.array(quads, dtype=np.float32).reshape(-1, 4, 2)
+
+def parse_latency_budget(value):
+    """解析请求参数 latency_budget_ms，未给出时返回 None，0 表示关闭按预算缩放"""
+    if value is None or value == "":
+        return None
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="latency_budget_ms must be a number")
+    if budget < 0:
+        raise HTTPException(status_code=400, detail="latency_budget_ms must be >= 0")
+    return budget
+
+def process_ocr_result(ocr_result, result_format: str = "list"):
+    """处理OCR结果，转换为可序列化的格式（result_format 为 list 或 columnar）"""
+    # PaddleOCR 3.x 与批调度器返回 OCRResult（字典），按字段整体转换，不逐项遍历
+    if all(isinstance(item, dict) for item in ocr_result):
+        return format_ocr_result(ocr_result, result_format)
+    
     processed = []
     
     # 根据提供的结果，OCR返回的是多层嵌套列表
@@ -123,45 +348,274 @@ def process_ocr_result(ocr_result):
         except Exception as e:
             logger.warning(f"Error processing OCR item: {item}, error: {e}")
     
+    if result_format == "columnar":
+        return {
+            "texts": [item["rec_texts"][0] for item in processed],
+            "scores": [item["rec_scores"][0] for item in processed],
+            "boxes": [coord for item in processed for point in item["dt_boxes"] for coord in point],
+            "box_points": BOX_POINTS
+        }
     return processed
 
+def parse_result_format(value) -> str:
+    """解析输出格式参数 format：list（每个文本行一个字典，默认）或 columnar（并列数组）"""
+    result_format = value or "list"
+    if result_format not in OCR_RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(OCR_RESULT_FORMATS)}")
+    return result_format
+
+def log_raw_result(result):
+    """按 RAW_RESULT_LOG_RATE 抽样记录原始 OCR 结果，用于调试"""
+    if RAW_RESULT_LOG_RATE <= 0 or random.random() >= RAW_RESULT_LOG_RATE:
+        return
+    logger.info(f"Raw OCR result type: {type(result)}")
+    if isinstance(result, list) and result:
+        logger.info(f"First result element type: {type(result[0])}")
+        logger.info(f"First result element content: {result[0]}")
+
+deep_check_lock = asyncio.Lock()
+deep_check_cache = {"checked_at": None, "result": None}
+
+async def run_deep_check() -> dict:
+    """执行一次真实OCR推理；结果缓存 DEEP_CHECK_INTERVAL 秒，并发请求共享同一次检查"""
+    async with deep_check_lock:
+        checked_at = deep_check_cache["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < DEEP_CHECK_INTERVAL:
+            return deep_check_cache["result"]
+        
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(run_ocr(PROBE_IMAGE), DEEP_CHECK_TIMEOUT)
+            result = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "message": f"Inference timed out ({DEEP_CHECK_TIMEOUT} s)"}
+        except Exception as e:
+            result = {"ok": False, "message": f"Inference failed: {str(e)}"}
+        
+        deep_check_cache["checked_at"] = time.monotonic()
+        deep_check_cache["result"] = result
+        return result
+
+def readiness_status() -> dict:
+    """汇总就绪状态：各引擎实例的预热与健康情况，以及最近一次真实推理的信息"""
+    last_time = inference_stats["last_inference_time"]
+    last_inference = None
+    if last_time is not None:
+        last_inference = {
+            "timestamp": last_time,
+            "age_seconds": round(time.time() - last_time, 1),
+            "latency_ms": inference_stats["last_latency_ms"]
+        }
+    # 至少一个实例完成预热且调度器存活即可接收请求
+    ready_engines = engine_pool.healthy_count
+    return {
+        "warmup": {"ok": ready_engines > 0, "ready_engines": ready_engines, "engines": len(engine_pool.instances)},
+        "last_inference": last_inference,
+        "last_error": inference_stats["last_error"]
+    }
+
+@app.get("/livez")
+async def liveness_check():
+    """存活检查：进程能响应请求即可，不访问模型"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check(deep: bool = False):
+    """就绪检查：基于启动预热与最近一次推理判断；deep=true 时附加限频缓存的真实推理检查"""
+    status = readiness_status()
+    ready = status["warmup"]["ok"]
+    if ready and deep:
+        status["deep_check"] = await run_deep_check()
+        ready = status["deep_check"]["ok"]
+    
+    status["status"] = "ready" if ready else "not_ready"
+    return JSONResponse(content=status, status_code=200 if ready else 503)
+
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    return {"status": "healthy", "model": "PP-OCRv5_server"}
+    batching = None
+    if BATCH_MAX_IMAGES > 0:
+        batching = {
+            "max_batch_images": BATCH_MAX_IMAGES,
+            "max_wait_ms": BATCH_MAX_WAIT_MS,
+            "rec_batch_size": REC_BATCH_SIZE
+        }
+    return {
+        "status": "healthy",
+        "model": "PP-OCRv5_server",
+        "readiness": readiness_status(),
+        "batching": batching,
+        "engines": engine_pool.stats()
+    }
+
+@app.get("/engines")
+async def list_engines():
+    """列出 OCR 引擎实例及其设备、负载与健康状态"""
+    return {"engines": engine_pool.stats()}
 
 @app.post("/ocr")
-async def ocr_endpoint(image_data: dict):
-    """OCR处理端点"""
+async def ocr_endpoint(request: Request):
+    """OCR处理端点（支持 base64 JSON、原始图像与 multipart 上传）
+    
+    可选参数：regions（文本区域，给出时跳过检测）、latency_budget_ms（检测耗时预算）、
+    format（list 为每个文本行一个字典，columnar 为 texts/scores/boxes 并列数组）。
+    """
     try:
-        base64_str = image_data.get("image_base64")
-        if not base64_str:
-            raise HTTPException(status_code=400, detail="Missing image_base64 field")
-        
-        # 转换base64为图像
-        cv_image = base64_to_image(base64_str)
+        cv_image, params = await read_request_image(request)
+        regions = None
+        if params.get("regions") is not None:
+            try:
+                regions = parse_regions(params["regions"], cv_image.shape)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid regions: {str(e)}")
+        latency_budget_ms = parse_latency_budget(params.get("latency_budget_ms"))
+        result_format = parse_result_format(params.get("format"))
         
-        # 在后台线程中运行OCR（避免阻塞事件循环）
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(
-            None, 
-            lambda: ocr.ocr(cv_image)
-        )
+        # 在后台线程中运行OCR（避免阻塞事件循环），启用批调度时与并发请求合并推理
+        start = time.perf_counter()
+        try:
+            result = await run_ocr(cv_image, regions, latency_budget_ms)
+        except Exception as e:
+            inference_stats["last_error"] = str(e)
+            raise
+        inference_stats["last_inference_time"] = time.time()
+        inference_stats["last_latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        inference_stats["last_error"] = None
         
-        # 记录原始结果用于调试
-        logger.info(f"Raw OCR result type: {type(result)}")
-        if isinstance(result, list) and result:
-            logger.info(f"First result element type: {type(result[0])}")
-            logger.info(f"First result element content: {result[0]}")
+        # 抽样记录原始结果用于调试
+        log_raw_result(result)
         
         # 处理并返回结果
-        processed_result = process_ocr_result(result)
-        return JSONResponse(content={"status": "success", "result": processed_result})
+        processed_result = process_ocr_result(result, result_format)
+        content = {"status": "success", "result": processed_result}
+        # 按延迟预算缩小后检测时返回缩放比例（文本框已映射回原图坐标）
+        det_scale = result[0].get("det_scale", 1.0) if result and isinstance(result[0], dict) else 1.0
+        if det_scale < 1.0:
+            content["det_scale"] = round(det_scale, 4)
+        return JSONResponse(content=content)
     
+    except HTTPException:
+        raise
+    except EngineUnavailable as e:
+        logger.error(f"OCR engine unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.exception("Error processing OCR request")
         raise HTTPException(status_code=500, detail=str(e))
 
+class CleanupStreamingResponse(StreamingResponse):
+    """流式响应：正常结束或客户端中途断开（发送出错）时都执行 background"""
+    
+    async def __call__(self, scope, receive, send):
+        background, self.background = self.background, None
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if background is not None:
+                await background()
+
+async def save_document(request: Request) -> str:
+    """将上传的文档逐块写入临时文件（不在内存中保留整个文档），返回文件路径
+    
+    支持原始请求体（application/pdf、image/tiff 等）与 multipart 表单的 file 字段。
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fd, path = tempfile.mkstemp(prefix=f"ocr-document-{uuid.uuid4().hex}-")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            if content_type == "multipart/form-data":
+                form = await request.form()
+                try:
+                    upload = form.get("file")
+                    if upload is None or isinstance(upload, str):
+                        raise HTTPException(status_code=400, detail="Missing file field")
+                    await asyncio.get_running_loop().run_in_executor(None, shutil.copyfileobj, upload.file, output)
+                finally:
+                    await form.close()
+            else:
+                async for chunk in request.stream():
+                    output.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+@app.post("/ocr_document")
+async def ocr_document_endpoint(request: Request, dpi: float = DOCUMENT_DPI, latency_budget_ms: float = None,
+                                format: str = "list"):
+    """多页文档 OCR 端点：上传 PDF 或多帧 TIFF，各页并行识别，以 NDJSON 按页序逐页返回结果
+    
+    每行为 {"page_index": 页序号, "result": [...]}（result 与 /ocr 相同，格式由 format 参数指定）或 {"page_index": ..., "error": ...}，
+    最后一行为汇总 {"done": true, "pages": 页数, "failed": 失败页数}。
+    页面在栅格化进程中按需渲染，同时渲染与识别中的页数受 DOCUMENT_MAX_INFLIGHT_PAGES 限制，
+    内存占用与文档页数无关。latency_budget_ms 为每页的检测耗时预算（默认 DET_LATENCY_BUDGET_MS）。
+    """
+    if not 0 < dpi <= 600:
+        raise HTTPException(status_code=400, detail="dpi must be in (0, 600]")
+    if latency_budget_ms is not None and latency_budget_ms < 0:
+        raise HTTPException(status_code=400, detail="latency_budget_ms must be >= 0")
+    result_format = parse_result_format(format)
+    loop = asyncio.get_running_loop()
+    path = await save_document(request)
+    try:
+        with open(path, "rb") as f:
+            kind = detect_kind(f.read(8))
+        if kind is None:
+            raise HTTPException(status_code=400, detail="Unsupported document type: expected PDF or TIFF")
+        try:
+            total = await raster_pool.run(loop, page_count, path, kind)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid document: {str(e)}")
+        if total > DOCUMENT_MAX_PAGES:
+            raise HTTPException(status_code=400, detail=f"Document has {total} pages, limit is {DOCUMENT_MAX_PAGES}")
+    except BaseException:
+        os.remove(path)
+        raise
+    logger.info(f"Document OCR started: {kind}, {total} pages, dpi {dpi}")
+    
+    def remove_document():
+        """删除临时文件（生成器结束与响应结束时各调用一次，客户端提前断开时生成器可能不会被执行到底）"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    async def process_page(index: int) -> list:
+        image = await raster_pool.run(loop, render_page, path, kind, index, dpi, DOCUMENT_MAX_PAGE_PIXELS)
+        return process_ocr_result(await run_ocr(image, latency_budget_ms=latency_budget_ms), result_format)
+    
+    async def generate():
+        pending = collections.deque()
+        next_index = 0
+        failed = 0
+        try:
+            while next_index < total or pending:
+                # 窗口内的页并行栅格化与识别，按页序等待最早的一页
+                while next_index < total and len(pending) < DOCUMENT_MAX_INFLIGHT_PAGES:
+                    pending.append(asyncio.ensure_future(process_page(next_index)))
+                    next_index += 1
+                index = next_index - len(pending)
+                line = {"page_index": index}
+                try:
+                    line["result"] = await pending.popleft()
+                except Exception as e:
+                    failed += 1
+                    line["error"] = str(e)
+                    logger.error(f"Document page {index} failed: {str(e)}")
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            
+            yield json.dumps({"done": True, "pages": total, "failed": failed}) + "\n"
+            logger.info(f"Document OCR finished: {total} pages, {failed} failed")
+        finally:
+            # 客户端断开或处理结束时取消未完成的页并删除临时文件
+            for task in pending:
+                task.cancel()
+            remove_document()
+    
+    return CleanupStreamingResponse(generate(), media_type="application/x-ndjson",
+                                    background=BackgroundTask(remove_document))
+
 if __name__ == "__main__":
     # 解析命令行参数
     parser = argparse.ArgumentParser(description="Run PaddleOCR API server")
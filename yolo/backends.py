@@ -0,0 +1,128 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import logging
+import itertools
+import torch
+from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+# 支持的推理后端：eager PyTorch 以及 ultralytics 可导出并由 AutoBackend 加载的格式
+BACKENDS = ('torch', 'torchscript', 'onnx', 'openvino')
+
+# 导出时是否使用动态 batch（TorchScript 为 trace 导出，batch 维度固定）
+DYNAMIC_BATCH = {'torch': True, 'torchscript': False, 'onnx': True, 'openvino': True}
+
+# 导出产物缓存目录（位于权重文件旁）
+EXPORT_DIR_NAME = '.exports'
+
+
+def max_batch_size(backend):
+    """后端单次前向支持的最大 batch（None 表示不限制）"""
+    return None if DYNAMIC_BATCH[backend] else 1
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """计算权重文件的 sha256，用作导出缓存键的一部分"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_dir(weights_path, backend, imgsz):
+    """导出产物目录：<权重目录>/.exports/<名称>-<权重哈希>-<后端>-<输入尺寸>"""
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    key = f"{stem}-{file_hash(weights_path)[:16]}-{backend}-{imgsz}"
+    return os.path.join(os.path.dirname(os.path.abspath(weights_path)), EXPORT_DIR_NAME, key)
+
+
+def cached_artifact(target_dir):
+    """返回已完成导出的产物路径，不存在时返回 None"""
+    manifest_path = os.path.join(target_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        artifact = os.path.join(target_dir, json.load(f)['artifact'])
+    return artifact if os.path.exists(artifact) else None
+
+
+def export_model(weights_path, backend, imgsz):
+    """导出模型并缓存，已存在的导出产物直接复用，返回产物路径
+
+    多个进程（模型工作进程）可能同时加载同一模型：导出过程持有文件锁，等锁的进程在拿到锁后
+    复用已完成的产物；导出先写入临时目录，完成后整体重命名为缓存目录，不会读到写了一半的产物。
+    """
+    target_dir = export_dir(weights_path, backend, imgsz)
+    artifact = cached_artifact(target_dir)
+    if artifact is not None:
+        logger.info(f"复用已缓存的 {backend} 导出产物: {artifact}")
+        return artifact
+
+    os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+    with open(f"{target_dir}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        artifact = cached_artifact(target_dir)
+        if artifact is not None:
+            logger.info(f"复用其他进程导出的 {backend} 产物: {artifact}")
+            return artifact
+
+        # ultralytics 将导出产物写在权重文件旁，先把权重复制到临时目录再导出
+        tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            local_weights = os.path.join(tmp_dir, os.path.basename(weights_path))
+            shutil.copy2(weights_path, local_weights)
+
+            logger.info(f"导出 {backend} 模型: {weights_path} (imgsz={imgsz})")
+            exported = YOLO(local_weights).export(format=backend, imgsz=imgsz, dynamic=DYNAMIC_BATCH[backend])
+            relpath = os.path.relpath(os.path.abspath(str(exported)), tmp_dir)
+            os.remove(local_weights)
+
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'source': os.path.abspath(weights_path),
+                    'backend': backend,
+                    'imgsz': imgsz,
+                    'artifact': relpath
+                }, f, ensure_ascii=False, indent=2)
+            # 清理旧版本中途失败留下的不完整目录后再替换
+            shutil.rmtree(target_dir, ignore_errors=True)
+            os.replace(tmp_dir, target_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return os.path.join(target_dir, relpath)
+
+
+def model_size(model):
+    """估算模型占用的字节数：torch 模型按参数与缓冲区计算，导出模型按产物文件大小计算"""
+    if isinstance(model.model, torch.nn.Module):
+        return sum(t.numel() * t.element_size()
+                   for t in itertools.chain(model.model.parameters(), model.model.buffers()))
+    path = str(model.model)
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, filename))
+                   for root, _, filenames in os.walk(path) for filename in filenames)
+    return os.path.getsize(path)
+
+
+def load_model(weights_path, backend='torch', imgsz=640, device='cpu'):
+    """按后端加载模型：torch 直接加载权重，其他后端加载（必要时先导出）缓存的导出产物"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知推理后端: {backend}，可用后端: {', '.join(BACKENDS)}")
+
+    if backend == 'torch':
+        model = YOLO(weights_path)
+        if device == 'cuda':
+            model = model.to(device)
+        return model
+
+    return YOLO(export_model(weights_path, backend, imgsz), task='detect')
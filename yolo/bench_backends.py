@@ -0,0 +1,91 @@
+import os
+import time
+import argparse
+import numpy as np
+import cv2
+import backends
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_images(paths):
+    """读取图像集：参数可以是图片文件或目录（目录下的所有图片）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            files.append(path)
+    images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in files]
+    return [img for img in images if img is not None]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_backend(weights, backend, images, imgsz, device, batch_size, rounds, warmup):
+    """在同一图像集上测量单个后端：按 batch 推理，统计每批延迟与整体吞吐"""
+    start = time.perf_counter()
+    model = backends.load_model(weights, backend, imgsz, device)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # 固定 batch 维度的导出模型只能逐张推理
+    batch_size = min(batch_size, backends.max_batch_size(backend) or batch_size)
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+
+    for batch in batches[:warmup]:
+        model.predict(source=batch, imgsz=imgsz, batch=len(batch), device=device, verbose=False)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for batch in batches:
+            batch_start = time.perf_counter()
+            model.predict(source=batch, imgsz=imgsz, batch=len(batch), device=device, verbose=False)
+            latencies.append((time.perf_counter() - batch_start) * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'batch_size': batch_size,
+        'load_ms': load_ms,
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'throughput': len(images) * rounds / elapsed
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="在同一图像集上对比各推理后端的延迟与吞吐")
+    parser.add_argument("--weights", default="/work/project/yolov9/model/yolov9e.pt", help="模型权重路径")
+    parser.add_argument("--images", nargs='+', default=["test.jpg"], help="测试图片或图片目录")
+    parser.add_argument("--backends", nargs='+', default=list(backends.BACKENDS), choices=backends.BACKENDS,
+                        help="参与对比的推理后端")
+    parser.add_argument("--imgsz", type=int, default=640, help="推理输入尺寸")
+    parser.add_argument("--device", default="cpu", help="推理设备（cpu 或 cuda）")
+    parser.add_argument("--batch", type=int, default=1, help="每次前向推理的图片数")
+    parser.add_argument("--rounds", type=int, default=5, help="图像集重复推理的轮数")
+    parser.add_argument("--warmup", type=int, default=2, help="计时前预热的批次数")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit("未读取到任何测试图片")
+    print(f"图像数: {len(images)}, 输入尺寸: {args.imgsz}, 设备: {args.device}, 轮数: {args.rounds}")
+
+    results = []
+    for backend in args.backends:
+        try:
+            results.append(bench_backend(args.weights, backend, images, args.imgsz, args.device,
+                                         args.batch, args.rounds, args.warmup))
+        except Exception as e:
+            print(f"{backend}: 测试失败: {str(e)}")
+
+    print(f"{'后端':<14}{'batch':>6}{'加载耗时':>12}{'p50/批':>12}{'p90/批':>12}{'吞吐':>14}{'加速比':>10}")
+    baseline = next((r['throughput'] for r in results if r['backend'] == 'torch'), None)
+    for r in results:
+        speedup = f"{r['throughput'] / baseline:>9.2f}x" if baseline else f"{'-':>10}"
+        print(f"{r['backend']:<14}{r['batch_size']:>6}{r['load_ms']:>10.0f}ms{r['p50_ms']:>10.1f}ms"
+              f"{r['p90_ms']:>10.1f}ms{r['throughput']:>10.1f}张/秒{speedup}")
@@ -0,0 +1,99 @@
+import json
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+import mimetypes
+import numpy as np
+import cv2
+from starlette.requests import Request
+
+
+def build_json_body(image_bytes):
+    """base64-in-JSON 请求体（/detect 与 /ocr 的原有格式）"""
+    payload = {'image_base64': base64.b64encode(image_bytes).decode('utf-8'), 'conf': 0.25}
+    return json.dumps(payload).encode('utf-8')
+
+
+def build_multipart_body(image_bytes, filename):
+    """multipart/form-data 请求体（image 文件字段）"""
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    head = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return head + image_bytes + tail, f'multipart/form-data; boundary={boundary}'
+
+
+def parse_json_body(body):
+    """服务端解析 base64 JSON：JSON 解析 → base64 解码 → 图像解码"""
+    data = json.loads(body)
+    img_data = base64.b64decode(data['image_base64'])
+    return cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def parse_raw_body(body):
+    """服务端解析原始图像请求体：直接从请求缓冲区解码"""
+    return cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+
+
+async def parse_multipart_body(body, content_type):
+    """服务端解析 multipart 表单：与 /detect、/ocr 相同经 Starlette request.form() 切分 → 读取 image 字段 → 图像解码"""
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/detect', 'query_string': b'',
+             'headers': [(b'content-type', content_type.encode('latin-1')),
+                         (b'content-length', str(len(body)).encode('latin-1'))]}
+    form = await Request(scope, receive).form()
+    try:
+        img_data = await form['image'].read()
+    finally:
+        await form.close()
+    return cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def time_parse(func, body, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(body)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+async def time_parse_async(func, args, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func(*args)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对比 base64 JSON 与二进制上传的请求大小和服务端解析耗时")
+    parser.add_argument("--image", default="test.jpg", help="测试图片路径")
+    parser.add_argument("--iterations", type=int, default=200, help="解析耗时的重复次数")
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as image_file:
+        image_bytes = image_file.read()
+
+    json_body = build_json_body(image_bytes)
+    multipart_body, multipart_type = build_multipart_body(image_bytes, args.image)
+
+    # 仅解码图像的耗时，用于拆分出格式本身带来的额外开销
+    decode_ms = time_parse(parse_raw_body, image_bytes, args.iterations)
+    json_ms = time_parse(parse_json_body, json_body, args.iterations)
+    multipart_ms = asyncio.run(time_parse_async(parse_multipart_body, (multipart_body, multipart_type),
+                                                args.iterations))
+
+    print(f"原始图像: {len(image_bytes) / 1024:.1f} KB")
+    print(f"{'格式':<16}{'请求字节':>12}{'膨胀':>10}{'解析耗时':>12}{'格式开销':>12}")
+    rows = [
+        ('base64 JSON', len(json_body), json_ms),
+        ('image/* 请求体', len(image_bytes), decode_ms),
+        ('multipart', len(multipart_body), multipart_ms),
+    ]
+    for name, size, parse_ms in rows:
+        print(f"{name:<16}{size / 1024:>10.1f}KB{size / len(image_bytes) * 100 - 100:>9.1f}%"
+              f"{parse_ms:>10.2f}ms{parse_ms - decode_ms:>10.2f}ms")
@@ -0,0 +1,68 @@
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from detections import serialize_detections, serialize_columnar
+
+
+def serialize_per_box(result):
+    """原有实现：逐个目标索引 box.cls[0]/box.conf[0]/box.xywhn[0] 构造字典（作为对照）"""
+    detections = []
+    if result.boxes is not None:
+        boxes = result.boxes.cpu().numpy()
+        for box in boxes:
+            detections.append({
+                "class": int(box.cls[0]),
+                "class_name": result.names[int(box.cls[0])],
+                "confidence": float(box.conf[0]),
+                "bbox": box.xywhn[0].tolist()
+            })
+    return detections
+
+
+def make_result(count, width=1920, height=1080, num_classes=80, seed=0):
+    """构造包含 count 个随机检测框的推理结果"""
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width - 50, count)
+    y1 = rng.uniform(0, height - 50, count)
+    boxes = np.stack([
+        x1, y1,
+        x1 + rng.uniform(5, 50, count), y1 + rng.uniform(5, 50, count),
+        rng.uniform(0.1, 1.0, count), rng.integers(0, num_classes, count)
+    ], axis=1).astype(np.float32)
+    names = {i: f'class_{i}' for i in range(num_classes)}
+    return Results(np.zeros((height, width, 3), np.uint8), path='', names=names, boxes=torch.from_numpy(boxes))
+
+
+def time_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对比逐框序列化、向量化列表与列式格式在不同检测数下的耗时与响应大小")
+    parser.add_argument("--counts", type=int, nargs='+', default=[10, 100, 300, 1000], help="每张图像的检测数")
+    parser.add_argument("--iterations", type=int, default=200, help="每种情况的重复次数")
+    args = parser.parse_args()
+
+    variants = [
+        ('逐框 list', serialize_per_box),
+        ('向量化 list', serialize_detections),
+        ('columnar', serialize_columnar),
+        ('columnar+xyxy', lambda result: serialize_columnar(result, pixel_xyxy=True)),
+    ]
+
+    print(f"{'检测数':>6}  {'格式':<16}{'序列化':>10}{'JSON 编码':>12}{'合计':>10}{'响应大小':>12}")
+    for count in args.counts:
+        result = make_result(count)
+        for name, serialize in variants:
+            detections = serialize(result)
+            encoded = json.dumps(detections)
+            serialize_ms = time_call(lambda: serialize(result), args.iterations)
+            encode_ms = time_call(lambda: json.dumps(detections), args.iterations)
+            print(f"{count:>6}  {name:<16}{serialize_ms:>8.3f}ms{encode_ms:>10.3f}ms"
+                  f"{serialize_ms + encode_ms:>8.3f}ms{len(encoded) / 1024:>10.1f}KB")
@@ -0,0 +1,74 @@
+import os
+import time
+import base64
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+
+def read_io_bytes():
+    """读取当前进程的磁盘读写字节数（仅 Linux 支持，其他平台返回 None）"""
+    try:
+        with open('/proc/self/io') as f:
+            stats = dict(line.split(': ') for line in f.read().splitlines())
+        return int(stats['rchar']), int(stats['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def decode_base64(base64_str):
+    """与服务端一致的 base64 → ndarray 解码"""
+    if 'base64,' in base64_str:
+        base64_str = base64_str.split('base64,')[-1]
+    nparr = np.frombuffer(base64.b64decode(base64_str), np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def path_disk(base64_str, upload_dir, index):
+    """旧路径：解码 → 重新编码落盘 → 推理前再次读取解码"""
+    img = decode_base64(base64_str)
+    upload_path = os.path.join(upload_dir, f"{index}.jpg")
+    cv2.imwrite(upload_path, img)
+    return cv2.imread(upload_path)
+
+
+def path_memory(base64_str, upload_dir, index):
+    """新路径：解码后的数组直接送入推理"""
+    return decode_base64(base64_str)
+
+
+def run(name, func, base64_str, iterations):
+    with tempfile.TemporaryDirectory() as upload_dir:
+        io_before = read_io_bytes()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for i in range(iterations):
+            func(base64_str, upload_dir, i)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        io_after = read_io_bytes()
+        disk_bytes = sum(
+            os.path.getsize(os.path.join(upload_dir, f)) for f in os.listdir(upload_dir)
+        )
+
+    print(f"[{name}]")
+    print(f"  单请求 CPU 时间: {cpu / iterations * 1000:.2f} ms")
+    print(f"  单请求墙钟时间: {wall / iterations * 1000:.2f} ms")
+    print(f"  单请求落盘字节: {disk_bytes / iterations / 1024:.1f} KB")
+    if io_before and io_after:
+        print(f"  单请求读/写字节: {(io_after[0] - io_before[0]) / iterations / 1024:.1f} KB / "
+              f"{(io_after[1] - io_before[1]) / iterations / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对比上传图像落盘与内存直传的单请求开销")
+    parser.add_argument("--image", default="test.jpg", help="测试图片路径")
+    parser.add_argument("--iterations", type=int, default=200, help="每种路径的重复次数")
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as image_file:
+        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+
+    run("落盘（旧）", path_disk, base64_image, args.iterations)
+    run("内存直传（新）", path_memory, base64_image, args.iterations)
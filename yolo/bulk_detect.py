@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import logging
+import argparse
+import collections
+import concurrent.futures
+import cv2
+import torch
+import backends
+from detections import DETECTION_FORMATS, filter_result, format_detections
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 每处理多少张图像输出一次进度
+PROGRESS_INTERVAL = 1000
+
+
+def resume_offset(output_path):
+    """返回输出文件中最后一条完整记录之后的清单行号，并截掉中断时写了一半的末行"""
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # 从文件末尾向前按块查找最后两个换行符，内存占用与文件大小无关
+        position = end
+        tail = b''
+        while position > 0 and tail.count(b'\n') < 2:
+            step = min(64 * 1024, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+
+        complete = tail[:tail.rfind(b'\n') + 1]
+        if len(complete) < len(tail):
+            f.truncate(position + len(complete))
+            logger.warning("输出文件末行不完整（上次运行中断），已截断")
+
+        lines = complete.rstrip(b'\n').rsplit(b'\n', 1)
+        if not lines[-1]:
+            return 0
+        return json.loads(lines[-1])['line'] + 1
+
+
+def iter_jobs(manifest_path, start_line, defaults):
+    """逐行读取 JSONL 清单，跳过已完成的行；每行为图片路径字符串或 {"image": ..., "conf": ...}"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if line_number < start_line or not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                if isinstance(job, str):
+                    job = {'image': job}
+                job = {**defaults, **job}
+                job['conf'] = float(job['conf'])
+                job['iou'] = float(job['iou'])
+                job['max_det'] = int(job['max_det'])
+                if 'image' not in job:
+                    raise ValueError('缺少 image 字段')
+                if not isinstance(job['image'], str):
+                    raise ValueError('image 字段必须是图片路径字符串')
+            except (ValueError, TypeError) as e:
+                job = {'error': f'无效的清单行: {str(e)}'}
+            job['line'] = line_number
+            yield job
+
+
+def decode_job(job):
+    """读取并解码图像（在解码线程池中执行，OpenCV 解码期间释放 GIL）"""
+    if 'error' in job:
+        return job, None
+    try:
+        img = cv2.imread(job['image'], cv2.IMREAD_COLOR)
+    except Exception as e:
+        return {**job, 'error': f'图像读取失败: {str(e)}'}, None
+    if img is None:
+        return {**job, 'error': '图像读取或解码失败'}, None
+    return job, img
+
+
+def prefetch(jobs, pool, depth):
+    """按清单顺序返回解码结果，最多提前解码 depth 张图像"""
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.submit(decode_job, job))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_batches(decoded, batch_size):
+    """按清单顺序分批（解码失败的行也保留在批内，以保证输出顺序）；
+    有效图像数或总行数达到 batch_size 即输出，避免连续失败行使批次无限增长"""
+    batch = []
+    valid = 0
+    for item in decoded:
+        batch.append(item)
+        if item[1] is not None:
+            valid += 1
+        if valid >= batch_size or len(batch) >= batch_size:
+            yield batch
+            batch = []
+            valid = 0
+    if batch:
+        yield batch
+
+
+def detect_batch(model, batch, args):
+    """对一批已解码图像推理，返回与 batch 一一对应的输出记录"""
+    valid = [(job, img) for job, img in batch if img is not None]
+    results = {}
+    if valid:
+        # 与服务端相同：以本批最宽松的参数推理，再按每行自身的参数过滤
+        predictions = model.predict(
+            source=[img for _, img in valid],
+            conf=min(job['conf'] for job, _ in valid),
+            iou=max(job['iou'] for job, _ in valid),
+            max_det=max(job['max_det'] for job, _ in valid),
+            batch=len(valid),
+            imgsz=args.imgsz,
+            device=args.device,
+            verbose=False
+        )
+        for (job, _), result in zip(valid, predictions):
+            result = filter_result(result, job['conf'], job['iou'], job['max_det'])
+            results[job['line']] = format_detections(result, args.format, args.xyxy)
+
+    records = []
+    for job, _ in batch:
+        record = {'line': job['line']}
+        for key in ('id', 'image'):
+            if key in job:
+                record[key] = job[key]
+        if job['line'] in results:
+            record['detections'] = results[job['line']]
+        else:
+            record['error'] = job['error']
+        records.append(record)
+    return records
+
+
+def main(args):
+    start_line = resume_offset(args.output)
+    if start_line:
+        logger.info(f"从清单第 {start_line} 行继续（之前的结果已在 {args.output} 中）")
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    args.device = device
+    model = backends.load_model(args.model, args.backend, args.imgsz, device)
+    logger.info(f"模型已加载: {args.model} ({args.backend}, {device})")
+
+    # 固定 batch 维度的导出模型（TorchScript）只能逐张推理
+    batch_size = min(args.batch_size, backends.max_batch_size(args.backend) or args.batch_size)
+    defaults = {'conf': args.conf, 'iou': args.iou, 'max_det': args.max_det}
+    processed = 0
+    failed = 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.decode_workers) as pool, \
+            open(args.output, 'a', encoding='utf-8') as output:
+        decoded = prefetch(iter_jobs(args.manifest, start_line, defaults), pool, args.prefetch)
+        for batch in iter_batches(decoded, batch_size):
+            try:
+                records = detect_batch(model, batch, args)
+            except Exception as e:
+                logger.error(f"批次推理出错 (清单第 {batch[0][0]['line']} 行起): {str(e)}")
+                records = [{'line': job['line'], 'image': job.get('image'), 'error': f'处理失败: {str(e)}'}
+                           for job, _ in batch]
+
+            # 整批写入后再刷新，中断时最多丢失一个未刷新的批次
+            output.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+            output.flush()
+
+            previous = processed
+            processed += len(records)
+            failed += sum(1 for record in records if 'error' in record)
+            if processed // PROGRESS_INTERVAL > previous // PROGRESS_INTERVAL:
+                elapsed = time.perf_counter() - start
+                logger.info(f"已处理 {processed} 行, 失败 {failed} 行, {processed / elapsed:.1f} 张/秒")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"完成: 本次处理 {processed} 行, 失败 {failed} 行, 耗时 {elapsed:.1f} 秒"
+                f"{f', {processed / elapsed:.1f} 张/秒' if elapsed else ''}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="离线批量检测：按 JSONL 清单检测图像并逐批写入 JSONL 结果，可中断后续跑")
+    parser.add_argument("manifest", help="JSONL 清单，每行为图片路径字符串或 {\"image\": 路径, \"id\": ..., \"conf\": ...}")
+    parser.add_argument("--output", required=True, help="输出 JSONL 文件（已存在时从中断处继续）")
+    parser.add_argument("--model", default="/work/project/yolov9/model/yolov9e.pt", help="模型权重路径")
+    parser.add_argument("--backend", default="torch", choices=backends.BACKENDS, help="推理后端")
+    parser.add_argument("--imgsz", type=int, default=640, help="推理输入尺寸")
+    parser.add_argument("--device", help="推理设备（默认有 GPU 时使用 cuda）")
+    parser.add_argument("--batch-size", type=int, default=8, help="每次前向推理的图像数")
+    parser.add_argument("--decode-workers", type=int, default=4, help="解码线程数")
+    parser.add_argument("--prefetch", type=int, default=32, help="最多提前解码的图像数（限制内存）")
+    parser.add_argument("--conf", type=float, default=0.1, help="默认置信度阈值")
+    parser.add_argument("--iou", type=float, default=0.1, help="默认 NMS IoU 阈值")
+    parser.add_argument("--max-det", type=int, default=10, help="默认每张图像最多检测数")
+    parser.add_argument("--format", default="list", choices=DETECTION_FORMATS,
+                        help="检测结果格式：list（每个目标一个字典）或 columnar（并列数组）")
+    parser.add_argument("--xyxy", action="store_true", help="额外输出像素坐标的 bbox_xyxy")
+    main(parser.parse_args())
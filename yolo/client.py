@@ -1,13 +1,338 @@
 import requests
 import base64
+import argparse
+import mimetypes
+import json
 import time
 import os
+import threading
+import collections
+import concurrent.futures
+
+parser = argparse.ArgumentParser(description="YOLO 检测服务客户端")
+parser.add_argument("--image", default="test.jpg", help="测试图片路径")
+parser.add_argument("--binary", action="store_true", help="以原始图像请求体上传，不做 base64 编码")
+parser.add_argument("--sse", action="store_true", help="通过 SSE 事件流接收结果（默认使用长轮询）")
+parser.add_argument("--batch", nargs='+', metavar="PATH",
+                    help="批量模式：将这些图片（或目录下的所有图片）通过 /detect_batch 一次提交")
+parser.add_argument("--server", default="http://localhost:5000", help="服务端地址")
+bench = parser.add_argument_group("压测模式")
+bench.add_argument("--bench", nargs='+', metavar="PATH",
+                   help="压测模式：循环使用这些图片（或目录下的所有图片）驱动 /detect + /result")
+bench.add_argument("--concurrency", type=int, default=8, help="并发请求数（闭环压测的客户端数，或开环压测的最大在途请求数）")
+bench.add_argument("--qps", type=float, help="目标 QPS（开环压测，按固定间隔发起请求；不指定时为闭环压测）")
+bench.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+bench.add_argument("--requests", type=int, help="总请求数（指定时优先于 --duration）")
+bench.add_argument("--warmup", type=int, default=5, help="正式计时前的预热请求数")
+bench.add_argument("--report", help="将压测报告保存为 JSON 文件")
+bench.add_argument("--compare", help="与之前保存的压测报告对比")
+bench.add_argument("--threshold", type=float, default=10, help="判定性能回退的阈值（百分比）")
+args = parser.parse_args()
 
 # 服务端地址
-SERVER_URL = 'http://localhost:5000/detect'
-RESULT_URL = 'http://localhost:5000/result/'
-RESULT_IMAGE_URL = 'http://localhost:5000/result_image/'
-HEALTH_URL = 'http://localhost:5000/health'
+SERVER_URL = f'{args.server}/detect'
+BATCH_URL = f'{args.server}/detect_batch'
+RESULT_URL = f'{args.server}/result/'
+RESULT_IMAGE_URL = f'{args.server}/result_image/'
+EVENTS_URL = f'{args.server}/events'
+HEALTH_URL = f'{args.server}/health'
+
+# 长轮询参数：每次请求服务端最多挂起 LONG_POLL_WAIT 秒，任务结束即返回
+LONG_POLL_WAIT = 30
+MAX_RETRIES = 10
+
+def wait_result_long_poll(task_id):
+    """通过 /result/<task_id>?wait= 长轮询等待任务结束，返回结果数据"""
+    for _ in range(MAX_RETRIES):
+        try:
+            result_response = requests.get(f"{RESULT_URL}{task_id}", params={'wait': LONG_POLL_WAIT},
+                                           timeout=LONG_POLL_WAIT + 10)
+            result_data = result_response.json()
+            if result_data.get('status') != 'processing':
+                return result_data
+            print("任务处理中...")
+        except requests.exceptions.RequestException as e:
+            print(f"请求错误: {str(e)}")
+            time.sleep(1)
+    return None
+
+def wait_result_sse(task_id):
+    """订阅 /events 的 SSE 推送等待任务结束，返回结果数据"""
+    with requests.get(EVENTS_URL, params={'task_id': task_id}, stream=True,
+                      timeout=(10, LONG_POLL_WAIT + 10)) as response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith('data: '):
+                return json.loads(line[len('data: '):])
+    return None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def collect_images(paths):
+    """展开批量模式的图片参数（目录展开为其中的图片文件）"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+def run_batch(image_paths, params):
+    """通过 /detect_batch 一次提交多张图片，边接收 NDJSON 边输出每张图片的结果"""
+    handles = [open(path, 'rb') for path in image_paths]
+    try:
+        files = [('images', (os.path.basename(path), handle,
+                             mimetypes.guess_type(path)[0] or 'application/octet-stream'))
+                 for path, handle in zip(image_paths, handles)]
+        start = time.perf_counter()
+        with requests.post(BATCH_URL, data=params, files=files, stream=True, timeout=(30, 300)) as response:
+            if response.status_code != 200:
+                print(f"提交批量任务失败, 状态码: {response.status_code}")
+                print(response.text)
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                item = json.loads(line)
+                if item.get('done'):
+                    elapsed = time.perf_counter() - start
+                    print(f"\n批量检测完成: {item['total']} 张, 失败 {item['failed']} 张, "
+                          f"耗时 {elapsed:.2f} 秒 ({item['total'] / elapsed:.1f} 张/秒)")
+                elif 'error' in item:
+                    print(f"[{item['index']}] {item['name']}: {item['error']}")
+                else:
+                    print(f"[{item['index']}] {item['name']}: {len(item['detections'])} 个目标")
+                    for detection in item['detections']:
+                        print(f"    - {detection['class_name']}: 置信度 {detection['confidence']:.2f}")
+    finally:
+        for handle in handles:
+            handle.close()
+
+def percentiles(values):
+    """计算 p50/p90/p99/均值/最大值（最近秩法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    def rank(q):
+        return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+    return {
+        'p50': round(rank(50), 2),
+        'p90': round(rank(90), 2),
+        'p99': round(rank(99), 2),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'max': round(ordered[-1], 2)
+    }
+
+class BenchClient:
+    """压测客户端：每个线程复用一个 Session（保持长连接），一次请求为 /detect 提交加 /result 长轮询"""
+    
+    def __init__(self, images, params, binary):
+        self.images = images
+        self.params = params
+        self.binary = binary
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.image_index = 0
+    
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+    
+    def next_image(self):
+        with self.lock:
+            image = self.images[self.image_index % len(self.images)]
+            self.image_index += 1
+        return image
+    
+    def detect(self):
+        """执行一次检测，返回 (结果类别, 服务端耗时毫秒)；结果类别为 ok 或错误类型"""
+        session = self.session()
+        path, image_bytes = self.next_image()
+        try:
+            if self.binary:
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                response = session.post(SERVER_URL, params=self.params, data=image_bytes,
+                                        headers={'Content-Type': content_type}, timeout=30)
+            else:
+                payload = {'image_base64': base64.b64encode(image_bytes).decode('utf-8'), **self.params}
+                response = session.post(SERVER_URL, json=payload, timeout=30)
+            if response.status_code != 200:
+                return f'http_{response.status_code}', None
+            
+            result_data = response.json()
+            # 命中结果缓存时提交接口直接返回结果
+            while result_data.get('status') == 'processing':
+                result_response = session.get(f"{RESULT_URL}{result_data['task_id']}",
+                                              params={'wait': LONG_POLL_WAIT}, timeout=LONG_POLL_WAIT + 10)
+                if result_response.status_code != 200:
+                    return f'http_{result_response.status_code}', None
+                result_data = result_response.json()
+            if result_data['status'] != 'completed':
+                return 'task_error', result_data.get('server_ms')
+            return 'ok', result_data.get('server_ms')
+        except requests.exceptions.Timeout:
+            return 'timeout', None
+        except requests.exceptions.RequestException:
+            return 'connection_error', None
+
+def run_bench(client, concurrency, qps, duration, total_requests):
+    """执行压测，返回每个请求的 (开始时刻, 端到端毫秒, 结果类别, 服务端毫秒)
+    
+    闭环（未指定 qps）：concurrency 个客户端各自连续发起请求；
+    开环（指定 qps）：按固定间隔发起请求，端到端耗时从计划发起时刻算起，包含客户端排队时间。
+    """
+    records = []
+    records_lock = threading.Lock()
+    start = time.perf_counter()
+    end = start + duration
+    
+    def record(scheduled):
+        outcome, server_ms = client.detect()
+        finished = time.perf_counter()
+        with records_lock:
+            records.append((scheduled - start, (finished - scheduled) * 1000, outcome, server_ms))
+    
+    if qps:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            index = 0
+            while total_requests is None or index < total_requests:
+                scheduled = start + index / qps
+                if total_requests is None and scheduled >= end:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(record, scheduled)
+                index += 1
+        return records
+    
+    issued = iter(range(total_requests)) if total_requests is not None else None
+    issued_lock = threading.Lock()
+    
+    def loop():
+        while True:
+            if issued is not None:
+                with issued_lock:
+                    if next(issued, None) is None:
+                        return
+            elif time.perf_counter() >= end:
+                return
+            record(time.perf_counter())
+    
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+def build_report(records, config):
+    elapsed = max((r[0] + r[1] / 1000 for r in records), default=0)
+    outcomes = collections.Counter(r[2] for r in records)
+    ok = [r for r in records if r[2] == 'ok']
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': config,
+        'requests': len(records),
+        'ok': len(ok),
+        'errors': {outcome: count for outcome, count in outcomes.items() if outcome != 'ok'},
+        'error_rate': round(1 - len(ok) / len(records), 4) if records else None,
+        'duration_seconds': round(elapsed, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'end_to_end': percentiles([r[1] for r in ok]),
+            'server': percentiles([r[3] for r in ok if r[3] is not None])
+        }
+    }
+
+def print_report(report):
+    print(f"\n请求数: {report['requests']}, 成功: {report['ok']}, 错误率: {report['error_rate']:.2%}")
+    for outcome, count in sorted(report['errors'].items()):
+        print(f"  {outcome}: {count}")
+    print(f"耗时: {report['duration_seconds']} 秒, 吞吐: {report['throughput_rps']} 请求/秒")
+    print(f"{'延迟(ms)':<14}{'p50':>10}{'p90':>10}{'p99':>10}{'均值':>10}{'最大':>10}")
+    for name, stats in report['latency_ms'].items():
+        if stats:
+            print(f"{name:<14}{stats['p50']:>10.1f}{stats['p90']:>10.1f}{stats['p99']:>10.1f}"
+                  f"{stats['mean']:>10.1f}{stats['max']:>10.1f}")
+
+def compare_reports(current, previous, threshold):
+    """与之前的报告对比，返回回退项列表（吞吐下降或延迟上升超过 threshold%，错误率上升超过 1 个百分点）"""
+    rows = [('throughput_rps', current['throughput_rps'], previous['throughput_rps'], True)]
+    for name in ('end_to_end', 'server'):
+        for q in ('p50', 'p90', 'p99'):
+            cur = (current['latency_ms'].get(name) or {}).get(q)
+            prev = (previous['latency_ms'].get(name) or {}).get(q)
+            rows.append((f'{name}.{q}', cur, prev, False))
+    
+    regressions = []
+    print(f"\n{'指标':<20}{'本次':>12}{'上次':>12}{'变化':>10}")
+    for name, cur, prev, higher_is_better in rows:
+        if cur is None or prev is None or not prev:
+            continue
+        change = (cur - prev) / prev * 100
+        regressed = -change > threshold if higher_is_better else change > threshold
+        print(f"{name:<20}{cur:>12.2f}{prev:>12.2f}{change:>+9.1f}%{'  回退' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    
+    if current['error_rate'] is not None and previous['error_rate'] is not None:
+        change = current['error_rate'] - previous['error_rate']
+        regressed = change > 0.01
+        print(f"{'error_rate':<20}{current['error_rate']:>12.2%}{previous['error_rate']:>12.2%}"
+              f"{change * 100:>+9.1f}pt{'  回退' if regressed else ''}")
+        if regressed:
+            regressions.append('error_rate')
+    return regressions
+
+def bench_main(image_paths, params):
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as image_file:
+            images.append((path, image_file.read()))
+    concurrency = max(1, args.concurrency)
+    client = BenchClient(images, params, args.binary)
+    
+    if args.warmup:
+        print(f"预热 {args.warmup} 个请求...")
+        run_bench(client, concurrency, None, float('inf'), args.warmup)
+    
+    mode = f"开环 {args.qps} QPS" if args.qps else f"闭环 {concurrency} 并发"
+    amount = f"{args.requests} 个请求" if args.requests else f"{args.duration} 秒"
+    print(f"开始压测: {mode}, {amount}, {len(images)} 张图片")
+    records = run_bench(client, concurrency, args.qps, args.duration, args.requests)
+    
+    report = build_report(records, {
+        'server': args.server,
+        'images': len(images),
+        'concurrency': concurrency,
+        'qps': args.qps,
+        'duration': args.duration,
+        'requests': args.requests,
+        'binary': args.binary,
+        'params': params
+    })
+    print_report(report)
+    
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n压测报告已保存至: {args.report}")
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        regressions = compare_reports(report, previous, args.threshold)
+        if regressions:
+            print(f"\n性能回退: {', '.join(regressions)}")
+            exit(1)
+        print("\n未发现性能回退")
 
 # 健康检查
 print("执行健康检查...")
@@ -29,29 +354,56 @@ except Exception as e:
     print(f"健康检查错误: {str(e)}")
     exit()
 
+# 准备请求参数
+params = {
+    'conf': 0.25,
+    'iou': 0.45,
+    'max_det': 100
+}
+
+if args.batch:
+    image_paths = collect_images(args.batch)
+    if not image_paths:
+        print("错误: 未找到待检测的图片")
+        exit()
+    print(f"\n批量提交 {len(image_paths)} 张图片...")
+    try:
+        run_batch(image_paths, params)
+    except requests.exceptions.RequestException as e:
+        print(f"网络错误: {str(e)}")
+    exit()
+
+if args.bench:
+    image_paths = collect_images(args.bench)
+    if not image_paths:
+        print("错误: 未找到压测图片")
+        exit()
+    bench_main(image_paths, params)
+    exit()
+
 # 读取图像
-image_path = 'test.jpg'
+image_path = args.image
 if not os.path.exists(image_path):
     print(f"错误: 测试图片不存在: {image_path}")
     exit()
 
 print(f"\n读取测试图片: {image_path}")
 with open(image_path, 'rb') as image_file:
-    # 直接编码为Base64字符串
-    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+    image_bytes = image_file.read()
 
-# 准备请求数据
 print("\n提交检测任务...")
-payload = {
-    'image_base64': base64_image,
-    'conf': 0.25,
-    'iou': 0.45,
-    'max_det': 100
-}
 
 try:
     # 发送请求
-    response = requests.post(SERVER_URL, json=payload, timeout=30)
+    if args.binary:
+        # 原始图像作为请求体，参数放在查询串中
+        content_type = mimetypes.guess_type(image_path)[0] or 'application/octet-stream'
+        response = requests.post(SERVER_URL, params=params, data=image_bytes,
+                                 headers={'Content-Type': content_type}, timeout=30)
+    else:
+        # 编码为Base64字符串放入JSON
+        payload = {'image_base64': base64.b64encode(image_bytes).decode('utf-8'), **params}
+        response = requests.post(SERVER_URL, json=payload, timeout=30)
     
     if response.status_code != 200:
         print(f"提交任务失败, 状态码: {response.status_code}")
@@ -62,59 +414,41 @@ try:
     task_id = task_data['task_id']
     print(f"任务已提交, ID: {task_id}, 状态: {task_data['status']}")
     
-    # 轮询任务结果
+    # 等待任务结果（服务端推送，无需固定间隔轮询）
     print("\n等待处理结果...")
-    max_retries = 10
-    retry_count = 0
-    wait_time = 3  # 初始等待时间
+    if args.sse:
+        result_data = wait_result_sse(task_id)
+    else:
+        result_data = wait_result_long_poll(task_id)
     
-    while retry_count < max_retries:
-        try:
-            result_response = requests.get(f"{RESULT_URL}{task_id}", timeout=10)
-            result_data = result_response.json()
+    if result_data is None:
+        print("\n错误: 超过最大等待次数，任务可能仍在处理中或失败")
+    
+    elif result_data['status'] == 'completed':
+        print("\n检测完成!")
+        print("检测结果:")
+        for detection in result_data['result']['detections']:
+            print(f"- {detection['class_name']}: 置信度 {detection['confidence']:.2f}, "
+                  f"位置 {detection['bbox']}")
+        
+        # 下载结果图片（提交时 render=False 则无结果图片）
+        image_filename = result_data['result']['result_image']
+        if image_filename:
+            img_url = f"{RESULT_IMAGE_URL}{image_filename}"
+            print(f"\n下载结果图片: {img_url}")
             
-            if result_data['status'] == 'completed':
-                print("\n检测完成!")
-                print("检测结果:")
-                for detection in result_data['result']['detections']:
-                    print(f"- {detection['class_name']}: 置信度 {detection['confidence']:.2f}, "
-                          f"位置 {detection['bbox']}")
-                
-                # 下载结果图片
-                image_filename = result_data['result']['result_image']
-                img_url = f"{RESULT_IMAGE_URL}{image_filename}"
-                print(f"\n下载结果图片: {img_url}")
-                
-                img_response = requests.get(img_url, timeout=30)
-                
-                if img_response.status_code == 200:
-                    output_path = f"result_{task_id}.jpg"
-                    with open(output_path, 'wb') as f:
-                        f.write(img_response.content)
-                    print(f"结果图片已保存至: {output_path}")
-                else:
-                    print(f"获取结果图片失败, 状态码: {img_response.status_code}")
-                break
-                
-            elif result_data['status'] == 'error':
-                print("\n处理错误:", result_data['message'])
-                break
-                
+            img_response = requests.get(img_url, timeout=30)
+            
+            if img_response.status_code == 200:
+                output_path = f"result_{task_id}.jpg"
+                with open(output_path, 'wb') as f:
+                    f.write(img_response.content)
+                print(f"结果图片已保存至: {output_path}")
             else:
-                print(f"任务处理中... (等待{wait_time}秒后重试)")
-                time.sleep(wait_time)
-                retry_count += 1
-                # 指数退避策略
-                wait_time = min(wait_time * 1.5, 30)
-                
-        except requests.exceptions.RequestException as e:
-            print(f"请求错误: {str(e)}")
-            retry_count += 1
-            time.sleep(wait_time)
-            wait_time = min(wait_time * 1.5, 30)
+                print(f"获取结果图片失败, 状态码: {img_response.status_code}")
     
-    if retry_count >= max_retries:
-        print("\n错误: 超过最大重试次数，任务可能仍在处理中或失败")
+    else:
+        print("\n处理错误:", result_data['message'])
         
 except requests.exceptions.RequestException as e:
     print(f"网络错误: {str(e)}")
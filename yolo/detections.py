@@ -0,0 +1,79 @@
+import numpy as np
+import torchvision
+
+# 检测结果的输出格式：list 为每个目标一个字典，columnar 为按字段排列的并列数组
+DETECTION_FORMATS = ('list', 'columnar')
+
+
+def filter_result(result, conf, iou, max_det):
+    """按任务自身的 conf/iou/max_det 对批推理结果进行二次过滤"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return result
+
+    # 置信度过滤
+    result = result[boxes.conf >= conf]
+    boxes = result.boxes
+    if len(boxes) == 0:
+        return result
+
+    # 按类别重新做 NMS（批推理使用的是本批最宽松的 iou），结果按置信度降序
+    keep = torchvision.ops.batched_nms(boxes.xyxy, boxes.conf, boxes.cls, iou)
+    return result[keep[:max_det]]
+
+
+def detection_arrays(result):
+    """一次性取出全部检测的类别、置信度、像素 xyxy 与归一化 xywh 数组"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.float32), np.zeros((0, 4), np.float32), np.zeros((0, 4), np.float32)
+
+    # boxes.data 每行为 x1, y1, x2, y2, conf, cls
+    data = result.boxes.data.cpu().numpy()
+    xyxy = data[:, :4]
+    height, width = result.orig_shape[:2]
+    xywhn = np.empty_like(xyxy)
+    xywhn[:, 0] = (xyxy[:, 0] + xyxy[:, 2]) / 2 / width
+    xywhn[:, 1] = (xyxy[:, 1] + xyxy[:, 3]) / 2 / height
+    xywhn[:, 2] = (xyxy[:, 2] - xyxy[:, 0]) / width
+    xywhn[:, 3] = (xyxy[:, 3] - xyxy[:, 1]) / height
+    return data[:, 5].astype(np.int64), data[:, 4], xyxy, xywhn
+
+
+def serialize_detections(result, pixel_xyxy=False):
+    """将单张图像的推理结果转换为可序列化的检测列表（每个目标一个字典）"""
+    classes, confidences, xyxy, xywhn = detection_arrays(result)
+    names = result.names
+    classes = classes.tolist()
+    detections = [{
+        "class": cls,
+        "class_name": names[cls],
+        "confidence": confidence,
+        "bbox": bbox
+    } for cls, confidence, bbox in zip(classes, confidences.tolist(), xywhn.tolist())]
+    if pixel_xyxy:
+        for detection, bbox in zip(detections, xyxy.tolist()):
+            detection["bbox_xyxy"] = bbox
+    return detections
+
+
+def serialize_columnar(result, pixel_xyxy=False):
+    """将单张图像的推理结果转换为按字段排列的并列数组，第 i 个目标对应各数组的第 i 项"""
+    classes, confidences, xyxy, xywhn = detection_arrays(result)
+    names = result.names
+    classes = classes.tolist()
+    detections = {
+        "class": classes,
+        "class_name": [names[cls] for cls in classes],
+        "confidence": confidences.tolist(),
+        "bbox": xywhn.tolist()
+    }
+    if pixel_xyxy:
+        detections["bbox_xyxy"] = xyxy.tolist()
+    return detections
+
+
+def format_detections(result, detection_format='list', pixel_xyxy=False):
+    """按请求的输出格式序列化检测结果"""
+    if detection_format == 'columnar':
+        return serialize_columnar(result, pixel_xyxy)
+    return serialize_detections(result, pixel_xyxy)
@@ -0,0 +1,461 @@
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import logging
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+import collections
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 工作进程与前端进程间认证密钥的环境变量（不放在命令行参数中）
+AUTHKEY_ENV = 'YOLO_WORKER_AUTHKEY'
+
+# 工作进程启动后很快退出视为崩溃循环，重启前按连续崩溃次数退避（秒）
+CRASH_LOOP_SECONDS = 10
+RESTART_BACKOFF_MAX = 30
+
+# 预热使用的空白图像
+PROBE_IMAGE = np.zeros((640, 640, 3), dtype=np.uint8)
+
+
+class WorkerCrashed(Exception):
+    """模型工作进程在任务完成前退出"""
+
+
+def write_images(images):
+    """将一批图像依次写入同一块共享内存，返回 (共享内存, 图像描述列表)
+
+    图像描述为 (偏移, 形状, dtype)，工作进程据此还原图像；写入完成后前端即关闭映射，
+    共享内存在任务结束时再删除。写入失败时删除已创建的共享内存后抛出异常。
+    """
+    total = sum(img.nbytes for img in images)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+    specs = []
+    offset = 0
+    try:
+        for img in images:
+            view = np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf, offset=offset)
+            view[...] = img  # 切片视图等非连续数组也直接拷入共享内存
+            del view
+            specs.append((offset, img.shape, img.dtype.str))
+            offset += img.nbytes
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return shm, specs
+
+
+def read_images(name, specs):
+    """从共享内存读取图像（拷贝为进程私有数组后立即关闭映射）"""
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前没有 track 参数，需要手动取消资源跟踪，避免工作进程退出时删除共享内存
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        return [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset).copy()
+                for offset, shape, dtype in specs]
+    finally:
+        shm.close()
+
+
+def unlink_images(shm):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class Worker:
+    """单个模型工作进程的状态与负载统计"""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.ready = False
+        self.generation = 0
+        self.pid = None
+        self.started_at = None
+        self.warmup = None
+        # job_id -> Job，正在该进程中推理的任务
+        self.pending = {}
+        self.jobs = 0
+        self.images = 0
+        self.errors = 0
+        self.restarts = 0
+        self.consecutive_crashes = 0
+        self.last_latency_ms = None
+
+    @property
+    def in_flight_images(self):
+        return sum(len(job.specs) for job in self.pending.values())
+
+
+Job = collections.namedtuple('Job', ['job_id', 'model_name', 'shm', 'specs', 'callback', 'submitted_at'])
+
+
+class WorkerPool:
+    """模型工作进程池：每个进程各自持有模型，前端按在途图像数选择最空闲的进程分发批次
+
+    图像经共享内存传递，任务参数与检测框结果经 Unix 套接字连接收发；进程崩溃时其在途任务
+    以 WorkerCrashed 失败，并自动重启该进程。
+    """
+
+    def __init__(self, num_workers, model_paths, backend, imgsz, device, preload=None, max_inflight=2,
+                 memory_mb=None):
+        self.model_paths = dict(model_paths)
+        self.backend = backend
+        self.imgsz = imgsz
+        self.device = device
+        self.preload = preload
+        # 每个工作进程常驻模型的内存/显存预算（MB），超出时按 LRU 淘汰，预加载的模型常驻
+        self.memory_mb = memory_mb
+        self.lock = threading.Lock()
+        # 在途批次上限，分发方在此阻塞，待处理请求留在调度队列中继续凑批
+        self.slots = threading.Semaphore(max(1, num_workers * max_inflight))
+        self.job_ids = itertools.count()
+        # 模型类别名（由工作进程上报），供前端构造结果
+        self.names = {}
+        self.workers = [Worker(worker_id) for worker_id in range(num_workers)]
+        self.closed = False
+        self.authkey = os.urandom(16)
+        self.socket_dir = tempfile.mkdtemp(prefix='yolo-workers-')
+        self.listener = Listener(os.path.join(self.socket_dir, 'workers.sock'), family='AF_UNIX',
+                                 authkey=self.authkey)
+        atexit.register(self.close)
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, name='worker-accept', daemon=True).start()
+        for worker in self.workers:
+            self._spawn(worker)
+        threading.Thread(target=self._monitor_loop, name='worker-monitor', daemon=True).start()
+
+    def _spawn(self, worker):
+        if self.closed:
+            return
+        cmd = [
+            sys.executable, os.path.abspath(__file__),
+            '--address', self.listener.address,
+            '--worker-id', str(worker.worker_id),
+            '--models', json.dumps(self.model_paths),
+            '--backend', self.backend,
+            '--imgsz', str(self.imgsz),
+            '--device', self.device
+        ]
+        if self.preload:
+            cmd += ['--preload', self.preload]
+        if self.memory_mb is not None:
+            cmd += ['--memory-mb', str(self.memory_mb)]
+        env = dict(os.environ, **{AUTHKEY_ENV: self.authkey.hex()})
+        process = subprocess.Popen(cmd, env=env)
+        with self.lock:
+            worker.process = process
+            worker.started_at = time.time()
+        logger.info(f"模型工作进程 {worker.worker_id} 已启动, pid {process.pid}")
+
+    def _accept_loop(self):
+        """接受工作进程的连接，收到 hello 后该进程才参与分发"""
+        while True:
+            try:
+                conn = self.listener.accept()
+                hello = conn.recv()
+            except Exception as e:
+                logger.error(f"工作进程连接失败: {str(e)}")
+                continue
+
+            worker = self.workers[hello['worker_id']]
+            with self.lock:
+                worker.conn = conn
+                worker.pid = hello['pid']
+                worker.warmup = hello['warmup']
+                worker.ready = True
+                self.names.update(hello['names'])
+                generation = worker.generation
+            logger.info(f"模型工作进程 {worker.worker_id} 就绪, 预热: {hello['warmup']}")
+            threading.Thread(target=self._read_loop, args=(worker, conn, generation),
+                             name=f'worker-reader-{worker.worker_id}', daemon=True).start()
+
+    def _read_loop(self, worker, conn, generation):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                job = worker.pending.pop(msg['job_id'], None)
+                if job is None:
+                    continue
+                worker.jobs += 1
+                worker.images += len(job.specs)
+                worker.last_latency_ms = round((time.perf_counter() - job.submitted_at) * 1000, 1)
+                worker.consecutive_crashes = 0
+                if msg['type'] == 'error':
+                    worker.errors += 1
+                else:
+                    self.names[job.model_name] = msg['names']
+            self._release(job)
+
+            try:
+                if msg['type'] == 'error':
+                    job.callback(None, RuntimeError(msg['message']))
+                else:
+                    job.callback(msg, None)
+            except Exception as e:
+                logger.error(f"工作进程结果回调出错: {str(e)}")
+                if msg['type'] != 'error':
+                    # 处理结果失败时以错误回调，使上层任务结束并释放准入名额，而不是一直处于处理中
+                    try:
+                        job.callback(None, e)
+                    except Exception as e:
+                        logger.error(f"工作进程错误回调出错: {str(e)}")
+
+        self._handle_exit(worker, generation)
+
+    def _monitor_loop(self):
+        """检测尚未连接（或连接未断开）就已退出的工作进程"""
+        while True:
+            time.sleep(1)
+            for worker in self.workers:
+                with self.lock:
+                    process, generation = worker.process, worker.generation
+                if process is not None and process.poll() is not None:
+                    self._handle_exit(worker, generation)
+
+    def _handle_exit(self, worker, generation):
+        """工作进程退出：在途任务以 WorkerCrashed 失败，随后重启进程（同一代只处理一次）"""
+        with self.lock:
+            if worker.generation != generation or self.closed:
+                return
+            worker.generation += 1
+            worker.ready = False
+            conn, worker.conn = worker.conn, None
+            process, worker.process = worker.process, None
+            pending = list(worker.pending.values())
+            worker.pending.clear()
+            worker.restarts += 1
+            crashed_early = worker.started_at is not None and time.time() - worker.started_at < CRASH_LOOP_SECONDS
+            worker.consecutive_crashes = worker.consecutive_crashes + 1 if crashed_early else 0
+            backoff = min(RESTART_BACKOFF_MAX, 2 ** worker.consecutive_crashes - 1)
+
+        if conn is not None:
+            conn.close()
+        exit_code = None
+        if process is not None:
+            if process.poll() is None:
+                process.kill()
+            exit_code = process.wait()
+        logger.error(f"模型工作进程 {worker.worker_id} 已退出 (退出码 {exit_code}), "
+                     f"{len(pending)} 个在途批次失败, {backoff} 秒后重启")
+
+        for job in pending:
+            self._release(job)
+            try:
+                job.callback(None, WorkerCrashed(f'模型工作进程 {worker.worker_id} 已退出'))
+            except Exception as e:
+                logger.error(f"工作进程结果回调出错: {str(e)}")
+
+        restart = threading.Timer(backoff, self._spawn, args=(worker,))
+        restart.daemon = True
+        restart.start()
+
+    def _release(self, job):
+        unlink_images(job.shm)
+        self.slots.release()
+
+    def submit(self, model_name, images, conf, iou, max_det, callback):
+        """将一批图像分发到最空闲的工作进程，完成后在读取线程中调用 callback(结果, error)
+
+        结果为 {'names': 类别名, 'boxes': [每张图像的 (n, 6) 检测框数组], 'speed': [...]}。
+        所有进程的在途批次已满时阻塞。
+        """
+        self.slots.acquire()
+        try:
+            shm, specs = write_images(images)
+        except Exception as e:
+            # 如 /dev/shm 空间不足：归还在途名额，本批以错误结束
+            self.slots.release()
+            callback(None, e)
+            return
+        job = Job(next(self.job_ids), model_name, shm, specs, callback, time.perf_counter())
+        with self.lock:
+            candidates = [worker for worker in self.workers if worker.ready]
+            worker = min(candidates, key=lambda w: w.in_flight_images) if candidates else None
+            if worker is not None:
+                worker.pending[job.job_id] = job
+                conn = worker.conn
+
+        if worker is None:
+            self._release(job)
+            callback(None, WorkerCrashed('没有可用的模型工作进程'))
+            return
+
+        msg = {
+            'type': 'predict',
+            'job_id': job.job_id,
+            'model': model_name,
+            'shm': shm.name,
+            'images': specs,
+            'conf': conf,
+            'iou': iou,
+            'max_det': max_det
+        }
+        try:
+            with worker.send_lock:
+                conn.send(msg)
+        except (OSError, ValueError) as e:
+            # 进程已退出，若任务仍未被崩溃处理接管则在这里失败
+            with self.lock:
+                job = worker.pending.pop(job.job_id, None)
+            if job is not None:
+                self._release(job)
+                callback(None, WorkerCrashed(f'发送任务到模型工作进程失败: {str(e)}'))
+
+    @property
+    def ready_count(self):
+        with self.lock:
+            return sum(1 for worker in self.workers if worker.ready)
+
+    def stats(self):
+        """各工作进程的负载与状态"""
+        now = time.time()
+        with self.lock:
+            return [{
+                'worker_id': worker.worker_id,
+                'pid': worker.pid,
+                'ready': worker.ready,
+                'uptime_seconds': round(now - worker.started_at, 1) if worker.started_at else None,
+                'in_flight_batches': len(worker.pending),
+                'in_flight_images': worker.in_flight_images,
+                'batches': worker.jobs,
+                'images': worker.images,
+                'errors': worker.errors,
+                'restarts': worker.restarts,
+                'last_latency_ms': worker.last_latency_ms,
+                'warmup': worker.warmup
+            } for worker in self.workers]
+
+    def close(self):
+        self.closed = True
+        for worker in self.workers:
+            process = worker.process
+            if process is not None and process.poll() is None:
+                process.terminate()
+        self.listener.close()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+def worker_main(args):
+    """工作进程主循环：按需加载模型，从共享内存读取图像并批量推理，返回检测框"""
+    import backends
+
+    logging.basicConfig(level=logging.INFO,
+                        format=f'%(asctime)s - worker-{args.worker_id} - %(levelname)s - %(message)s')
+    model_paths = json.loads(args.models)
+    memory_budget = args.memory_mb * 1024 * 1024 if args.memory_mb is not None else None
+    # name -> 模型，按最近使用排序；与前端的模型注册表相同，超出预算时按 LRU 淘汰（预加载的模型常驻）
+    models = collections.OrderedDict()
+    sizes = {}
+
+    def get_model(name):
+        model = models.get(name)
+        if model is not None:
+            models.move_to_end(name)
+            return model
+        model = models[name] = backends.load_model(model_paths[name], args.backend, args.imgsz, args.device)
+        sizes[name] = backends.model_size(model)
+        if memory_budget is None:
+            return model
+
+        evicted = []
+        total = sum(sizes[loaded] for loaded in models)
+        for loaded in list(models):
+            if total <= memory_budget:
+                break
+            if loaded == name or loaded == args.preload:
+                continue
+            del models[loaded]
+            total -= sizes.pop(loaded)
+            evicted.append(loaded)
+        if evicted:
+            logger.info(f"模型超出内存预算, 已淘汰: {', '.join(evicted)}")
+            if args.device == 'cuda':
+                import torch
+                torch.cuda.empty_cache()
+        return model
+
+    names = {}
+    warmup = None
+    if args.preload:
+        try:
+            start = time.perf_counter()
+            model = get_model(args.preload)
+            model.predict(source=PROBE_IMAGE, imgsz=args.imgsz, device=args.device, verbose=False)
+            warmup = {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+            names[args.preload] = model.names
+        except Exception as e:
+            logger.error(f"模型 {args.preload} 预热失败: {str(e)}")
+            warmup = {'ok': False, 'message': f'模型预热失败: {str(e)}'}
+
+    conn = Client(args.address, family='AF_UNIX', authkey=bytes.fromhex(os.environ.pop(AUTHKEY_ENV)))
+    conn.send({'worker_id': args.worker_id, 'pid': os.getpid(), 'warmup': warmup, 'names': names})
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        try:
+            images = read_images(msg['shm'], msg['images'])
+            model = get_model(msg['model'])
+            results = model.predict(
+                source=images,
+                conf=msg['conf'],
+                iou=msg['iou'],
+                max_det=msg['max_det'],
+                batch=len(images),
+                imgsz=args.imgsz,
+                device=args.device,
+                verbose=False
+            )
+            reply = {
+                'type': 'result',
+                'job_id': msg['job_id'],
+                'names': model.names,
+                'boxes': [result.boxes.data.cpu().numpy() if result.boxes is not None
+                          else np.zeros((0, 6), np.float32) for result in results],
+                'speed': [getattr(result, 'speed', None) for result in results]
+            }
+        except Exception as e:
+            logger.error(f"批次推理出错: {str(e)}")
+            reply = {'type': 'error', 'job_id': msg['job_id'], 'message': str(e)}
+        conn.send(reply)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="YOLO 模型工作进程（由 server.py 启动）")
+    parser.add_argument("--address", required=True, help="前端进程的 Unix 套接字地址")
+    parser.add_argument("--worker-id", type=int, required=True)
+    parser.add_argument("--models", required=True, help="模型名到权重路径的 JSON 映射")
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--preload", help="启动时加载并预热的模型")
+    parser.add_argument("--memory-mb", type=float, help="常驻模型的内存/显存预算（MB），不指定时不淘汰")
+    worker_main(parser.parse_args())
@@ -1,214 +1,2257 @@
 import os
+import re
 import uuid
 import base64
+import socket
+import ipaddress
+import urllib.parse
 import numpy as np
-from flask import Flask, request, jsonify, send_file
-from werkzeug.utils import secure_filename
-from ultralytics import YOLO
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from ultralytics.engine.results import Results
 import cv2
 import json
+import math
+import time
+import itertools
+import hashlib
+import bisect
+import contextlib
+import tempfile
+import collections
+import queue
+import asyncio
 import threading
 import concurrent.futures
 import torch
+import torchvision
+import requests
 import logging
+import backends
+from detections import DETECTION_FORMATS, filter_result, format_detections
+import model_workers
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+app = FastAPI(title="YOLOv9 Detection API")
 
-# 检查GPU可用性并加载模型到GPU
+# 服务所在的事件循环（启动时设置），调度器与任务通知通过它跨线程投递
+event_loop = None
+
+# 检查GPU可用性
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model_path = "/work/project/yolov9/model/yolov9e.pt"
-
-# 全局模型加载（确保只加载一次）
-model = None
-try:
-    if device == 'cuda':
-        model = YOLO(model_path).to(device)
-        logger.info(f"模型已加载到 GPU: {torch.cuda.get_device_name(0)}")
-    else:
-        model = YOLO(model_path)
-        logger.info("模型使用 CPU")
-except Exception as e:
-    logger.error(f"模型加载失败: {str(e)}")
-    model = None
+if device == 'cuda':
+    logger.info(f"模型将加载到 GPU: {torch.cuda.get_device_name(0)}")
+else:
+    logger.info("模型使用 CPU")
+
+# 模型注册表配置（可通过环境变量覆盖）
+# MODEL_DIR: 模型目录，目录下的每个 *.pt 以文件名（不含扩展名）注册为一个模型
+# MODELS: 额外注册的模型，格式为 "名称=权重路径,名称=权重路径"
+# DEFAULT_MODEL: 请求未指定 model 时使用的模型，启动时加载并常驻
+# MODEL_MEMORY_MB: 常驻模型的内存/显存预算（MB，按参数与缓冲区大小估算），超出时按 LRU 淘汰
+MODEL_DIR = os.environ.get('YOLO_MODEL_DIR', '/work/project/yolov9/model')
+DEFAULT_MODEL = os.environ.get('YOLO_DEFAULT_MODEL', 'yolov9e')
+MODEL_MEMORY_MB = float(os.environ.get('YOLO_MODEL_MEMORY_MB', '8192'))
+
+# 推理后端配置
+# BACKEND: torch（eager PyTorch）、torchscript、onnx（ONNX Runtime）或 openvino
+# 非 torch 后端首次加载时导出模型，产物缓存在权重旁，按权重哈希与输入尺寸区分
+# IMGSZ: 推理输入尺寸，导出模型的输入形状固定为该尺寸
+BACKEND = os.environ.get('YOLO_BACKEND', 'torch')
+IMGSZ = int(os.environ.get('YOLO_IMGSZ', '640'))
+if BACKEND not in backends.BACKENDS:
+    raise ValueError(f"未知推理后端: {BACKEND}，可用后端: {', '.join(backends.BACKENDS)}")
+
+# 预热与深度检查使用的空白图像
+PROBE_IMAGE = np.zeros((640, 640, 3), dtype=np.uint8)
+
+def discover_models(model_dir, extra):
+    """收集可用模型：模型目录下的 *.pt 加上 "名称=路径" 形式的额外配置"""
+    models = {}
+    if os.path.isdir(model_dir):
+        for filename in sorted(os.listdir(model_dir)):
+            if filename.endswith('.pt'):
+                models[filename[:-3]] = os.path.join(model_dir, filename)
+    for item in filter(None, (part.strip() for part in extra.split(','))):
+        name, _, path = item.partition('=')
+        if not path:
+            raise ValueError(f"无效的模型配置: {item}")
+        models[name.strip()] = path.strip()
+    models.setdefault(DEFAULT_MODEL, os.path.join(model_dir, f'{DEFAULT_MODEL}.pt'))
+    return models
+
+class ModelRegistry:
+    """模型注册表：按名称懒加载模型并预热，在内存预算内常驻，超出时按 LRU 淘汰（默认模型常驻）"""
+    
+    def __init__(self, paths, memory_budget, pinned):
+        self.paths = paths
+        self.memory_budget = memory_budget
+        self.pinned = set(pinned)
+        self.lock = threading.Lock()
+        self.load_locks = {name: threading.Lock() for name in paths}
+        # name -> 模型，按最近使用排序
+        self.loaded = collections.OrderedDict()
+        self.sizes = {}
+        self.stats = {name: {
+            'loads': 0,
+            'evictions': 0,
+            'batches': 0,
+            'images': 0,
+            'load_ms': None,
+            'warmup': None,
+            'last_used': None,
+            'last_latency_ms': None
+        } for name in paths}
+    
+    def resolve(self, name):
+        """将请求中的模型名解析为已注册的模型名，未知模型抛出 KeyError"""
+        name = name or DEFAULT_MODEL
+        if name not in self.paths:
+            raise KeyError(name)
+        return name
+    
+    def is_loaded(self, name):
+        with self.lock:
+            return name in self.loaded
+    
+    def get(self, name):
+        """返回已加载的模型，未加载时加载（同一模型并发请求只加载一次）"""
+        with self.lock:
+            model = self.loaded.get(name)
+            if model is not None:
+                self.loaded.move_to_end(name)
+                self.stats[name]['last_used'] = time.time()
+                return model
+        
+        with self.load_locks[name]:
+            with self.lock:
+                model = self.loaded.get(name)
+            if model is not None:
+                return model
+            
+            model, size = self._load(name)
+            with self.lock:
+                self.loaded[name] = model
+                self.sizes[name] = size
+                self.stats[name]['last_used'] = time.time()
+                evicted = self._evict_over_budget(keep=name)
+        
+        if evicted:
+            logger.info(f"模型超出内存预算, 已淘汰: {', '.join(evicted)}")
+            if device == 'cuda':
+                torch.cuda.empty_cache()
+        return model
+    
+    def _load(self, name):
+        path = self.paths[name]
+        start = time.perf_counter()
+        model = backends.load_model(path, BACKEND, IMGSZ, device)
+        load_ms = (time.perf_counter() - start) * 1000
+        size = backends.model_size(model)
+        
+        # 每个模型加载后单独预热
+        try:
+            start = time.perf_counter()
+            model.predict(source=PROBE_IMAGE, imgsz=IMGSZ, save=False, device=device, verbose=False)
+            warmup = {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            logger.error(f"模型 {name} 预热失败: {str(e)}")
+            warmup = {'ok': False, 'message': f'模型预热失败: {str(e)}'}
+        
+        with self.lock:
+            self.stats[name]['loads'] += 1
+            self.stats[name]['load_ms'] = round(load_ms, 1)
+            self.stats[name]['warmup'] = warmup
+        logger.info(f"模型 {name} 已加载 ({BACKEND}): {path}, 约 {size / 1024 / 1024:.1f} MB, 耗时 {load_ms:.1f} ms")
+        return model, size
+    
+    def _evict_over_budget(self, keep):
+        """按 LRU 淘汰非固定模型，直到总大小不超过预算（调用方需持有锁）"""
+        evicted = []
+        total = sum(self.sizes[name] for name in self.loaded)
+        for name in list(self.loaded):
+            if total <= self.memory_budget:
+                break
+            if name == keep or name in self.pinned:
+                continue
+            del self.loaded[name]
+            total -= self.sizes[name]
+            self.stats[name]['evictions'] += 1
+            evicted.append(name)
+        return evicted
+    
+    def record_batch(self, name, batch_size, latency_ms):
+        with self.lock:
+            stats = self.stats[name]
+            stats['batches'] += 1
+            stats['images'] += batch_size
+            stats['last_latency_ms'] = round(latency_ms, 1)
+    
+    def model_stats(self):
+        with self.lock:
+            return {
+                name: {
+                    'path': path,
+                    'backend': BACKEND,
+                    'loaded': name in self.loaded,
+                    'pinned': name in self.pinned,
+                    'size_mb': round(self.sizes[name] / 1024 / 1024, 1) if name in self.sizes else None,
+                    **self.stats[name]
+                }
+                for name, path in self.paths.items()
+            }
+
+registry = ModelRegistry(discover_models(MODEL_DIR, os.environ.get('YOLO_MODELS', '')),
+                         MODEL_MEMORY_MB * 1024 * 1024, pinned=[DEFAULT_MODEL])
+logger.info(f"已注册模型: {', '.join(registry.paths)}, 默认模型: {DEFAULT_MODEL}")
+
+# 多进程模型推理配置（可通过环境变量覆盖）
+# WORKERS: 模型工作进程数，为 0 时在本进程内推理；大于 0 时各工作进程独立持有模型，
+#          前端进程只负责请求解析、调度与结果整理，图像经共享内存传给工作进程
+# WORKER_MAX_INFLIGHT: 每个工作进程同时排队的最大批次数
+WORKERS = int(os.environ.get('YOLO_WORKERS', '0'))
+WORKER_MAX_INFLIGHT = int(os.environ.get('YOLO_WORKER_MAX_INFLIGHT', '2'))
+worker_pool = None
+if WORKERS > 0:
+    worker_pool = model_workers.WorkerPool(WORKERS, registry.paths, BACKEND, IMGSZ, device,
+                                           preload=DEFAULT_MODEL, max_inflight=WORKER_MAX_INFLIGHT,
+                                           memory_mb=MODEL_MEMORY_MB)
 
 # 配置临时上传目录
 base_dir = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(base_dir, 'uploads')
 RESULTS_FOLDER = os.path.join(base_dir, 'results')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(RESULTS_FOLDER, exist_ok=True)
-logger.info(f"上传目录: {UPLOAD_FOLDER}")
-logger.info(f"结果目录: {RESULTS_FOLDER}")
+# 调试模式：将解码后的上传图像落盘（默认关闭，图像直接以内存数组送入推理）
+SAVE_UPLOADS = os.environ.get('YOLO_SAVE_UPLOADS', '0') == '1'
+if SAVE_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    logger.info(f"上传目录: {UPLOAD_FOLDER}")
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    """记录已提交未完成任务数的线程池（不读取线程池私有的工作队列）"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_lock = threading.Lock()
+        self.pending = 0
+    
+    def _task_done(self, future=None):
+        with self.pending_lock:
+            self.pending -= 1
+    
+    def submit(self, fn, /, *args, **kwargs):
+        with self.pending_lock:
+            self.pending += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._task_done()
+            raise
+        future.add_done_callback(self._task_done)
+        return future
 
 # 创建线程池执行器（异步处理）
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=24)
+executor = CountingExecutor(max_workers=24)
+
+# 各阶段耗时直方图的桶边界（秒）
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """固定桶边界的累计直方图（Prometheus histogram 语义）"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+class Metrics:
+    """轻量指标收集：按阶段的耗时直方图与累计计数器，以 Prometheus 文本格式导出"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = collections.defaultdict(int)
+    
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(seconds)
+    
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+    
+    def render(self, gauges):
+        """导出 Prometheus 文本格式，gauges 为 {指标名: (说明, 值)}"""
+        lines = [
+            '# HELP yolo_stage_duration_seconds 检测请求各阶段耗时',
+            '# TYPE yolo_stage_duration_seconds histogram',
+        ]
+        with self.lock:
+            stages = sorted(self.stages.items())
+            counters = sorted(self.counters.items())
+        for stage, histogram in stages:
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'yolo_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'yolo_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'yolo_stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'yolo_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+        
+        for name, value in counters:
+            lines.append(f'# TYPE yolo_{name}_total counter')
+            lines.append(f'yolo_{name}_total {value}')
+        
+        for name, (help_text, value) in gauges.items():
+            lines.append(f'# HELP yolo_{name} {help_text}')
+            lines.append(f'# TYPE yolo_{name} gauge')
+            lines.append(f'yolo_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(METRICS_BUCKETS)
+
+# 微批调度配置（可通过环境变量覆盖）
+# BATCH_MAX_SIZE: 单次前向推理最多合并的任务数
+# BATCH_MAX_WAIT_MS: 凑批时最长等待时间（毫秒），超时后立即执行当前批次
+BATCH_MAX_SIZE = int(os.environ.get('YOLO_BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('YOLO_BATCH_MAX_WAIT_MS', '10'))
+
+# 任务存储配置（可通过环境变量覆盖）
+# TASK_TTL_SECONDS: 任务结果保留时长（秒），过期后连同结果文件一起清理
+# TASK_MAX_SIZE: 最多保留的任务数，超出时淘汰最久未更新的任务
+# TASK_SWEEP_INTERVAL: 后台清理线程的扫描间隔（秒）
+TASK_TTL_SECONDS = float(os.environ.get('YOLO_TASK_TTL_SECONDS', '3600'))
+TASK_MAX_SIZE = int(os.environ.get('YOLO_TASK_MAX_SIZE', '100000'))
+TASK_SWEEP_INTERVAL = float(os.environ.get('YOLO_TASK_SWEEP_INTERVAL', '60'))
+
+def remove_files(paths):
+    """删除任务关联的文件（忽略已不存在的文件）"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"文件删除失败: {path}, {str(e)}")
+
+class TaskStore:
+    """线程安全的任务存储：按 TTL 过期、按容量淘汰，并清理任务关联的文件"""
+    
+    def __init__(self, ttl, max_size, sweep_interval):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+        # task_id -> (任务数据, 过期时间, 关联文件列表)，按最近更新时间排序
+        self.entries = collections.OrderedDict()
+        # task_id -> asyncio.Future，用于长轮询等待任务结束（不占用线程）
+        self.waiters = {}
+        self.thread = threading.Thread(target=self._sweep_loop, name='task-sweeper', daemon=True)
+        self.thread.start()
+    
+    def set(self, task_id, task, files=()):
+        """写入或更新任务，关联文件会在任务过期或被淘汰时删除"""
+        evicted = []
+        released = []
+        with self.lock:
+            old = self.entries.pop(task_id, None)
+            all_files = (old[2] if old else []) + list(files)
+            self.entries[task_id] = (task, time.monotonic() + self.ttl, all_files)
+            if task.get('status') != 'processing':
+                released.append(task_id)
+            while len(self.entries) > self.max_size:
+                old_id, (_, _, old_files) = self.entries.popitem(last=False)
+                evicted.extend(old_files)
+                released.append(old_id)
+            released = self._pop_waiters(released)
+        self._wake(released)
+        remove_files(evicted)
+    
+    def _pop_waiters(self, task_ids):
+        """取出等待这些任务的 Future（调用方需持有锁）"""
+        return [waiter for waiter in (self.waiters.pop(task_id, None) for task_id in task_ids) if waiter]
+    
+    @staticmethod
+    def _wake(waiters):
+        """唤醒等待者（任务可能在任意线程中结束，统一交给事件循环设置结果）"""
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(
+                lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+    
+    async def wait(self, task_id, timeout):
+        """等待任务结束（完成、出错或被清理）或超时，返回任务当前状态"""
+        with self.lock:
+            entry = self.entries.get(task_id)
+            if entry is None or entry[0].get('status') != 'processing':
+                return entry[0] if entry else None
+            waiter = self.waiters.get(task_id)
+            if waiter is None:
+                waiter = self.waiters[task_id] = asyncio.get_running_loop().create_future()
+        # 多个长轮询共享同一个 Future，asyncio.wait 超时不会取消它
+        await asyncio.wait([waiter], timeout=timeout)
+        return self.get(task_id)
+    
+    def __setitem__(self, task_id, task):
+        self.set(task_id, task)
+    
+    def get(self, task_id):
+        with self.lock:
+            entry = self.entries.get(task_id)
+        return entry[0] if entry else None
+    
+    def pop(self, task_id, default=None):
+        with self.lock:
+            entry = self.entries.pop(task_id, None)
+            released = self._pop_waiters([task_id])
+        self._wake(released)
+        if entry is None:
+            return default
+        remove_files(entry[2])
+        return entry[0]
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+    
+    def sweep(self):
+        """清理已过期的任务及其文件，返回清理数量"""
+        now = time.monotonic()
+        expired_ids = []
+        expired_files = []
+        with self.lock:
+            # 条目按更新时间有序，遇到未过期的即可停止
+            while self.entries:
+                task_id, (_, expires, files) = next(iter(self.entries.items()))
+                if expires > now:
+                    break
+                self.entries.popitem(last=False)
+                expired_ids.append(task_id)
+                expired_files.extend(files)
+            released = self._pop_waiters(expired_ids)
+        self._wake(released)
+        remove_files(expired_files)
+        count = len(expired_ids)
+        if count:
+            logger.info(f"已清理过期任务 {count} 个")
+        return count
+    
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"任务清理失败: {str(e)}")
+
+# 本服务写入的文件名：上传图像为 <任务ID>.jpg，旧版本的结果图像为 result_<任务ID>.jpg
+UPLOAD_FILE_PATTERN = re.compile(r'[0-9a-f]{32}\.jpg')
+RESULT_IMAGE_PATTERN = re.compile(r'result_([0-9a-f]{32})\.jpg')
 
-# 任务存储字典（用于异步结果跟踪）
-tasks = {}
+def remove_stale_files(folder, max_age, pattern):
+    """启动时清理上次运行遗留的过期文件（此时任务存储为空，无法跟踪这些文件）
+    
+    只删除文件名匹配 pattern 的文件，目录中其他文件不受影响。
+    """
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - max_age
+    stale = []
+    for entry in os.scandir(folder):
+        if pattern.fullmatch(entry.name) and entry.is_file() and entry.stat().st_mtime < cutoff:
+            stale.append(entry.path)
+    remove_files(stale)
+    if stale:
+        logger.info(f"已清理遗留文件 {len(stale)} 个: {folder}")
+
+# 结果图像已改为按需渲染，results 目录仅清理旧版本遗留的结果图像（任务已随重启丢失，无法再访问）
+remove_stale_files(UPLOAD_FOLDER, TASK_TTL_SECONDS, UPLOAD_FILE_PATTERN)
+remove_stale_files(RESULTS_FOLDER, 0, RESULT_IMAGE_PATTERN)
+
+# 任务存储（用于异步结果跟踪）
+tasks = TaskStore(TASK_TTL_SECONDS, TASK_MAX_SIZE, TASK_SWEEP_INTERVAL)
+
+# 结果推送配置（可通过环境变量覆盖）
+# LONG_POLL_MAX_SECONDS: /result 长轮询允许的最长等待时间（秒）
+# EVENTS_QUEUE_SIZE: 每个 SSE 订阅者的事件缓冲上限，消费过慢时丢弃新事件
+# EVENTS_HEARTBEAT_SECONDS: SSE 心跳间隔（秒），防止空闲连接被代理断开
+# CALLBACK_TIMEOUT / CALLBACK_RETRIES: 回调请求超时（秒）与重试次数
+# CALLBACK_ALLOWED_HOSTS: 允许的回调主机名，逗号分隔，支持 "*.example.com"；为空时允许任意主机，
+#                         但主机必须解析到公网地址（拒绝回环、内网、链路本地等地址，防止 SSRF）
+LONG_POLL_MAX_SECONDS = float(os.environ.get('YOLO_LONG_POLL_MAX_SECONDS', '60'))
+EVENTS_QUEUE_SIZE = int(os.environ.get('YOLO_EVENTS_QUEUE_SIZE', '1000'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('YOLO_EVENTS_HEARTBEAT_SECONDS', '15'))
+CALLBACK_TIMEOUT = float(os.environ.get('YOLO_CALLBACK_TIMEOUT', '10'))
+CALLBACK_RETRIES = int(os.environ.get('YOLO_CALLBACK_RETRIES', '3'))
+CALLBACK_ALLOWED_HOSTS = [host.strip().lower() for host in os.environ.get('YOLO_CALLBACK_ALLOWED_HOSTS', '').split(',')
+                          if host.strip()]
+
+class TaskEvents:
+    """任务完成事件广播：每个 SSE 订阅者持有一个有界的 asyncio 队列"""
+    
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = set()
+    
+    def subscribe(self):
+        """在事件循环中调用，返回订阅者队列"""
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+    
+    def publish(self, payload):
+        """可在任意线程调用，事件由事件循环投递到各订阅者队列"""
+        with self.lock:
+            if not self.subscribers:
+                return
+        event_loop.call_soon_threadsafe(self._deliver, payload)
+    
+    def _deliver(self, payload):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(payload)
+            except asyncio.QueueFull:
+                logger.warning(f"SSE 订阅者消费过慢，丢弃事件: {payload['task_id']}")
+
+events = TaskEvents(EVENTS_QUEUE_SIZE)
+
+# 回调线程池（与推理后处理线程池分开，避免慢回调占用后处理线程）
+callback_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+def task_payload(task_id, task):
+    """构造对外返回的任务状态（/result、SSE 与回调共用）"""
+    if task['status'] == 'processing':
+        return {
+            'task_id': task_id,
+            'status': 'processing',
+            'message': '任务处理中，请稍后查询'
+        }
+    
+    if task['status'] == 'error':
+        payload = {
+            'task_id': task_id,
+            'status': 'error',
+            'message': task['message']
+        }
+    else:
+        payload = {
+            'task_id': task_id,
+            'status': 'completed',
+            'result': task['result']
+        }
+    if 'server_ms' in task:
+        payload['server_ms'] = task['server_ms']
+    return payload
 
-def process_detection(task_id, upload_path, conf, iou, max_det):
-    """异步处理图像检测任务"""
+def validate_callback_url(callback_url):
+    """校验回调地址：仅允许 http(s)；配置了 CALLBACK_ALLOWED_HOSTS 时主机需在列表中，
+    否则主机解析出的所有地址都必须是公网地址。不合法时抛出 ValueError（会做 DNS 解析，勿在事件循环中调用）"""
+    parsed = urllib.parse.urlsplit(callback_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('callback_url 必须为 http(s) 地址')
+    host = parsed.hostname.lower()
+    if CALLBACK_ALLOWED_HOSTS:
+        if not any(host == allowed or (allowed.startswith('*.') and host.endswith(allowed[1:]))
+                   for allowed in CALLBACK_ALLOWED_HOSTS):
+            raise ValueError(f'callback_url 主机不在允许列表中: {host}')
+        return
     try:
-        # 执行预测
-        results = model.predict(
-            source=upload_path,
+        infos = socket.getaddrinfo(host, parsed.port or (443 if parsed.scheme == 'https' else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f'callback_url 主机无法解析: {host}') from e
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_global:
+            raise ValueError(f'callback_url 不能指向内网或本机地址: {host}')
+
+def post_callback(callback_url, payload):
+    """向调用方提供的 callback_url 推送任务结果（失败时退避重试）
+    
+    发送前重新校验地址（防止提交后 DNS 指向变化），且不跟随重定向。
+    """
+    for attempt in range(1, CALLBACK_RETRIES + 1):
+        try:
+            validate_callback_url(callback_url)
+        except ValueError as e:
+            logger.error(f"回调地址不合法, 放弃推送: {callback_url}, {str(e)}")
+            return
+        try:
+            response = requests.post(callback_url, json=payload, timeout=CALLBACK_TIMEOUT, allow_redirects=False)
+            if response.status_code < 500:
+                return
+            logger.warning(f"回调返回错误 {response.status_code}: {callback_url} (第 {attempt} 次)")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"回调请求失败: {callback_url}, {str(e)} (第 {attempt} 次)")
+        # 最后一次失败后不再等待
+        if attempt < CALLBACK_RETRIES:
+            time.sleep(min(2 ** attempt, 30))
+    logger.error(f"回调最终失败: {callback_url}, 任务 {payload['task_id']}")
+
+def complete_task(task_id, task):
+    """写入任务最终状态，唤醒长轮询，并推送 SSE 事件与回调"""
+    previous = tasks.get(task_id)
+    callback_url = previous.get('callback_url') if previous else None
+    
+    metrics.inc('tasks_completed' if task['status'] == 'completed' else 'tasks_failed')
+    if previous and previous.get('status') == 'processing':
+        metrics.inc('tasks_finished')
+        if 'submitted_at' in previous:
+            # 服务端耗时（提交到结束），随结果返回给客户端
+            elapsed = time.perf_counter() - previous['submitted_at']
+            metrics.observe('total', elapsed)
+            task['server_ms'] = round(elapsed * 1000, 2)
+    
+    tasks[task_id] = task
+    admission.release(task_id)
+    
+    payload = task_payload(task_id, task)
+    events.publish(payload)
+    if callback_url:
+        callback_executor.submit(post_callback, callback_url, payload)
+
+# 结果图像渲染配置（可通过环境变量覆盖），结果图像仅在 /result_image 请求时渲染
+# RENDER_CACHE_MB: 已渲染结果图像的缓存上限（MB）
+# RENDER_SOURCE_MB: 待渲染数据（原始上传图像字节与检测框）的保留上限（MB），超出时按 LRU 淘汰，
+#                   被淘汰任务的 /result_image 返回 404（检测结果不受影响）
+RENDER_CACHE_MB = float(os.environ.get('YOLO_RENDER_CACHE_MB', '256'))
+RENDER_SOURCE_MB = float(os.environ.get('YOLO_RENDER_SOURCE_MB', '512'))
+
+class RenderCache:
+    """按字节数限制容量的 LRU 缓存，存放已渲染的结果图像（JPEG 字节）或待渲染数据
+    
+    sizeof 返回条目占用的字节数，默认为 len（JPEG 字节）。
+    """
+    
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+    
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+    
+    def put(self, key, data):
+        size = self.sizeof(data)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= self.sizeof(old)
+            self.entries[key] = data
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+def render_source_size(render_source):
+    image_data, boxes_data, _ = render_source
+    return len(image_data) + boxes_data.nbytes
+
+render_cache = RenderCache(int(RENDER_CACHE_MB * 1024 * 1024))
+# 待渲染数据不放在任务存储中（任务按 TTL 保留），单独按字节数限制
+render_sources = RenderCache(int(RENDER_SOURCE_MB * 1024 * 1024), sizeof=render_source_size)
+
+# 检测结果缓存配置（可通过环境变量覆盖）
+# RESULT_CACHE_MB: 内存缓存上限（MB），为 0 时关闭结果缓存
+# RESULT_CACHE_DIR: 可选的磁盘缓存目录，内存未命中时再查磁盘
+# RESULT_CACHE_DISK_MB: 磁盘缓存上限（MB），超出后按修改时间淘汰最旧的文件
+RESULT_CACHE_MB = float(os.environ.get('YOLO_RESULT_CACHE_MB', '64'))
+RESULT_CACHE_DIR = os.environ.get('YOLO_RESULT_CACHE_DIR', '')
+RESULT_CACHE_DISK_MB = float(os.environ.get('YOLO_RESULT_CACHE_DISK_MB', '1024'))
+
+def image_cache_key(img, conf, iou, max_det, model_name, tiling=None, output_format=None):
+    """以解码后的像素内容与检测参数、模型（以及切片参数、输出格式）计算缓存键"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(img).data)
+    digest.update(f'{img.shape}|{conf}|{iou}|{max_det}|{model_name}|{tiling}|{output_format}'.encode('utf-8'))
+    return digest.hexdigest()
+
+class ResultCache:
+    """内容寻址的检测结果缓存：内存 LRU（按估算字节数限制）+ 可选磁盘层"""
+    
+    # 单个检测结果序列化后的估算字节数
+    DETECTION_BYTES = 200
+    
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_size = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_size = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.is_file())
+            logger.info(f"结果磁盘缓存目录: {self.disk_dir}")
+    
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+    
+    def _entry_size(self, detections, boxes_data, names):
+        # 检测数按框数计（列式格式的 detections 为字段字典）；类别名为同一模型共享的对象，不计入
+        return len(boxes_data) * self.DETECTION_BYTES + boxes_data.nbytes + 64
+    
+    def get(self, key):
+        """返回 (detections, boxes_data, names)，未命中返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        
+        entry = self._disk_get(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._memory_put(key, entry)
+        return entry
+    
+    def put(self, key, detections, boxes_data, names):
+        # 类别名随结果缓存，命中时无需再向模型注册表查询（可能触发模型加载）
+        entry = (detections, boxes_data, names)
+        self._memory_put(key, entry)
+        if self.disk_dir:
+            self._disk_put(key, entry)
+    
+    def _memory_put(self, key, entry):
+        size = self._entry_size(*entry)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= self._entry_size(*old)
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= self._entry_size(*evicted)
+    
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+    
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # JSON 对象的键为字符串，类别名的键还原为整数类别号
+            names = {int(cls): name for cls, name in data['names'].items()}
+            # 命中时刷新修改时间，按修改时间淘汰即按最近访问淘汰（LRU）
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return data['detections'], np.asarray(data['boxes'], dtype=np.float32).reshape(-1, 6), names
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+    
+    def _disk_put(self, key, entry):
+        detections, boxes_data, names = entry
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'detections': detections, 'boxes': boxes_data.tolist(), 'names': names}, f)
+            size = os.path.getsize(tmp_path)
+            # 覆盖已有条目时只计入大小的差值
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"结果磁盘缓存写入失败: {str(e)}")
+            return
+        with self.lock:
+            self.disk_size += size - old_size
+            over_budget = self.disk_size > self.disk_max_bytes
+        if over_budget:
+            self._disk_evict()
+    
+    def _disk_evict(self):
+        """磁盘缓存超限时按修改时间删除最旧的文件，直到降到上限的 90%"""
+        files = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        total = sum(entry.stat().st_size for entry in files)
+        target = self.disk_max_bytes * 0.9
+        removed = []
+        for entry in files:
+            if total <= target:
+                break
+            total -= entry.stat().st_size
+            removed.append(entry.path)
+        remove_files(removed)
+        with self.lock:
+            self.disk_size = total
+    
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'disk_bytes': self.disk_size if self.disk_dir else None
+            }
+
+result_cache = ResultCache(int(RESULT_CACHE_MB * 1024 * 1024), RESULT_CACHE_DIR,
+                           int(RESULT_CACHE_DISK_MB * 1024 * 1024))
+
+def render_result_image(render_source):
+    """根据保存的原始图像与检测框渲染结果图像，返回 JPEG 字节"""
+    image_data, boxes_data, names = render_source
+    with metrics.timer('render_decode'):
+        img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    with metrics.timer('plot'):
+        result = Results(img, path='', names=names, boxes=torch.from_numpy(boxes_data))
+        annotated_img = result.plot()
+        annotated_img_bgr = cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR)
+    with metrics.timer('jpeg_encode'):
+        success, encoded = cv2.imencode('.jpg', annotated_img_bgr)
+    if not success:
+        raise RuntimeError('结果图像编码失败')
+    return encoded.tobytes()
+
+# 准入控制配置（可通过环境变量覆盖）
+# QUEUE_MAX_DEPTH: 已接收未完成的检测任务上限，超出后 /detect 返回 429
+# BULK_QUEUE_FRACTION: bulk 优先级任务最多占用的队列比例，剩余容量留给 interactive 请求
+QUEUE_MAX_DEPTH = int(os.environ.get('YOLO_QUEUE_MAX_DEPTH', '256'))
+BULK_QUEUE_FRACTION = float(os.environ.get('YOLO_BULK_QUEUE_FRACTION', '0.75'))
+
+# 优先级类别：数值越小越先被调度
+PRIORITY_CLASSES = {'interactive': 0, 'bulk': 1}
+PRIORITY_INTERACTIVE = PRIORITY_CLASSES['interactive']
+
+class DeadlineExceeded(Exception):
+    """任务在推理前已超过截止时间"""
+
+class AdmissionController:
+    """检测任务准入控制：限制在途任务数，并根据观测到的服务时间估算 Retry-After"""
+    
+    # 单图服务时间的指数滑动平均系数
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, max_depth, bulk_fraction):
+        self.max_depth = max(1, max_depth)
+        self.bulk_limit = max(1, int(self.max_depth * bulk_fraction))
+        self.lock = threading.Lock()
+        self.admitted = set()
+        self.per_image_seconds = None
+    
+    def try_acquire(self, task_id, priority):
+        """尝试为任务占用一个队列位置，队列已满时返回 False"""
+        limit = self.max_depth if priority == PRIORITY_INTERACTIVE else self.bulk_limit
+        with self.lock:
+            if len(self.admitted) >= limit:
+                return False
+            self.admitted.add(task_id)
+            return True
+    
+    def release(self, task_id):
+        with self.lock:
+            self.admitted.discard(task_id)
+    
+    @property
+    def in_flight(self):
+        with self.lock:
+            return len(self.admitted)
+    
+    def observe_batch(self, batch_size, seconds):
+        """记录一次批推理的耗时，更新单图服务时间估计"""
+        per_image = seconds / max(1, batch_size)
+        with self.lock:
+            if self.per_image_seconds is None:
+                self.per_image_seconds = per_image
+            else:
+                self.per_image_seconds += self.EWMA_ALPHA * (per_image - self.per_image_seconds)
+    
+    def retry_after(self):
+        """按当前在途任务数与单图服务时间估算排空队列所需的秒数"""
+        with self.lock:
+            per_image = self.per_image_seconds or 0.1
+            return max(1, math.ceil(len(self.admitted) * per_image))
+
+admission = AdmissionController(QUEUE_MAX_DEPTH, BULK_QUEUE_FRACTION)
+
+class BatchScheduler:
+    """动态微批调度器：按优先级聚合待处理任务，合并为一次批量前向推理后按任务拆分结果"""
+    
+    def __init__(self, model_name, max_batch_size, max_wait_ms):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        # 按 (优先级, 提交序号) 排序，同一优先级内先进先出；队列只在事件循环中访问
+        self.queue = asyncio.PriorityQueue()
+        self.sequence = itertools.count()
+        # 前向推理在专用的单线程执行器中进行，事件循环只负责凑批与派发
+        self.inference_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f'inference-{model_name}')
+        # 最近一次真实推理的时间戳（time.time()）、耗时与批大小，用于就绪检查
+        self.last_inference_time = None
+        self.last_latency_ms = None
+        self.last_batch_size = 0
+        self.last_error = None
+        self.task = asyncio.run_coroutine_threadsafe(self._run(), event_loop)
+    
+    @property
+    def alive(self):
+        return not self.task.done()
+    
+    def submit(self, source, conf, iou, max_det, callback, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """提交推理请求到待处理队列（可在任意线程调用）
+        
+        推理结束后调用 callback(result, error)（在事件循环或工作进程结果线程中），
+        回调需保持轻量，耗时的后处理应转交给其他线程。deadline 为 time.monotonic() 时间，
+        到期仍未推理的请求直接以 DeadlineExceeded 回调，不再推理。
+        """
+        item = (source, conf, iou, max_det, callback, time.perf_counter(), deadline)
+        event_loop.call_soon_threadsafe(self.queue.put_nowait, (priority, next(self.sequence), item))
+    
+    async def _collect(self):
+        """等待第一个任务，之后在最大等待时间内凑满一批"""
+        batch = [(await self.queue.get())[2]]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append((await asyncio.wait_for(self.queue.get(), remaining))[2])
+                else:
+                    batch.append(self.queue.get_nowait()[2])
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+        return batch
+    
+    def _drop_expired(self, batch):
+        """丢弃已超过截止时间的请求，返回仍需推理的请求"""
+        now = time.monotonic()
+        alive = []
+        for item in batch:
+            if item[6] is not None and now > item[6]:
+                metrics.inc('deadline_dropped')
+                try:
+                    item[4](None, DeadlineExceeded('任务已超过截止时间'))
+                except Exception as e:
+                    logger.error(f"推理结果回调出错: {str(e)}")
+            else:
+                alive.append(item)
+        return alive
+    
+    def _predict(self, sources, conf, iou, max_det):
+        # 模型按需懒加载
+        model = registry.get(self.model_name)
+        return model.predict(
+            source=sources,
             conf=conf,
             iou=iou,
             max_det=max_det,
+            batch=len(sources),
+            imgsz=IMGSZ,
             save=False,
             show_labels=True,
             show_conf=True,
             line_width=3,
-            device=device  # 确保使用指定设备
+            device=device,  # 确保使用指定设备
+            verbose=False
         )
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._drop_expired(await self._collect())
+            if not batch:
+                continue
+            start = time.perf_counter()
+            for item in batch:
+                metrics.observe('queue_wait', start - item[5])
+            
+            # 使用本批最宽松的参数推理，各任务的参数在后处理中单独应用
+            sources = [item[0] for item in batch]
+            conf = min(item[1] for item in batch)
+            iou = max(item[2] for item in batch)
+            max_det = max(item[3] for item in batch)
+            
+            if worker_pool is not None:
+                # 交给工作进程推理（所有进程繁忙时在执行器中等待，后续请求继续在队列中凑批）
+                try:
+                    await loop.run_in_executor(
+                        self.inference_executor, worker_pool.submit, self.model_name, sources, conf, iou, max_det,
+                        lambda output, error, batch=batch, start=start: self._worker_done(batch, start, output, error))
+                except Exception as e:
+                    self._complete(batch, start, None, e)
+                continue
+            
+            try:
+                results = await loop.run_in_executor(self.inference_executor, self._predict,
+                                                     sources, conf, iou, max_det)
+            except Exception as e:
+                self._complete(batch, start, None, e)
+                continue
+            self._complete(batch, start, results, None)
+    
+    def _worker_done(self, batch, start, output, error):
+        """工作进程批次结束：还原结果失败时整批以错误结束"""
+        results = None
+        if error is None:
+            try:
+                results = self._worker_results(batch, output)
+            except Exception as e:
+                error = e
+        self._complete(batch, start, results, error)
+    
+    def _worker_results(self, batch, output):
+        """由工作进程返回的检测框还原为 Results（原图仍使用前端进程中的图像）"""
+        if output is None:
+            return None
+        results = []
+        for item, boxes, speed in zip(batch, output['boxes'], output['speed']):
+            result = Results(item[0], path='', names=output['names'], boxes=torch.from_numpy(boxes))
+            result.speed = speed
+            results.append(result)
+        return results
+    
+    def _complete(self, batch, start, results, error):
+        """记录批次统计并按任务拆分结果，回调各任务"""
+        if error is not None:
+            self.last_error = str(error)
+            logger.error(f"批次推理出错 ({len(batch)} 个任务): {str(error)}")
+            for item in batch:
+                try:
+                    item[4](None, error)
+                except Exception as e:
+                    logger.error(f"推理结果回调出错: {str(e)}")
+            return
+        
+        self.last_inference_time = time.time()
+        self.last_latency_ms = (time.perf_counter() - start) * 1000
+        self.last_batch_size = len(batch)
+        self.last_error = None
+        registry.record_batch(self.model_name, len(batch), self.last_latency_ms)
+        admission.observe_batch(len(batch), self.last_latency_ms / 1000)
+        metrics.observe('batch_inference', self.last_latency_ms / 1000)
+        metrics.inc('batches')
+        metrics.inc('batch_images', len(batch))
+        
+        # ultralytics 按图像记录了预处理、前向与 NMS 的耗时（毫秒）
+        for result in results:
+            speed = getattr(result, 'speed', None) or {}
+            for key, stage in (('preprocess', 'preprocess'), ('inference', 'forward'), ('postprocess', 'nms')):
+                if speed.get(key) is not None:
+                    metrics.observe(stage, speed[key] / 1000)
+        logger.info(f"批次推理完成 ({self.model_name}): {len(batch)} 个任务, 耗时 {self.last_latency_ms:.1f} ms")
+        
+        # 按任务拆分结果
+        for item, result in zip(batch, results):
+            try:
+                item[4](result, None)
+            except Exception as e:
+                logger.error(f"推理结果回调出错: {str(e)}")
+                # 以错误回调结束该任务（释放准入名额），避免任务一直处于处理中
+                try:
+                    item[4](None, e)
+                except Exception as e:
+                    logger.error(f"推理结果错误回调出错: {str(e)}")
+
+# 默认输出格式：(检测列表格式, 是否附带像素 xyxy 坐标)
+DEFAULT_OUTPUT_FORMAT = ('list', False)
+
+schedulers = {}
+schedulers_lock = threading.Lock()
+
+def get_scheduler(model_name):
+    """返回模型对应的微批调度器（每个模型一个调度协程，按需创建）"""
+    with schedulers_lock:
+        scheduler = schedulers.get(model_name)
+        if scheduler is None:
+            # 固定 batch 维度的导出模型（TorchScript）只能逐张推理
+            max_batch_size = min(BATCH_MAX_SIZE, backends.max_batch_size(BACKEND) or BATCH_MAX_SIZE)
+            scheduler = schedulers[model_name] = BatchScheduler(model_name, max_batch_size, BATCH_MAX_WAIT_MS)
+        return scheduler
+
+def submit_detection(task_id, model_name, img, conf, iou, max_det, image_data=None, cache_key=None,
+                     priority=PRIORITY_INTERACTIVE, deadline=None, tiling=None, output_format=DEFAULT_OUTPUT_FORMAT):
+    """将检测任务提交到微批调度器，推理完成后交给线程池做后处理
+    
+    tiling 为 (切片边长, 重叠比例) 时按切片推理并在原图坐标系中合并结果。
+    """
+    def on_inference_done(result, error):
+        if error is not None:
+            complete_task(task_id, {
+                'status': 'error',
+                'message': f'处理失败: {str(error)}'
+            })
+            return
+        executor.submit(process_detection, task_id, result, conf, iou, max_det, image_data, cache_key,
+                        output_format)
+    
+    if tiling is not None:
+        TiledDetection(model_name, img, tiling[0], tiling[1], conf, iou, max_det, on_inference_done,
+                       priority, deadline).start()
+        return
+    get_scheduler(model_name).submit(img, conf, iou, max_det, on_inference_done, priority, deadline)
+
+# 切片推理配置（可通过环境变量覆盖，请求中 tile=1 时启用）
+# TILE_SIZE: 默认切片边长（像素）
+# TILE_OVERLAP: 默认相邻切片的重叠比例，避免目标被切片边界截断
+# TILE_MAX_INFLIGHT: 单个任务同时在推理中的最大切片数，限制峰值内存
+TILE_SIZE = int(os.environ.get('YOLO_TILE_SIZE', str(IMGSZ)))
+TILE_OVERLAP = float(os.environ.get('YOLO_TILE_OVERLAP', '0.2'))
+TILE_MAX_INFLIGHT = int(os.environ.get('YOLO_TILE_MAX_INFLIGHT', str(BATCH_MAX_SIZE * 2)))
+
+def tile_starts(length, tile_size, step):
+    """单个维度上的切片起点，最后一个切片贴齐图像边缘"""
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, step))
+    starts.append(length - tile_size)
+    return starts
+
+def iter_tiles(img, tile_size, overlap):
+    """按行优先顺序生成 (x0, y0, 切片视图)，切片为原图的视图，不复制像素"""
+    step = max(1, int(tile_size * (1 - overlap)))
+    height, width = img.shape[:2]
+    for y0 in tile_starts(height, tile_size, step):
+        for x0 in tile_starts(width, tile_size, step):
+            yield x0, y0, img[y0:y0 + tile_size, x0:x0 + tile_size]
+
+class TiledDetection:
+    """切片推理：切片分批提交到微批调度器，在途切片数受限；检测框平移回原图坐标后做跨切片 NMS
+    
+    每个切片完成后才提交下一个切片，因此同时存在的预处理张量与推理结果只与在途切片数有关，
+    与原图尺寸无关。所有切片完成后以合并后的结果调用 callback(result, error)。
+    """
+    
+    def __init__(self, model_name, img, tile_size, overlap, conf, iou, max_det, callback,
+                 priority=PRIORITY_INTERACTIVE, deadline=None):
+        self.scheduler = get_scheduler(model_name)
+        self.img = img
+        self.tiles = iter_tiles(img, tile_size, overlap)
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.callback = callback
+        self.priority = priority
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.exhausted = False
+        self.failed = False
+        self.finished = False
+        self.boxes = []
+        self.names = None
+        self.tile_count = 0
+    
+    def start(self):
+        for _ in range(max(1, TILE_MAX_INFLIGHT)):
+            if not self._submit_next():
+                break
+    
+    def _submit_next(self):
+        """提交下一个切片，没有剩余切片（或任务已失败）时返回 False"""
+        with self.lock:
+            if self.failed or self.exhausted:
+                return False
+            tile = next(self.tiles, None)
+            if tile is None:
+                self.exhausted = True
+                return False
+            self.inflight += 1
+            self.tile_count += 1
+        x0, y0, tile_img = tile
+        self.scheduler.submit(tile_img, self.conf, self.iou, self.max_det,
+                              lambda result, error: self._on_tile_done(x0, y0, result, error),
+                              self.priority, self.deadline)
+        return True
+    
+    def _on_tile_done(self, x0, y0, result, error):
+        if error is not None:
+            with self.lock:
+                self.inflight -= 1
+                first_error = not self.failed
+                self.failed = True
+            if first_error:
+                self.callback(None, error)
+            return
+        
+        # 只保留检测框数据（平移到原图坐标），切片图像与结果对象随即释放
+        boxes = result.boxes.data if result.boxes is not None else None
+        if boxes is not None and len(boxes):
+            boxes = boxes[boxes[:, 4] >= self.conf].clone()
+            boxes[:, [0, 2]] += x0
+            boxes[:, [1, 3]] += y0
+        with self.lock:
+            self.inflight -= 1
+            if self.failed:
+                return
+            self.names = result.names
+            if boxes is not None and len(boxes):
+                self.boxes.append(boxes)
+        
+        self._submit_next()
+        with self.lock:
+            done = self.exhausted and self.inflight == 0 and not self.finished
+            self.finished = self.finished or done
+        if done:
+            # 合并与跨切片 NMS 放到后处理线程池，不占用事件循环
+            executor.submit(self._finish)
+    
+    def _finish(self):
+        try:
+            result = self._merge()
+        except Exception as e:
+            self.callback(None, e)
+            return
+        self.callback(result, None)
+    
+    def _merge(self):
+        if self.boxes:
+            boxes = torch.cat(self.boxes)
+            keep = torchvision.ops.batched_nms(boxes[:, :4], boxes[:, 4], boxes[:, 5], self.iou)
+            boxes = boxes[keep[:self.max_det]]
+        else:
+            boxes = torch.zeros((0, 6))
+        metrics.inc('tiles', self.tile_count)
+        return Results(self.img, path='', names=self.names, boxes=boxes.cpu())
+
+def completed_task(task_id, detections, boxes_data, names, image_data=None):
+    """构造已完成任务；结果图像在 /result_image 请求时再渲染，这里只保留渲染所需的数据（受 RENDER_SOURCE_MB 限制）"""
+    task = {
+        'status': 'completed',
+        'result': {
+            'result_image': None,
+            'detections': detections
+        }
+    }
+    if image_data is not None:
+        filename = f"result_{task_id}.jpg"
+        render_sources.put(filename, (image_data, boxes_data, names))
+        task['result']['result_image'] = filename  # 仅返回文件名，不包含路径
+    return task
+
+def process_detection(task_id, result, conf, iou, max_det, image_data=None, cache_key=None,
+                      output_format=DEFAULT_OUTPUT_FORMAT):
+    """处理单个任务的推理结果（过滤、序列化、写入结果缓存），image_data 为空时不提供结果图像"""
+    try:
+        with metrics.timer('filter'):
+            result = filter_result(result, conf, iou, max_det)
         
         # 处理检测结果
-        detections = []
-        if results[0].boxes is not None:
-            boxes = results[0].boxes.cpu().numpy()
-            for box in boxes:
-                detections.append({
-                    "class": int(box.cls[0]),
-                    "class_name": results[0].names[int(box.cls[0])],
-                    "confidence": float(box.conf[0]),
-                    "bbox": box.xywhn[0].tolist()
-                })
-        
-        # 生成结果图像
-        result_filename = f"result_{task_id}.jpg"
-        result_path = os.path.join(RESULTS_FOLDER, result_filename)
-        
-        for r in results:
-            annotated_img = r.plot()
-            annotated_img_bgr = cv2.cvtColor(annotated_img, cv2.COLOR_RGB2BGR)
-            success = cv2.imwrite(result_path, annotated_img_bgr)
-            if not success:
-                logger.error(f"图片保存失败: {result_path}")
+        with metrics.timer('serialize'):
+            detections = format_detections(result, *output_format)
+        
+        boxes_data = None
+        if image_data is not None or cache_key is not None:
+            boxes_data = result.boxes.data.cpu().numpy() if result.boxes is not None else np.zeros((0, 6), np.float32)
+        if cache_key is not None:
+            result_cache.put(cache_key, detections, boxes_data, result.names)
         
         # 更新任务状态为完成
-        tasks[task_id] = {
-            'status': 'completed',
-            'result': {
-                'result_image': result_filename,  # 仅返回文件名，不包含路径
-                'detections': detections
-            }
-        }
+        complete_task(task_id, completed_task(task_id, detections, boxes_data, result.names, image_data))
         logger.info(f"任务 {task_id} 处理完成")
         
     except Exception as e:
         # 更新任务状态为错误
         error_msg = f'处理失败: {str(e)}'
-        tasks[task_id] = {
+        complete_task(task_id, {
             'status': 'error',
             'message': error_msg
-        }
+        })
         logger.error(f"任务 {task_id} 出错: {error_msg}")
 
-@app.route('/detect', methods=['POST'])
-def detect_objects():
-    """异步对象检测端点"""
+def parse_bool(value, default):
+    """解析布尔参数（兼容 JSON 布尔值与查询串/表单中的字符串）"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no', 'off', '')
+    return bool(value)
+
+def parse_output_format(params):
+    """解析输出格式参数：format 为 list（每个目标一个字典，默认）或 columnar（并列数组），
+    xyxy 为真时额外返回像素坐标的 bbox_xyxy"""
+    detection_format = params.get('format') or 'list'
+    if detection_format not in DETECTION_FORMATS:
+        raise ValueError(f"format 仅支持: {', '.join(DETECTION_FORMATS)}")
+    return detection_format, parse_bool(params.get('xyxy'), False)
+
+def request_content_type(request):
+    return request.headers.get('content-type', '').split(';')[0].strip().lower()
+
+def parse_json_image(body):
+    """解析 base64-in-JSON 请求体，返回 (编码图像字节, 参数字典)"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'image_base64' not in data:
+        raise ValueError('No base64 image provided')
+    
+    base64_str = data['image_base64']
+    if 'base64,' in base64_str:
+        base64_str = base64_str.split('base64,')[-1]
+    return base64.b64decode(base64_str), data
+
+async def read_detect_request(request):
+    """解析检测请求，返回 (编码图像字节, 参数字典)
+    
+    支持三种请求格式：
+    - JSON: {"image_base64": ..., "conf": ...}
+    - 原始图像请求体: Content-Type 为 image/jpeg、image/png 等，参数放在查询串中
+    - multipart 表单: 图像放在 image 文件字段，参数放在表单字段或查询串中
+    请求体异步接收，不占用线程；base64 解码等 CPU 操作放到线程池中执行。
+    """
+    content_type = request_content_type(request)
+    params = dict(request.query_params)
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        img_data = await request.body()
+        if not img_data:
+            raise ValueError('No image provided')
+        return img_data, params
+    
+    if content_type == 'multipart/form-data':
+        form = await request.form()
+        image_file = form.get('image')
+        if image_file is None or isinstance(image_file, str):
+            raise ValueError('No image file provided')
+        params.update({key: value for key, value in form.items() if isinstance(value, str)})
+        return await image_file.read(), params
+    
     # 检查JSON数据中是否包含base64图像
-    data = request.get_json()
-    if not data or 'image_base64' not in data:
-        return jsonify({'error': 'No base64 image provided'}), 400
+    body = await request.body()
+    return await asyncio.get_running_loop().run_in_executor(executor, parse_json_image, body)
+
+def decode_image(img_data):
+    """直接从请求缓冲区解码图像"""
+    with metrics.timer('decode'):
+        img = cv2.imdecode(np.frombuffer(img_data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('图像解码失败')
+    return img
+
+def lookup_result_cache(img, conf, iou, max_det, model_name, tiling, output_format):
+    """计算缓存键并查询结果缓存，返回 (缓存键, 缓存结果或 None)"""
+    with metrics.timer('cache_lookup'):
+        cache_key = image_cache_key(img, conf, iou, max_det, model_name, tiling, output_format)
+        return cache_key, result_cache.get(cache_key)
+
+def throttled_response(retry_after):
+    response = JSONResponse({'error': '服务繁忙，请稍后重试', 'retry_after': retry_after}, status_code=429)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.post('/detect')
+async def detect_objects(request: Request):
+    """异步对象检测端点（支持 base64 JSON、原始图像与 multipart 上传）"""
+    loop = asyncio.get_running_loop()
+    try:
+        with metrics.timer('request_parse'):
+            img_data, params = await read_detect_request(request)
+    except Exception as e:
+        metrics.inc('requests_rejected')
+        logger.error(f"无效的检测请求: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=400)
     
     # 生成唯一任务ID
     task_id = uuid.uuid4().hex
-    tasks[task_id] = {'status': 'processing'}
-    logger.info(f"新任务提交: {task_id}")
     
-    # 获取请求参数（带默认值）
-    conf = float(data.get('conf', 0.1))
-    iou = float(data.get('iou', 0.1))
-    max_det = int(data.get('max_det', 10))
-    
-    # 解码Base64图像
     try:
-        base64_str = data['image_base64']
-        if 'base64,' in base64_str:
-            base64_str = base64_str.split('base64,')[-1]
+        # 获取请求参数（带默认值）
+        conf = float(params.get('conf', 0.1))
+        iou = float(params.get('iou', 0.1))
+        max_det = int(params.get('max_det', 10))
+        render = parse_bool(params.get('render'), True)  # 为 False 时不提供结果图像
+        output_format = parse_output_format(params)
+        try:
+            model_name = registry.resolve(params.get('model'))
+        except KeyError:
+            raise ValueError(f"未知模型: {params.get('model')}，可用模型: {', '.join(registry.paths)}")
+        
+        # 优先级（interactive/bulk）与可选的截止时间（相对提交时刻的毫秒数）
+        priority_name = params.get('priority') or 'interactive'
+        if priority_name not in PRIORITY_CLASSES:
+            raise ValueError(f"priority 仅支持: {', '.join(PRIORITY_CLASSES)}")
+        priority = PRIORITY_CLASSES[priority_name]
+        timeout_ms = params.get('timeout_ms')
+        deadline = time.monotonic() + float(timeout_ms) / 1000 if timeout_ms not in (None, '') else None
+        
+        # 可选的切片推理（大图小目标），tile_size 与 tile_overlap 可按请求覆盖
+        tiling = None
+        if parse_bool(params.get('tile'), False):
+            tile_size = int(params.get('tile_size') or TILE_SIZE)
+            tile_overlap = float(params.get('tile_overlap') or TILE_OVERLAP)
+            if tile_size < 32:
+                raise ValueError('tile_size 不能小于 32')
+            if not 0 <= tile_overlap < 1:
+                raise ValueError('tile_overlap 必须在 [0, 1) 范围内')
+            tiling = (tile_size, tile_overlap)
         
-        img_data = base64.b64decode(base64_str)
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # 可选回调地址：任务结束后服务端将结果 POST 到该地址
+        processing = {'status': 'processing', 'submitted_at': time.perf_counter()}
+        callback_url = params.get('callback_url')
+        if callback_url:
+            await loop.run_in_executor(executor, validate_callback_url, callback_url)
+            processing['callback_url'] = callback_url
         
-        # 保存解码后的图像
-        filename = f"{task_id}.jpg"
-        upload_path = os.path.join(UPLOAD_FOLDER, filename)
-        cv2.imwrite(upload_path, img)
-        logger.info(f"图片保存到: {upload_path}")
+        # 准入控制：队列已满时拒绝，避免排队任务与解码后的图像无限堆积
+        if not admission.try_acquire(task_id, priority):
+            retry_after = admission.retry_after()
+            metrics.inc('requests_throttled')
+            logger.warning(f"队列已满, 拒绝任务 ({priority_name}), 建议 {retry_after} 秒后重试")
+            return throttled_response(retry_after)
+        tasks[task_id] = processing
+        logger.info(f"新任务提交: {task_id}")
         
-        # 提交异步任务
-        executor.submit(process_detection, task_id, upload_path, conf, iou, max_det)
+        img = await loop.run_in_executor(executor, decode_image, img_data)
         
-        return jsonify({
+        # 调试模式下保存解码后的图像
+        if SAVE_UPLOADS:
+            upload_path = os.path.join(UPLOAD_FOLDER, f"{task_id}.jpg")
+            with metrics.timer('upload_write'):
+                await loop.run_in_executor(executor, cv2.imwrite, upload_path, img)
+            tasks.set(task_id, processing, files=[upload_path])
+            logger.info(f"图片保存到: {upload_path}")
+        
+        metrics.inc('requests_accepted')
+        image_data = img_data if render else None
+        
+        # 相同图像与参数的结果直接从缓存返回，不再推理
+        cache_key = None
+        if result_cache.enabled:
+            cache_key, cached = await loop.run_in_executor(
+                executor, lookup_result_cache, img, conf, iou, max_det, model_name, tiling, output_format)
+            if cached is not None:
+                metrics.inc('result_cache_hits')
+                detections, boxes_data, names = cached
+                task = completed_task(task_id, detections, boxes_data, names, image_data)
+                complete_task(task_id, task)
+                logger.info(f"任务 {task_id} 命中结果缓存")
+                return JSONResponse(task_payload(task_id, task))
+            metrics.inc('result_cache_misses')
+        
+        # 解码后的图像数组直接提交到微批调度器
+        submit_detection(task_id, model_name, img, conf, iou, max_det, image_data, cache_key,
+                         priority, deadline, tiling, output_format)
+        
+        return JSONResponse({
             'task_id': task_id,
             'status': 'processing',
             'message': '任务已提交处理'
         })
         
     except Exception as e:
+        tasks.pop(task_id, None)
+        admission.release(task_id)
+        metrics.inc('requests_rejected')
         error_msg = f'无效的图像数据: {str(e)}'
         logger.error(error_msg)
-        return jsonify({'error': error_msg}), 400
+        return JSONResponse({'error': error_msg}, status_code=400)
 
-@app.route('/result/<task_id>', methods=['GET'])
-def get_task_result(task_id):
-    """获取任务结果"""
-    task = tasks.get(task_id)
+@app.get('/result/{task_id}')
+async def get_task_result(task_id: str, request: Request):
+    """获取任务结果（?wait=<秒> 开启长轮询，任务结束后立即返回；等待期间不占用线程）"""
+    try:
+        wait = min(max(float(request.query_params.get('wait', 0)), 0.0), LONG_POLL_MAX_SECONDS)
+    except ValueError:
+        return JSONResponse({'error': '无效的 wait 参数'}, status_code=400)
+    
+    task = await tasks.wait(task_id, wait) if wait > 0 else tasks.get(task_id)
     
     if not task:
         logger.warning(f"无效的任务ID: {task_id}")
-        return jsonify({'error': '无效的任务ID'}), 404
-    
-    if task['status'] == 'processing':
-        return jsonify({
-            'task_id': task_id,
-            'status': 'processing',
-            'message': '任务处理中，请稍后查询'
-        })
+        return JSONResponse({'error': '无效的任务ID'}, status_code=404)
     
+    payload = task_payload(task_id, task)
     if task['status'] == 'error':
-        return jsonify({
-            'task_id': task_id,
-            'status': 'error',
-            'message': task['message']
-        }), 500
+        return JSONResponse(payload, status_code=500)
+    return JSONResponse(payload)
+
+@app.get('/events')
+async def task_events(request: Request):
+    """以 Server-Sent Events 推送任务结束事件
     
-    return jsonify({
-        'task_id': task_id,
-        'status': 'completed',
-        'result': task['result']
-    })
+    可通过 ?task_id=<id1>,<id2> 只订阅指定任务：已结束的任务会立即推送，
+    所有指定任务结束后服务端关闭连接。不指定时推送所有任务的结束事件。
+    """
+    task_ids = set(filter(None, request.query_params.get('task_id', '').split(',')))
+    
+    # 先订阅再检查已有状态，避免遗漏订阅前刚完成的任务
+    subscriber = events.subscribe()
+    pending = set(task_ids)
+    initial = []
+    for task_id in task_ids:
+        task = tasks.get(task_id)
+        if task is None:
+            initial.append({'task_id': task_id, 'status': 'error', 'message': '无效的任务ID'})
+        elif task['status'] != 'processing':
+            initial.append(task_payload(task_id, task))
+    
+    def format_event(payload):
+        return f"event: {payload['status']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    async def generate():
+        try:
+            yield ': connected\n\n'
+            for payload in initial:
+                pending.discard(payload['task_id'])
+                yield format_event(payload)
+            while not task_ids or pending:
+                try:
+                    payload = await asyncio.wait_for(subscriber.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                if task_ids:
+                    if payload['task_id'] not in pending:
+                        continue
+                    pending.discard(payload['task_id'])
+                yield format_event(payload)
+        finally:
+            events.unsubscribe(subscriber)
+    
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 视频/帧流检测配置（可通过环境变量覆盖）
+# STREAM_QUEUE_FRAMES: 已解码待推理的帧缓冲上限
+# STREAM_MAX_INFLIGHT: 单个流同时在推理中的最大帧数（限制端到端延迟）
+# STREAM_CHUNK_SIZE: 读取请求体的块大小（字节）
+STREAM_QUEUE_FRAMES = int(os.environ.get('YOLO_STREAM_QUEUE_FRAMES', '8'))
+STREAM_MAX_INFLIGHT = int(os.environ.get('YOLO_STREAM_MAX_INFLIGHT', str(BATCH_MAX_SIZE * 2)))
+STREAM_CHUNK_SIZE = 64 * 1024
+# 已接收未解码的请求体块缓冲上限（满时暂停接收，对上传方形成背压）
+STREAM_BODY_CHUNKS = 16
+
+def iter_mjpeg_frames(stream):
+    """从 MJPEG/JPEG 帧流中逐帧切分 JPEG 数据（按 SOI/EOI 标记切分，兼容 multipart/x-mixed-replace）"""
+    buffer = b''
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            if start < 0:
+                buffer = buffer[-1:]
+                break
+            end = buffer.find(b'\xff\xd9', start + 2)
+            if end < 0:
+                buffer = buffer[start:]
+                break
+            yield buffer[start:end + 2]
+            buffer = buffer[end + 2:]
 
-@app.route('/result_image/<filename>')
-def get_result_image(filename):
-    """返回结果图像"""
-    result_path = os.path.join(RESULTS_FOLDER, filename)
+def iter_video_frames(stream):
+    """将视频请求体写入临时文件后用 OpenCV 逐帧解码（VideoCapture 需要可随机访问的文件）"""
+    with tempfile.NamedTemporaryFile(suffix='.video') as tmp:
+        while True:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            tmp.write(chunk)
+        tmp.flush()
+        
+        cap = cv2.VideoCapture(tmp.name)
+        try:
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield frame, cap.get(cv2.CAP_PROP_POS_MSEC)
+        finally:
+            cap.release()
+
+class FrameReader:
+    """流水线读帧线程：解码、抽帧，并按策略写入有界帧队列
     
-    # 安全检查：防止路径遍历攻击
-    if not os.path.abspath(result_path).startswith(os.path.abspath(RESULTS_FOLDER)):
-        logger.warning(f"非法路径访问尝试: {filename}")
-        return jsonify({'error': '非法访问'}), 403
+    policy 为 'block' 时队列满则阻塞读取（对上传方形成背压，不丢帧）；
+    为 'drop' 时丢弃队列中最旧的帧，保证处理的始终是最新画面。
+    """
     
-    if not os.path.exists(result_path):
-        logger.error(f"图片不存在: {result_path}")
-        return jsonify({'error': '图片不存在'}), 404
+    def __init__(self, frames, stride, policy, queue_size):
+        self.frames = frames
+        self.stride = max(1, stride)
+        self.policy = policy
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stop = threading.Event()
+        self.decoded = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='frame-reader', daemon=True)
+        self.thread.start()
     
-    logger.info(f"返回图片: {result_path}")
-    return send_file(result_path, mimetype='image/jpeg')
+    def _put(self, item):
+        if self.policy == 'drop':
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def _run(self):
+        try:
+            for index, (frame, timestamp_ms) in enumerate(self.frames):
+                if self.stop.is_set():
+                    break
+                self.decoded += 1
+                if index % self.stride:
+                    continue
+                self._put((index, timestamp_ms, frame))
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"读帧出错: {self.error}")
+        finally:
+            # 结束标记不受丢帧策略影响
+            while not self.stop.is_set():
+                try:
+                    self.queue.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    if self.policy == 'drop':
+                        try:
+                            self.queue.get_nowait()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+
+def decode_jpeg_frames(stream):
+    """MJPEG 帧流解码为 (帧, 相对开始时间毫秒)"""
+    start = time.monotonic()
+    for jpeg in iter_mjpeg_frames(stream):
+        frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            yield frame, (time.monotonic() - start) * 1000
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """健康检查端点"""
+class RequestBodyReader:
+    """将异步接收的请求体桥接为同步的 read(size) 接口，供读帧线程使用
+    
+    pump 协程在事件循环中逐块接收请求体写入有界队列；客户端断开或调用 close() 后 read 返回空。
+    """
+    
+    def __init__(self, request, max_chunks=STREAM_BODY_CHUNKS):
+        self.request = request
+        self.chunks = queue.Queue(maxsize=max(1, max_chunks))
+        self.buffer = b''
+        self.eof = False
+        self.closed = False
+    
+    def _put(self, chunk):
+        while not self.closed:
+            try:
+                self.chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    async def pump(self):
+        loop = asyncio.get_running_loop()
+        try:
+            async for chunk in self.request.stream():
+                if self.closed:
+                    break
+                if not chunk:
+                    continue
+                try:
+                    self.chunks.put_nowait(chunk)
+                except queue.Full:
+                    # 读帧线程跟不上时在线程中等待队列空位，不阻塞事件循环
+                    await loop.run_in_executor(None, self._put, chunk)
+        except Exception as e:
+            logger.warning(f"请求体接收中断: {str(e)}")
+        finally:
+            # 结束标记，无论正常结束还是客户端断开
+            await loop.run_in_executor(None, self._put, b'')
+    
+    def read(self, size):
+        while not self.buffer and not self.eof:
+            try:
+                chunk = self.chunks.get(timeout=0.5)
+            except queue.Empty:
+                if self.closed:
+                    self.eof = True
+                continue
+            if not chunk:
+                self.eof = True
+            self.buffer = chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+    
+    def close(self):
+        self.closed = True
+
+class DuplexStreamingResponse(StreamingResponse):
+    """边接收请求体边发送的流式响应
+    
+    StreamingResponse 在发送期间会另起协程读取 receive 以检测断开，与仍在接收的请求体争用消息；
+    这里只发送响应，客户端断开由请求体的 pump 协程感知。发送中途出错（客户端断开）时同样执行 background。
+    """
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            if self.background is not None:
+                await self.background()
+
+def threadsafe_put(outputs):
+    """返回可在任意线程调用的函数，将条目投递到事件循环中的 asyncio 队列"""
+    return lambda item: event_loop.call_soon_threadsafe(outputs.put_nowait, item)
+
+@app.post('/detect_stream')
+async def detect_stream(request: Request):
+    """视频/帧流检测端点，以 NDJSON 逐帧返回检测结果
+    
+    请求体为视频文件（video/*）或 MJPEG 帧流（multipart/x-mixed-replace、image/jpeg 拼接流），
+    建议使用分块传输上传。参数放在查询串中：
+    - conf/iou/max_det: 与 /detect 相同
+    - stride: 每隔 stride 帧处理一帧（默认 1）
+    - policy: block（不丢帧，默认用于视频文件）或 drop（落后时丢弃旧帧，默认用于帧流）
+    - format/xyxy: 检测结果输出格式，与 /detect 相同
+    - priority: interactive（默认）或 bulk，与 /detect 相同
+    整个流占用一个准入名额，队列已满时返回 429。
+    """
+    content_type = request_content_type(request)
+    is_video = content_type.startswith('video/') or content_type == 'application/octet-stream'
+    params = request.query_params
+    try:
+        conf = float(params.get('conf', 0.1))
+        iou = float(params.get('iou', 0.1))
+        max_det = int(params.get('max_det', 10))
+        stride = int(params.get('stride', 1))
+        policy = params.get('policy', 'block' if is_video else 'drop')
+        if policy not in ('block', 'drop'):
+            raise ValueError('policy 仅支持 block 或 drop')
+        model_name = registry.resolve(params.get('model'))
+        output_format = parse_output_format(params)
+        priority_name = params.get('priority') or 'interactive'
+        if priority_name not in PRIORITY_CLASSES:
+            raise ValueError(f"priority 仅支持: {', '.join(PRIORITY_CLASSES)}")
+    except KeyError as e:
+        return JSONResponse({'error': f'未知模型: {e.args[0]}'}, status_code=400)
+    except ValueError as e:
+        return JSONResponse({'error': f'无效的参数: {str(e)}'}, status_code=400)
+    
+    # 整个流占用一个准入名额，流内的并发由在途帧数限制
+    stream_id = uuid.uuid4().hex
+    priority = PRIORITY_CLASSES[priority_name]
+    if not admission.try_acquire(stream_id, priority):
+        metrics.inc('requests_throttled')
+        return throttled_response(admission.retry_after())
+    scheduler = get_scheduler(model_name)
+    loop = asyncio.get_running_loop()
+    
+    # 请求体在事件循环中接收，解码与抽帧在读帧线程中进行
+    body = RequestBodyReader(request)
+    pump = asyncio.ensure_future(body.pump())
+    frames = iter_video_frames(body) if is_video else decode_jpeg_frames(body)
+    reader = FrameReader(frames, stride, policy, STREAM_QUEUE_FRAMES)
+    logger.info(f"帧流检测开始: {content_type}, stride={stride}, policy={policy}")
+    
+    # 推理结果由调度器回调投递到 outputs，在途帧数由信号量限制
+    outputs = asyncio.Queue()
+    put_output = threadsafe_put(outputs)
+    inflight = threading.Semaphore(max(1, STREAM_MAX_INFLIGHT))
+    
+    def dispatch():
+        submitted = 0
+        while not reader.stop.is_set():
+            try:
+                item = reader.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            while not inflight.acquire(timeout=0.5):
+                if reader.stop.is_set():
+                    return
+            index, timestamp_ms, frame = item
+            scheduler.submit(frame, conf, iou, max_det,
+                             lambda result, error, index=index, timestamp_ms=timestamp_ms:
+                             put_output((index, timestamp_ms, result, error)),
+                             priority)
+            submitted += 1
+        put_output(('end', submitted))
+    
+    dispatcher = threading.Thread(target=dispatch, name='frame-dispatcher', daemon=True)
+    dispatcher.start()
+    
+    def format_frame(index, timestamp_ms, result, error):
+        line = {'frame': index, 'timestamp_ms': round(timestamp_ms, 1)}
+        if error is not None:
+            line['error'] = f'处理失败: {str(error)}'
+        else:
+            line['detections'] = format_detections(filter_result(result, conf, iou, max_det), *output_format)
+        return json.dumps(line, ensure_ascii=False) + '\n'
+    
+    async def generate():
+        processed = 0
+        total = None
+        try:
+            while total is None or processed < total:
+                item = await outputs.get()
+                if item[0] == 'end':
+                    total = item[1]
+                    continue
+                
+                inflight.release()
+                processed += 1
+                # 过滤与序列化在线程池中进行，不阻塞事件循环
+                yield await loop.run_in_executor(executor, format_frame, *item)
+            
+            summary = {
+                'done': True,
+                'decoded': reader.decoded,
+                'processed': processed,
+                'dropped': reader.dropped
+            }
+            if reader.error:
+                summary['error'] = reader.error
+            yield json.dumps(summary, ensure_ascii=False) + '\n'
+            logger.info(f"帧流检测结束: 解码 {reader.decoded} 帧, 处理 {processed} 帧, 丢弃 {reader.dropped} 帧")
+        finally:
+            stop_stream()
+    
+    def stop_stream():
+        """客户端断开或处理结束时停止接收、读帧与派发，并释放准入名额（可重复调用）"""
+        reader.stop.set()
+        body.close()
+        pump.cancel()
+        admission.release(stream_id)
+    
+    # 响应开始发送前客户端即断开时生成器不会执行，由 background 兜底清理
+    return DuplexStreamingResponse(generate(), media_type='application/x-ndjson',
+                                   background=BackgroundTask(stop_stream))
+
+# 批量检测配置（可通过环境变量覆盖）
+# BATCH_REQUEST_MAX_IMAGES: 单个 /detect_batch 请求最多包含的图像数
+# BATCH_REQUEST_MAX_INFLIGHT: 单个批量请求同时解码/推理中的最大图像数（限制内存）
+# BATCH_REQUEST_MAX_JSON_MB: JSON 批量请求体的大小上限（MB）；JSON 需整体读入并解析，
+#                            内存与批量大小无关的只有 multipart 请求，大批量应使用 multipart
+BATCH_REQUEST_MAX_IMAGES = int(os.environ.get('YOLO_BATCH_REQUEST_MAX_IMAGES', '1000'))
+BATCH_REQUEST_MAX_INFLIGHT = int(os.environ.get('YOLO_BATCH_REQUEST_MAX_INFLIGHT', str(BATCH_MAX_SIZE * 2)))
+BATCH_REQUEST_MAX_JSON_MB = float(os.environ.get('YOLO_BATCH_REQUEST_MAX_JSON_MB', '64'))
+
+class RequestTooLarge(ValueError):
+    """请求体超过大小上限"""
+
+async def read_limited_body(request, max_bytes):
+    """读取请求体，超过 max_bytes 时立即停止接收并抛出 RequestTooLarge"""
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise RequestTooLarge(f'请求体超过 {max_bytes // (1024 * 1024)} MB 上限，大批量请使用 multipart 上传')
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise RequestTooLarge(f'请求体超过 {max_bytes // (1024 * 1024)} MB 上限，大批量请使用 multipart 上传')
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def parse_batch_json(body, query_params):
+    """解析 JSON 批量请求体，返回 (参数字典, 图像条目列表)"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if isinstance(data, list):
+        return query_params, data
+    if isinstance(data, dict) and isinstance(data.get('images'), list):
+        return data, data['images']
+    raise ValueError('请求需为 multipart 图像文件，或包含 images 数组的 JSON')
+
+async def read_batch_request(request):
+    """解析批量检测请求，返回 (参数字典, [(名称, 读取图像字节的函数)], 表单或 None)
+    
+    支持两种请求格式：
+    - multipart 表单: 每个文件字段一张图像（字段名任意），参数放在表单字段或查询串中
+    - JSON: {"images": [...], "conf": ...} 或直接为图像数组，数组元素为 base64 字符串
+      或 {"image_base64": ..., "name": ...}
+    图像在派发时才读取与解码；JSON 中已读取的 base64 字符串随即释放。JSON 请求体需整体读入解析，
+    大小受 BATCH_REQUEST_MAX_JSON_MB 限制（超出时抛出 RequestTooLarge）。
+    返回的表单需在请求结束后关闭（释放上传文件的临时存储）。
+    """
+    params = dict(request.query_params)
+    if request_content_type(request) == 'multipart/form-data':
+        form = await request.form(max_files=BATCH_REQUEST_MAX_IMAGES)
+        params.update({key: value for key, value in form.multi_items() if isinstance(value, str)})
+        # Starlette 将较大的上传文件暂存到磁盘，这里只保留文件对象
+        sources = [(image_file.filename or field, image_file.file.read)
+                   for field, image_file in form.multi_items() if not isinstance(image_file, str)]
+        return params, sources, form
+    
+    body = await read_limited_body(request, int(BATCH_REQUEST_MAX_JSON_MB * 1024 * 1024))
+    params, items = await asyncio.get_running_loop().run_in_executor(executor, parse_batch_json, body, params)
+    del body
+    
+    def load(index):
+        item, items[index] = items[index], None
+        base64_str = item['image_base64'] if isinstance(item, dict) else item
+        if 'base64,' in base64_str:
+            base64_str = base64_str.split('base64,')[-1]
+        return base64.b64decode(base64_str)
+    
+    sources = []
+    for index, item in enumerate(items):
+        name = item.get('name') if isinstance(item, dict) else None
+        sources.append((name or str(index), lambda index=index: load(index)))
+    return params, sources, None
+
+@app.post('/detect_batch')
+async def detect_batch(request: Request):
+    """批量检测端点：一个请求提交多张图像，合并进微批调度，以 NDJSON 按完成顺序逐张返回结果
+    
+    每行包含 index（请求中的序号）、name 以及 detections 或 error，最后一行为汇总。
+    参数与 /detect 相同（conf/iou/max_det/model/priority，priority 默认为 bulk）；
+    同时解码与推理中的图像数受 BATCH_REQUEST_MAX_INFLIGHT 限制。multipart 上传的文件由 Starlette
+    暂存到磁盘，内存占用与批量大小无关；JSON 请求体需整体解析，超过 BATCH_REQUEST_MAX_JSON_MB 时返回 413。
+    """
+    form = None
     try:
-        # 检查模型是否加载
-        if model is None:
-            return jsonify({'status': 'error', 'message': '模型未加载'}), 500
+        params, sources, form = await read_batch_request(request)
+        if not sources:
+            raise ValueError('No image provided')
+        if len(sources) > BATCH_REQUEST_MAX_IMAGES:
+            raise ValueError(f'单个请求最多 {BATCH_REQUEST_MAX_IMAGES} 张图像')
+        conf = float(params.get('conf', 0.1))
+        iou = float(params.get('iou', 0.1))
+        max_det = int(params.get('max_det', 10))
+        model_name = registry.resolve(params.get('model'))
+        output_format = parse_output_format(params)
+        priority_name = params.get('priority') or 'bulk'
+        if priority_name not in PRIORITY_CLASSES:
+            raise ValueError(f"priority 仅支持: {', '.join(PRIORITY_CLASSES)}")
+    except KeyError as e:
+        if form is not None:
+            await form.close()
+        return JSONResponse({'error': f'未知模型: {e.args[0]}'}, status_code=400)
+    except RequestTooLarge as e:
+        metrics.inc('requests_rejected')
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except Exception as e:
+        if form is not None:
+            await form.close()
+        metrics.inc('requests_rejected')
+        return JSONResponse({'error': f'无效的批量请求: {str(e)}'}, status_code=400)
+    
+    # 整个批量请求占用一个准入名额，请求内的并发由在途图像数限制
+    batch_id = uuid.uuid4().hex
+    if not admission.try_acquire(batch_id, PRIORITY_CLASSES[priority_name]):
+        if form is not None:
+            await form.close()
+        retry_after = admission.retry_after()
+        metrics.inc('requests_throttled')
+        return throttled_response(retry_after)
+    
+    scheduler = get_scheduler(model_name)
+    priority = PRIORITY_CLASSES[priority_name]
+    loop = asyncio.get_running_loop()
+    outputs = asyncio.Queue()
+    put_output = threadsafe_put(outputs)
+    inflight = threading.Semaphore(max(1, BATCH_REQUEST_MAX_INFLIGHT))
+    stop = threading.Event()
+    logger.info(f"批量检测开始: {batch_id}, {len(sources)} 张图像")
+    
+    def dispatch():
+        submitted = 0
+        try:
+            for index, (name, load) in enumerate(sources):
+                while not inflight.acquire(timeout=0.5):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                submitted += 1
+                try:
+                    img = decode_image(load())
+                except Exception as e:
+                    put_output((index, name, None, None, e, None))
+                    continue
+                
+                cache_key = None
+                if result_cache.enabled:
+                    cache_key, cached = lookup_result_cache(img, conf, iou, max_det, model_name, None, output_format)
+                    if cached is not None:
+                        metrics.inc('result_cache_hits')
+                        put_output((index, name, None, cached[0], None, None))
+                        continue
+                    metrics.inc('result_cache_misses')
+                
+                scheduler.submit(img, conf, iou, max_det,
+                                 lambda result, error, index=index, name=name, cache_key=cache_key:
+                                 put_output((index, name, result, None, error, cache_key)),
+                                 priority)
+        finally:
+            put_output(('end', submitted))
+    
+    dispatcher = threading.Thread(target=dispatch, name='batch-dispatcher', daemon=True)
+    dispatcher.start()
+    
+    def format_item(index, name, result, detections, error, cache_key):
+        """过滤、序列化并写入结果缓存，返回 (NDJSON 行, 是否失败)"""
+        line = {'index': index, 'name': name}
+        if error is None and result is not None:
+            try:
+                with metrics.timer('filter'):
+                    result = filter_result(result, conf, iou, max_det)
+                with metrics.timer('serialize'):
+                    detections = format_detections(result, *output_format)
+                if cache_key is not None:
+                    boxes_data = (result.boxes.data.cpu().numpy() if result.boxes is not None
+                                  else np.zeros((0, 6), np.float32))
+                    result_cache.put(cache_key, detections, boxes_data, result.names)
+            except Exception as e:
+                error = e
+        if error is not None:
+            line['error'] = f'处理失败: {str(error)}'
+        else:
+            line['detections'] = detections
+        return json.dumps(line, ensure_ascii=False) + '\n', error is not None
+    
+    async def generate():
+        processed = 0
+        failed = 0
+        total = None
+        try:
+            while total is None or processed < total:
+                item = await outputs.get()
+                if item[0] == 'end':
+                    total = item[1]
+                    continue
+                
+                inflight.release()
+                processed += 1
+                line, item_failed = await loop.run_in_executor(executor, format_item, *item)
+                failed += item_failed
+                yield line
+            
+            yield json.dumps({'done': True, 'total': processed, 'failed': failed}, ensure_ascii=False) + '\n'
+            metrics.inc('batch_request_images', processed)
+            logger.info(f"批量检测结束: {batch_id}, 处理 {processed} 张, 失败 {failed} 张")
+        finally:
+            # 客户端断开或处理结束时停止派发并释放准入名额
+            stop.set()
+            admission.release(batch_id)
+            if form is not None:
+                await form.close()
+    
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+@app.get('/result_image/{filename}')
+async def get_result_image(filename: str):
+    """返回结果图像（首次请求时在线程池中渲染并写入 LRU 缓存）"""
+    # 安全检查：只接受本服务生成的结果文件名
+    match = RESULT_IMAGE_PATTERN.fullmatch(filename)
+    if not match:
+        logger.warning(f"非法结果图像请求: {filename}")
+        return JSONResponse({'error': '非法访问'}, status_code=403)
+    
+    image_bytes = render_cache.get(filename)
+    metrics.inc('render_cache_hits' if image_bytes is not None else 'render_cache_misses')
+    if image_bytes is None:
+        # 任务已过期，或待渲染数据已因 RENDER_SOURCE_MB 被淘汰
+        render_source = render_sources.get(filename) if tasks.get(match.group(1)) else None
+        if render_source is None:
+            logger.error(f"图片不存在: {filename}")
+            return JSONResponse({'error': '图片不存在'}, status_code=404)
+        
+        try:
+            image_bytes = await asyncio.get_running_loop().run_in_executor(
+                executor, render_result_image, render_source)
+        except Exception as e:
+            error_msg = f'结果图像渲染失败: {str(e)}'
+            logger.error(error_msg)
+            return JSONResponse({'error': error_msg}, status_code=500)
+        render_cache.put(filename, image_bytes)
+    
+    logger.info(f"返回图片: {filename}")
+    return Response(image_bytes, media_type='image/jpeg')
+
+# 就绪检查配置（可通过环境变量覆盖）
+# DEEP_CHECK_INTERVAL: 深度检查（真实推理）结果的缓存时间（秒），期间重复请求直接返回缓存
+# DEEP_CHECK_TIMEOUT: 深度检查等待推理完成的超时时间（秒）
+DEEP_CHECK_INTERVAL = float(os.environ.get('YOLO_DEEP_CHECK_INTERVAL', '30'))
+DEEP_CHECK_TIMEOUT = float(os.environ.get('YOLO_DEEP_CHECK_TIMEOUT', '10'))
+
+deep_check_lock = asyncio.Lock()
+deep_check_cache = {'checked_at': None, 'result': None}
+
+async def run_deep_check():
+    """通过调度器执行一次真实推理；结果缓存 DEEP_CHECK_INTERVAL 秒，并发请求共享同一次检查"""
+    async with deep_check_lock:
+        checked_at = deep_check_cache['checked_at']
+        if checked_at is not None and time.monotonic() - checked_at < DEEP_CHECK_INTERVAL:
+            return deep_check_cache['result']
+        
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        
+        def on_done(result, error):
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(error))
+        
+        start = time.perf_counter()
+        get_scheduler(DEFAULT_MODEL).submit(PROBE_IMAGE, 0.5, 0.5, 1, on_done)
+        try:
+            error = await asyncio.wait_for(done, DEEP_CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            result = {'ok': False, 'message': f'推理超时 ({DEEP_CHECK_TIMEOUT} s)'}
+        else:
+            if error is not None:
+                result = {'ok': False, 'message': f'推理失败: {str(error)}'}
+            else:
+                result = {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+        
+        deep_check_cache['checked_at'] = time.monotonic()
+        deep_check_cache['result'] = result
+        return result
+
+def readiness_status():
+    """汇总默认模型的就绪状态：已加载、预热成功、调度协程存活，以及最近一次真实推理的信息"""
+    scheduler = get_scheduler(DEFAULT_MODEL)
+    if worker_pool is not None:
+        # 多进程模式：至少一个工作进程完成默认模型的加载与预热
+        ready_workers = worker_pool.ready_count
+        warmup = {'ok': ready_workers > 0, 'ready_workers': ready_workers, 'workers': WORKERS}
+        ready = ready_workers > 0 and scheduler.alive
+    else:
+        warmup = registry.stats[DEFAULT_MODEL]['warmup'] or {'ok': False, 'message': '模型未加载'}
+        ready = registry.is_loaded(DEFAULT_MODEL) and warmup['ok'] and scheduler.alive
+    last_inference = None
+    if scheduler.last_inference_time is not None:
+        last_inference = {
+            'timestamp': scheduler.last_inference_time,
+            'age_seconds': round(time.time() - scheduler.last_inference_time, 1),
+            'latency_ms': round(scheduler.last_latency_ms, 1),
+            'batch_size': scheduler.last_batch_size
+        }
+    return ready, {
+        'model': DEFAULT_MODEL,
+        'warmup': warmup,
+        'scheduler_alive': scheduler.alive,
+        'last_inference': last_inference,
+        'last_error': scheduler.last_error
+    }
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Prometheus 文本格式的指标：各阶段耗时直方图、队列深度、在途任务与吞吐计数"""
+    gauges = {
+        'scheduler_queue_depth': ('等待凑批推理的请求数（所有模型）',
+                                  sum(s.queue.qsize() for s in list(schedulers.values()))),
+        'models_loaded': ('当前常驻的模型数', len(registry.loaded)),
+        'executor_queue_depth': ('已提交未完成的后处理任务数（含执行中）', executor.pending),
+        'tasks_in_flight': ('已提交未结束的任务数', admission.in_flight),
+        'queue_max_depth': ('在途任务上限', QUEUE_MAX_DEPTH),
+        'task_store_size': ('任务存储中的任务数', len(tasks)),
+        'render_cache_bytes': ('结果图像缓存占用字节数', render_cache.size),
+        'render_source_bytes': ('待渲染数据（原始图像与检测框）占用字节数', render_sources.size),
+        'result_cache_bytes': ('检测结果内存缓存占用字节数（估算）', result_cache.size),
+        'result_cache_entries': ('检测结果内存缓存条目数', len(result_cache.entries)),
+    }
+    if worker_pool is not None:
+        worker_stats = worker_pool.stats()
+        gauges['workers_ready'] = ('就绪的模型工作进程数', sum(1 for w in worker_stats if w['ready']))
+        gauges['worker_in_flight_images'] = ('工作进程中正在推理的图像数（所有进程）',
+                                             sum(w['in_flight_images'] for w in worker_stats))
+        gauges['worker_restarts'] = ('模型工作进程累计重启次数', sum(w['restarts'] for w in worker_stats))
+    return Response(metrics.render(gauges), media_type='text/plain; version=0.0.4')
+
+@app.get('/livez')
+async def liveness_check():
+    """存活检查：进程能响应请求即可，不访问模型"""
+    return {'status': 'alive'}
+
+@app.get('/readyz')
+async def readiness_check(request: Request):
+    """就绪检查：基于启动预热与最近一次推理判断；?deep=1 时附加限频缓存的真实推理检查"""
+    ready, status = readiness_status()
+    if ready and parse_bool(request.query_params.get('deep'), False):
+        status['deep_check'] = await run_deep_check()
+        ready = status['deep_check']['ok']
+    
+    status['status'] = 'ready' if ready else 'not_ready'
+    return JSONResponse(status, status_code=200 if ready else 503)
+
+@app.get('/health')
+async def health_check():
+    """健康检查端点（不执行前向推理；状态码与原有约定一致，未就绪时仍返回 200，
+    以 status/readiness 字段表示，按就绪状态摘流请使用 /readyz）"""
+    try:
+        # 检查默认模型是否加载（多进程模式下模型在工作进程中）
+        if worker_pool is None and not registry.is_loaded(DEFAULT_MODEL):
+            return JSONResponse({'status': 'error', 'message': '模型未加载'}, status_code=500)
         
         # 检查GPU状态
         gpu_status = {
@@ -218,25 +2261,83 @@ def health_check():
             'device_name': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
         }
         
-        # 简单模型检查（尝试空预测）
-        test_input = torch.zeros(1, 3, 640, 640).to(device)
-        with torch.no_grad():
-            model(test_input)
+        ready, readiness = readiness_status()
         
-        return jsonify({
-            'status': 'healthy',
+        return JSONResponse({
+            'status': 'healthy' if ready else 'unhealthy',
             'model': 'loaded',
             'device': device,
-            'gpu': gpu_status
-        })
+            'gpu': gpu_status,
+            'readiness': readiness,
+            'models': registry.model_stats(),
+            'workers': worker_pool.stats() if worker_pool is not None else None,
+            'backend': {
+                'name': BACKEND,
+                'imgsz': IMGSZ
+            },
+            'batch': {
+                'max_batch_size': get_scheduler(DEFAULT_MODEL).max_batch_size,
+                'max_wait_ms': BATCH_MAX_WAIT_MS
+            },
+            'tasks': {
+                'count': len(tasks),
+                'max_size': TASK_MAX_SIZE,
+                'ttl_seconds': TASK_TTL_SECONDS
+            },
+            'queue': {
+                'in_flight': admission.in_flight,
+                'max_depth': QUEUE_MAX_DEPTH,
+                'retry_after_estimate': admission.retry_after()
+            },
+            'result_cache': result_cache.stats()
+        }, status_code=200)
     
     except Exception as e:
         error_msg = f'健康检查失败: {str(e)}'
         logger.error(error_msg)
-        return jsonify({
+        return JSONResponse({
             'status': 'error',
             'message': error_msg
-        }), 500
+        }, status_code=500)
+
+@app.get('/models')
+async def list_models():
+    """列出已注册模型及其加载状态与统计"""
+    return {'default': DEFAULT_MODEL, 'models': registry.model_stats()}
+
+@app.get('/workers')
+async def list_workers():
+    """列出模型工作进程及其负载（仅多进程模式）"""
+    if worker_pool is None:
+        return {'workers': [], 'message': '未启用多进程模式 (YOLO_WORKERS=0)'}
+    return {'workers': worker_pool.stats()}
+
+# 启动时加载并预热默认模型（仅执行一次，此后健康检查不再做前向推理）
+# 多进程模式下由各工作进程各自加载并预热
+if worker_pool is not None:
+    if BACKEND != 'torch':
+        # 启动工作进程前在本进程中导出默认模型，各工作进程直接复用导出产物
+        try:
+            backends.export_model(registry.paths[DEFAULT_MODEL], BACKEND, IMGSZ)
+        except Exception as e:
+            logger.error(f"模型导出失败: {str(e)}")
+    worker_pool.start()
+    logger.info(f"模型工作进程数: {WORKERS}")
+else:
+    try:
+        registry.get(DEFAULT_MODEL)
+    except Exception as e:
+        logger.error(f"模型加载失败: {str(e)}")
+
+logger.info(f"推理后端: {BACKEND}, 输入尺寸 {IMGSZ}")
+
+@app.on_event('startup')
+async def start_schedulers():
+    """记录服务事件循环，并创建默认模型的微批调度器（其他模型的调度器在首次请求时创建）"""
+    global event_loop
+    event_loop = asyncio.get_running_loop()
+    scheduler = get_scheduler(DEFAULT_MODEL)
+    logger.info(f"微批调度: 最大批大小 {scheduler.max_batch_size}, 最长等待 {BATCH_MAX_WAIT_MS} ms")
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    uvicorn.run(app, host='0.0.0.0', port=5000)
\ No newline at end of file